@@ -0,0 +1,1171 @@
+'''Benchmarks for the tool layer and the upstream call path against a local RapidAPI stand-in.
+
+Usage: python bench.py [suite|pool|resolver|geo|projection|scheduler|resilience|workers|prefetch|stream|resort|cars|warm|revalidate]
+                       [--calls N] [--latency MS]
+                       [--jitter MS] [--error-rate P] [--fixtures DIR] [--concurrency 1,8,64]
+                       [--workloads cold,warm,bulk,burst] [--out FILE] [--compare FILE]
+                       [--workers 1,4] [--backends memory,sqlite,redis] [--agents N] [--rate PER_SECOND]
+                       [--depths 0,1,3,5] [--think MS] [--records 100,10000,100000] [--radius MILES] [--locations N]
+                       [--seconds S] [--queries N] [--top N] [--ttl S]
+
+`suite` drives the MCP tools through an in-memory FastMCP client and saves a JSON report.
+`workers` runs `python server.py PORT` and drives it over streamable HTTP; `redis` uses a local protocol stand-in.
+'''
+import argparse
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+# Synthetic download datasets served by the stand-in: path -> (envelope, collection, record prefix, record count).
+DOWNLOADS = {
+    '/v2/hotels/downloadHotels': ('getSharedBOF2.Downloads.Hotel.Hotels', 'hotels', 'hotel', 100000),
+    '/v2/flight/downloadAirports': ('getSharedBOF2.Downloads.Air.Airports', 'airports', 'airport', 3000),
+    '/v2/cars/downloadCities': ('getSharedBOF2.Downloads.Car.Cities', 'cities', 'city', 5000),
+    '/v2/cars/downloadLocations': ('getSharedBOF2.Downloads.Car.Locations', 'locations', 'location', 5000),
+    '/v2/cars/downloadCompanies': ('getSharedBOF2.Downloads.Car.Companies', 'companies', 'company', 40),
+    '/v2/hotels/downloadPropertyTypes': ('getSharedBOF2.Downloads.Hotel.PropertyTypes', 'property_types', 'property_type', 60),
+}
+
+
+def company_code(i):
+    return f'{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}'
+
+
+class Fixtures:
+    '''Response bodies per endpoint path: JSON files from a fixtures directory, else deterministic synthetic ones
+
+    A fixture file is named after its path with `/` as `_`, e.g. `v1_hotels_search.json`, and is served verbatim.
+    Synthetic download endpoints page through their records by resume_key and limit.
+    '''
+
+    def __init__(self, directory=None, seed=1):
+        self.files = {}
+        if directory:
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    with open(os.path.join(directory, name), 'rb') as f:
+                        self.files['/' + name[:-5].replace('_', '/')] = f.read()
+        self.rng = random.Random(seed)
+        self.records = {}
+        self.encoded = {}
+
+    def _record(self, prefix, i):
+        rng = self.rng
+        lat, lon = rng.uniform(25, 49), rng.uniform(-124, -67)
+        if prefix == 'hotel':
+            return {'hotelid_ppn': str(700000 + i), 'hotel_name': f'Hotel {i}', 'star_rating': rng.choice([2, 3, 3.5, 4, 5]),
+                    'review_rating': round(rng.uniform(5, 10), 1), 'latitude': lat, 'longitude': lon,
+                    'address': f'{i} Main St', 'cityid_ppn': str(1000000 + i % 5000), 'country_code': 'US'}
+        if prefix == 'airport':
+            return {'iata': f'{chr(65 + i // 676 % 26)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}',
+                    'airport': f'Airport {i}', 'latitude': lat, 'longitude': lon, 'cityid_ppn': str(1000000 + i)}
+        if prefix == 'location':
+            return {'location_id': str(1365100000 + i), 'location_name': f'Rental Location {i}', 'latitude': lat, 'longitude': lon,
+                    'company_code': company_code(i % 40), 'state_code': 'CA', 'country_code': 'US'}
+        if prefix == 'company':
+            return {'company_code': company_code(i), 'company_name': f'Company {i}'}
+        return {f'{prefix}id_ppn': str(1000000 + i), prefix: f'{prefix.title()} {i}', 'latitude': lat, 'longitude': lon,
+                'state_code': 'CA', 'country_code': 'US'}
+
+    def _download(self, path, query):
+        envelope, collection, prefix, count = DOWNLOADS[path]
+        offset = int(query.get('resume_key', ['0'])[0] or 0)
+        limit = int(float(query.get('limit', ['100'])[0]))
+        key = (path, offset, limit)
+        if key not in self.encoded:
+            if path not in self.records:
+                self.records[path] = [self._record(prefix, i) for i in range(count)]
+            records = self.records[path]
+            page = {f'{prefix}_{i}': records[i] for i in range(offset, min(offset + limit, count))}
+            resume = str(offset + limit) if offset + limit < count else None
+            self.encoded[key] = json.dumps({envelope: {'results': {'status': 'Success', collection: page,
+                                                                   'resume_key': resume}}}).encode()
+        return self.encoded[key]
+
+    def _search(self, path, query):
+        seed = hash((path, tuple(sorted((k, tuple(v)) for k, v in query.items())))) & 0xffff
+        rng = random.Random(seed)
+        if path == '/v1/hotels/search':
+            return synthetic_hotel_search(query)
+        if path == '/v2/hotels/expressResults':
+            return synthetic_express_search(query)
+        if path == '/v2/flight/roundTrip':
+            sid = query.get('sid', [''])[0]
+            return {'getAirFlightRoundTrip': {'results': {'status': 'Success', 'result': {'itinerary_data': {
+                f'itinerary_{n}': {'ppn_bundle': f'{sid}-{n}', 'price_details': {'display_total_fare': round(rng.uniform(80, 900), 2)}}
+                for n in range(20)}}}}}
+        if path == '/v2/flight/contract':
+            bundle = query.get('ppn_bundle', [''])[0]
+            return {'getAirFlightContract': {'results': {'status': 'Success', 'result': {'itinerary_data': {
+                'ppn_seat_bundle': f'seats-{bundle}', 'price_details': {'display_total_fare': round(rng.uniform(80, 900), 2)}}}}}}
+        if path == '/v2/flight/seatMap':
+            return {'getAirFlightSeatMap': {'results': {'status': 'Success', 'result': {'seat_map': [
+                {'row': row, 'seats': [{'seat': f'{row}{letter}', 'available': rng.random() < 0.6} for letter in 'ABCDEF']}
+                for row in range(1, 31)]}}}}
+        if path == '/v1/cars-rentals/search':
+            location = _first(query, 'location_pickup')
+            return {'vehicleRates': {f'{location}-{n}': {
+                'partnerInfo': {'partnerCode': company_code(rng.randrange(40))}, 'pickupLocationId': location,
+                'vehicleInfo': {'vehicleCode': rng.choice(['ECAR', 'CCAR', 'ICAR', 'SCAR', 'FCAR', 'PVAR']), 'seats': 5},
+                'rates': {'USD': {'totalAllInclusivePrice': round(rng.uniform(60, 600), 2)}}} for n in range(rng.randint(8, 20))}}
+        if path == '/v1/hotels/details':
+            hotel_id = _first(query, 'hotel_id')
+            return {'id': hotel_id, 'name': f'Hotel {hotel_id}', 'starRating': rng.choice([2, 3, 3.5, 4, 5]),
+                    'description': ' '.join(rng.choice(['quiet', 'central', 'renovated', 'rooms', 'pool', 'breakfast',
+                                                        'downtown', 'spacious', 'view', 'staff']) for _ in range(300)),
+                    'amenities': [{'code': code, 'name': f'Amenity {code}'} for code in rng.sample(range(200), 40)],
+                    'images': [{'imageHDUrl': f'https://mobileimg.priceline.com/htlimg/{hotel_id}/{n}.jpg'} for n in range(40)],
+                    'reviews': [{'overallScore': round(rng.uniform(5, 10), 1), 'reviewText': 'Nice stay, would book again. ' * 8}
+                                for _ in range(10)]}
+        if path == '/v2/hotels/photos':
+            return {'getHotelPhotos': {'results': {'status': 'Success', 'hotel_photo_data': {
+                f'hotel_photo_{hotel_id}': {'hotel_id': hotel_id, 'photo_data': [
+                    f'https://mobileimg.priceline.com/htlimg/{hotel_id}/{n}.jpg' for n in range(30)]}
+                for hotel_id in _first(query, 'hotel_ids').split(',')}}}}
+        if path == '/v1/flights/search':
+            return {'pricedItinerary': [{'id': str(n), 'pricingInfo': {'totalFare': round(rng.uniform(80, 900), 2), 'currencyCode': 'USD'},
+                                         'slice': [{'uniqueSliceId': n, 'segment': [{'flightNumber': rng.randrange(9999)}]}]}
+                                        for n in range(40)]}
+        return None
+
+    def body(self, path, query) -> bytes:
+        if path in self.files:
+            return self.files[path]
+        if path in DOWNLOADS:
+            return self._download(path, query)
+        body = self._search(path, query)
+        if body is None:
+            body = {'path': path, 'query': query, 'results': [{'id': i} for i in range(20)]}
+        return json.dumps(body).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''Stand-in for priceline-com-provider.p.rapidapi.com serving Fixtures with injected latency and errors'''
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.002
+    jitter = 0.0
+    error_rate = 0.0
+    tail_rate = 0.0
+    tail_latency = 0.5
+    compress = False  # gzip bodies for clients that accept it
+    validators = False  # send ETag/Last-Modified and answer a matching conditional GET with 304
+    fixtures = None
+
+    def do_GET(self):
+        if random.random() < self.tail_rate:
+            time.sleep(self.tail_latency)
+        else:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        url = urlsplit(self.path)
+        body = self.fixtures.body(url.path, parse_qs(url.query))
+        headers = {'Content-Type': 'application/json'}
+        if self.validators:
+            headers['ETag'] = f'"{zlib.crc32(body):08x}-{len(body):x}"'
+            headers['Last-Modified'] = 'Thu, 01 Oct 2026 00:00:00 GMT'
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                self.send_response(304)
+                self.send_header('ETag', headers['ETag'])
+                self.end_headers()
+                return
+        if self.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, 6, mtime=0)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        pass  # clients under test hang up on purpose (cancelled hedges, deadlines)
+
+
+def _serve(conn, latency, behaviour):
+    StandInHandler.latency = latency
+    StandInHandler.fixtures = Fixtures(behaviour.pop('fixtures', None))
+    for name, value in behaviour.items():
+        setattr(StandInHandler, name, value)
+    httpd = StandInServer(('127.0.0.1', 0), StandInHandler)
+    conn.send(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+def start_stand_in(latency=0.002, **behaviour):
+    '''Run the stand-in in its own process so it does not share the GIL with the client under test
+
+    `behaviour` overrides StandInHandler attributes such as jitter, error_rate, tail_rate, tail_latency,
+    compress and validators; `fixtures` names a directory of recorded responses.
+    '''
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_serve, args=(child, latency, behaviour), daemon=True)
+    proc.start()
+    return proc, f'http://127.0.0.1:{parent.recv()}'
+
+
+class RespHandler(StreamRequestHandler):
+    '''Stand-in for a Redis server: just the commands the shared state uses, over the real wire protocol'''
+    disable_nagle_algorithm = True
+    store = {}  # key -> (value, expires_at or None)
+    lock = threading.Lock()
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                size = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(size + 2)[:-2])
+            with self.lock:
+                self.wfile.write(self.reply(args[0].upper(), args[1:], time.monotonic()))
+
+    def live(self, key, now):
+        entry = self.store.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self.store[key]
+            return None
+        return entry
+
+    def reply(self, command, args, now):
+        if command == b'PING':
+            return b'+PONG\r\n'
+        if command == b'GET':
+            entry = self.live(args[0], now)
+            return b'$-1\r\n' if entry is None else b'$%d\r\n%s\r\n' % (len(entry[0]), entry[0])
+        if command == b'SET':
+            options = [a.upper() for a in args[2:]]
+            expires_at = None
+            if b'PX' in options:
+                expires_at = now + int(args[2 + options.index(b'PX') + 1]) / 1000
+            elif b'EX' in options:
+                expires_at = now + int(args[2 + options.index(b'EX') + 1])
+            self.store[args[0]] = (args[1], expires_at)
+            return b'+OK\r\n'
+        if command == b'INCR':
+            entry = self.live(args[0], now)
+            value = int(entry[0]) + 1 if entry else 1
+            self.store[args[0]] = (b'%d' % value, entry[1] if entry else None)
+            return b':%d\r\n' % value
+        if command == b'PEXPIRE':
+            entry = self.live(args[0], now)
+            if entry is None:
+                return b':0\r\n'
+            self.store[args[0]] = (entry[0], now + int(args[1]) / 1000)
+            return b':1\r\n'
+        if command == b'DEL':
+            return b':%d\r\n' % sum(self.store.pop(key, None) is not None for key in args)
+        return b'-ERR unknown command\r\n'
+
+
+def _serve_resp(conn):
+    server = ThreadingTCPServer(('127.0.0.1', 0), RespHandler)
+    server.daemon_threads = True
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+def start_resp_stand_in():
+    '''Run the Redis stand-in in its own process; returns (process, redis:// url)'''
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_serve_resp, args=(child,), daemon=True)
+    proc.start()
+    return proc, f'redis://127.0.0.1:{parent.recv()}/0'
+
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    print(f'{name:<28} n={len(samples):<5} mean={statistics.mean(samples) * 1000:9.3f}ms '
+          f'p50={p(0.50):9.3f}ms p99={p(0.99):9.3f}ms total={sum(samples):6.2f}s')
+
+
+def burst(call, calls):
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def aburst(call, calls, concurrency):
+    '''Run `calls` async calls with at most `concurrency` in flight; returns (samples, wall time)'''
+    gate = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i):
+        async with gate:
+            start = time.perf_counter()
+            await call(i)
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return samples, time.perf_counter() - start
+
+
+def bench_pool(server, url, args):
+    '''Unpooled requests.get per call versus the shared pooled client, sequential and concurrent'''
+    import requests
+
+    def unpooled(i):
+        requests.get(url + '/v1/hotels/locations', headers={'x-rapidapi-host': server.api_host},
+                     params={'name': f'city{i}', 'search_type': 'ALL'}).json()
+
+    async def pooled(i):
+        await server._get(server.api_url + '/v1/hotels/locations', {'name': f'city{i}', 'search_type': 'ALL'})
+
+    summarize('requests.get per call', burst(unpooled, args.calls))
+    samples, _ = asyncio.run(aburst(pooled, args.calls, 1))
+    summarize('shared pooled client', samples)
+    for concurrency in (16, 128):
+        samples, wall = asyncio.run(aburst(pooled, args.calls, concurrency))
+        summarize(f'async x{concurrency}', samples)
+        print(f'{"":<28} throughput={args.calls / wall:8.1f} calls/s')
+
+
+PLACE_PREFIXES = ['new', 'san', 'port', 'saint', 'fort', 'lake', 'north', 'west', 'east', 'south']
+SYLLABLES = ['ka', 'lo', 'mi', 'ran', 'dor', 'vel', 'sa', 'tur', 'ben', 'ga', 'lis', 'mon', 'ro', 'zen', 'qui',
+             'to', 'bar', 'cel', 'na', 'ham', 'burg', 'ton', 'ville', 'field', 'ford', 'ber', 'lin', 'pa', 'ris',
+             'chi', 'ca', 'go', 'hou', 'stun', 'phoe', 'nix', 'dal', 'las', 'aus', 'jack', 'son', 'col', 'um',
+             'bus', 'char', 'lotte', 'in', 'dia', 'se', 'at', 'tle', 'den', 'ver', 'bos', 'el', 'nash', 'det',
+             'roit', 'okla', 'ho', 'ma', 'port', 'land', 'mem', 'phis', 'lou', 'is', 'mil', 'wau', 'kee', 'alb',
+             'uq', 'tuc', 'fres', 'sac', 'kan', 'mesa', 'at', 'lan', 'om', 'ha', 'rale', 'igh', 'mia', 'oak',
+             'min', 'neap', 'tul', 'wich', 'ar', 'ling', 'tam', 'pa', 'au', 'ro', 'ana', 'hei', 'hon', 'olu']
+
+
+def synthetic_places(count, seed=7):
+    '''Deterministic airport and city records shaped like the download_* datasets'''
+    rng = random.Random(seed)
+    airports, cities = [], []
+    for i in range(count):
+        words = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))) for _ in range(rng.randint(1, 2))]
+        if rng.random() < 0.2:
+            words.insert(0, rng.choice(PLACE_PREFIXES))
+        name = ' '.join(words).title()
+        cities.append({'cityid_ppn': str(1000000 + i), 'city': name})
+        if i % 3 == 0:
+            code = ''.join(chr(65 + rng.randrange(26)) for _ in range(3))
+            airports.append({'iata': code, 'airport': f'{name} International'})
+    return {'airports': airports, 'cities': cities}
+
+
+def bench_resolver(server, url, args):
+    '''Local prefix/fuzzy resolution versus the search_flights_locations network path'''
+    places = synthetic_places(30000)
+    start = time.perf_counter()
+    index = server.LocationIndex.from_records(places)
+    print(f'index build: {len(index.entries)} entries in {time.perf_counter() - start:.2f}s')
+    rng = random.Random(11)
+    queries = []
+    for _ in range(args.calls):
+        name = rng.choice(places['cities'])['city'].lower()
+        queries.append(name[:rng.randint(3, len(name))])
+    summarize('local prefix', burst(lambda i: index.search(queries[i]), args.calls))
+    typos = [q[:-2] + q[-1] + q[-2] if len(q) > 4 else q for q in queries]
+    summarize('local fuzzy (typos)', burst(lambda i: index.search(typos[i] + 'x'), args.calls))
+
+    async def network(i):
+        await server._get(server.api_url + '/v1/flights/locations', {'name': queries[i]}, bypass_cache=True)
+
+    samples, _ = asyncio.run(aburst(network, min(args.calls, 200), 1))
+    summarize('network search_flights_locations', samples)
+
+
+def bench_geo(server, url, args):
+    '''Hotels within 3 miles of many points: one batched GeoIndex query versus one upstream call per point'''
+    rng = random.Random(3)
+    count = 200000
+    lat = [rng.uniform(25, 49) for _ in range(count)]
+    lon = [rng.uniform(-124, -67) for _ in range(count)]
+    start = time.perf_counter()
+    index = server.GeoIndex(['HOTEL'] * count, [str(i) for i in range(count)], [None] * count, lat, lon)
+    print(f'index build: {count} hotels in {time.perf_counter() - start:.2f}s')
+    points = [(rng.uniform(25, 49), rng.uniform(-124, -67)) for _ in range(args.calls)]
+    summarize(f'within 3mi x{args.calls} batched', burst(lambda i: index.within(points, 3.0), 5))
+    summarize(f'10-nearest x{args.calls} batched', burst(lambda i: index.nearest(points, 10), 5))
+
+    async def network(i):
+        lat, lon = points[i]
+        await server._get(server.api_url + '/v1/hotels/locations-by-geo', {'latitude': lat, 'longitude': lon})
+
+    samples, wall = asyncio.run(aburst(network, args.calls, 16))
+    summarize('network per point, x16', samples)
+    print(f'{"":<28} wall={wall:.2f}s')
+
+
+def synthetic_express_results(hotels, seed=5):
+    '''An expressResults-shaped body with the room, amenity and image bulk of the real endpoint'''
+    rng = random.Random(seed)
+    data = {}
+    for i in range(hotels):
+        data[f'hotel_{i}'] = {
+            'id': str(700000 + i), 'name': f'Hotel {i}', 'star_rating': rng.choice([2, 2.5, 3, 3.5, 4, 5]),
+            'review_rating': round(rng.uniform(5, 10), 1),
+            'address': {'address_line_one': f'{i} Main St', 'city_name': 'Springfield', 'country_code': 'US'},
+            'geo': {'latitude': rng.uniform(25, 49), 'longitude': rng.uniform(-124, -67)},
+            'description': ' '.join(rng.choice(SYLLABLES) for _ in range(120)),
+            'amenity_data': [{'code': f'A{a}', 'name': f'Amenity {a}', 'free': a % 2 == 0} for a in range(30)],
+            'image_data': [{'url': f'https://img.example.com/{i}/{n}.jpg', 'width': 1024, 'height': 768} for n in range(12)],
+            'room_data': {f'room_{r}': {'title': f'Room {r}', 'rate_data': [{
+                'ppn_bundle': f'HTL,{i},{r},{n}' * 8, 'price_details': {
+                    'display_price': rng.uniform(60, 400), 'display_total': rng.uniform(60, 900), 'display_currency': 'USD',
+                    'taxes': [{'code': 'T', 'amount': 9.5}] * 3}, 'cancellation_details': [{'text': 'No refund ' * 20}]}
+                for n in range(3)]} for r in range(4)},
+        }
+    return {'getHotelExpress.Results': {'results': {'status': 'Success', 'hotel_data': data}}}
+
+
+AMENITIES = ('FINTRNT', 'FBRKFST', 'FPRKING', 'POOL', 'FITSPA', 'PETALLOW', 'AIRSHUTTLE', 'RESTRNT')
+# Params that only sort, filter, page or cut a hotel search: the rest seeds the location's hotels.
+HOTEL_VIEWS = ('sort_order', 'star_rating_ids', 'amenities_ids', 'page_number')
+EXPRESS_VIEWS = ('sort_by', 'limit')
+
+
+def _first(query, name):
+    return query.get(name, [''])[0]
+
+
+def _base_seed(query, views):
+    return hash(tuple(sorted((k, tuple(v)) for k, v in query.items() if k not in views))) & 0xffff
+
+
+def _express_price(hotel):
+    return min(rate['price_details']['display_price'] for room in hotel['room_data'].values() for rate in room['rate_data'])
+
+
+def synthetic_hotel_search(query, page_size=50):
+    '''A /v1/hotels/search page: the location's hotels filtered by stars and amenities, sorted and paged'''
+    seed = _base_seed(query, HOTEL_VIEWS)
+    rng = random.Random(seed)
+    hotels = [{'hotelId': str(700000 + seed * 200 + n), 'name': f'Hotel {n}', 'starRating': rng.choice([2, 2.5, 3, 3.5, 4, 4.5, 5]),
+               'overallGuestRating': round(rng.uniform(5, 10), 1), 'proximity': round(rng.uniform(0.1, 15), 2),
+               'ratesSummary': {'minPrice': f'{rng.uniform(50, 500):.2f}', 'minCurrencyCode': 'USD'},
+               'hotelFeatures': {'hotelAmenityCodes': rng.sample(AMENITIES, rng.randint(1, 6))}}
+              for n in range(rng.randint(20, 120))]
+    stars = {float(s) for s in _first(query, 'star_rating_ids').split(',') if s}
+    amenities = {a for a in _first(query, 'amenities_ids').split(',') if a}
+    hotels = [h for h in hotels if (not stars or h['starRating'] in stars) and amenities <= set(h['hotelFeatures']['hotelAmenityCodes'])]
+    sort = {'PRICE': (lambda h: float(h['ratesSummary']['minPrice']), False), 'STAR': (lambda h: h['starRating'], True),
+            'PROXIMITY': (lambda h: h['proximity'], False)}.get(_first(query, 'sort_order'))
+    if sort:
+        hotels.sort(key=sort[0], reverse=sort[1])
+    page = int(float(_first(query, 'page_number') or 0))
+    return {'hotels': hotels[page * page_size:(page + 1) * page_size], 'totalSize': len(hotels)}
+
+
+def synthetic_express_search(query):
+    '''An expressResults body for the query's location, sorted by sort_by and cut to limit'''
+    seed = _base_seed(query, EXPRESS_VIEWS)
+    body = synthetic_express_results(random.Random(seed).randint(20, 80), seed)
+    results = body['getHotelExpress.Results']['results']
+    hotels = list(results['hotel_data'].values())
+    sort = {'gs': (lambda h: h['review_rating'], True), 'sr': (lambda h: h['star_rating'], True),
+            'lp': (_express_price, False), 'hp': (_express_price, True)}.get(_first(query, 'sort_by') or 'gs')
+    if sort:
+        hotels.sort(key=sort[0], reverse=sort[1])
+    limit = int(float(_first(query, 'limit') or 100))
+    results['hotel_data'] = {f'hotel_{i}': hotel for i, hotel in enumerate(hotels[:limit])}
+    return body
+
+
+def bench_projection(server, url, args):
+    '''Serialized bytes and json.dumps time for a large expressResults body: full, slim preset, explicit fields'''
+    body = synthetic_express_results(200)
+    variants = {
+        'full': lambda: body,
+        'preset=slim': lambda: server._shape('/v2/hotels/expressResults', body, None, 'slim'),
+        'fields=name,display_price': lambda: server._shape('/v2/hotels/expressResults', body, '..name,..display_price', 'full'),
+    }
+    calls = min(args.calls, 50)
+    for name, shape in variants.items():
+        shaped = shape()
+        print(f'{name}: {len(json.dumps(shaped).encode()) / 1024:.0f} KiB')
+        summarize('  project', burst(lambda i: shape(), calls))
+        summarize('  json.dumps', burst(lambda i: json.dumps(shaped), calls))
+
+
+def bench_scheduler(server, url, args):
+    '''Interactive calls arriving during a bulk crawl, with priority classes versus one FIFO class'''
+    bulk_calls, interactive_calls = 400, 40
+
+    async def run(interactive_priority):
+        server.scheduler = server.Scheduler(['key-a:100:10', 'key-b:100:10'])
+        samples = []
+
+        async def bulk(i):
+            await server._fetch('/v2/hotels/downloadHotels', {'resume_key': i}, priority='bulk')
+
+        async def interactive(i):
+            await asyncio.sleep(0.05 * i)
+            start = time.perf_counter()
+            await server._fetch('/v1/hotels/search', {'location_id': i}, priority=interactive_priority)
+            samples.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(bulk(i) for i in range(bulk_calls)), *(interactive(i) for i in range(interactive_calls)))
+        return samples, time.perf_counter() - start
+
+    for label, priority in (('interactive, FIFO with bulk', 'bulk'), ('interactive, prioritized', 'interactive')):
+        samples, wall = asyncio.run(run(priority))
+        summarize(label, samples)
+        print(f'{"":<28} wall={wall:.2f}s for {bulk_calls} bulk + {interactive_calls} interactive at 2 keys x 100/s')
+    print(json.dumps(server.scheduler.snapshot()['waits']))
+
+
+def bench_resilience(server, url, args):
+    '''Success rate under 503s with and without retries, hedging against a slow tail, and a dead upstream'''
+    calls = min(args.calls, 300)
+
+    async def run(path):
+        failures, samples = 0, []
+
+        async def one(i):
+            nonlocal failures
+            start = time.perf_counter()
+            try:
+                response = await server._fetch(path, {'location_id': i})
+                failures += not response.is_success
+            except server.httpx.HTTPError:
+                failures += 1
+            samples.append(time.perf_counter() - start)
+
+        gate = asyncio.Semaphore(8)
+
+        async def gated(i):
+            async with gate:
+                await one(i)
+
+        await asyncio.gather(*(gated(i) for i in range(calls)))
+        return samples, failures
+
+    def with_stand_in(**behaviour):
+        proc, server.api_url = start_stand_in(args.latency / 1000, **behaviour)
+        server.breaker = server.Breaker(10 ** 6, server.breaker_cooldown)
+        server.latencies.clear()
+        return proc
+
+    proc = with_stand_in(error_rate=0.2)
+    for retries in (0, 2):
+        server.retry_attempts = retries
+        samples, failures = asyncio.run(run('/v1/hotels/details'))
+        summarize(f'20% 503s, retries={retries}', samples)
+        print(f'{"":<28} failed={failures}/{calls}')
+    proc.terminate()
+
+    proc = with_stand_in(tail_rate=0.05, tail_latency=0.3)
+    for hedge in (False, True):
+        server.hedging_enabled = hedge
+        asyncio.run(run('/v1/hotels/search'))  # warm the latency window
+        samples, _ = asyncio.run(run('/v1/hotels/search'))
+        summarize(f'5% at 300ms, hedge={hedge}', samples)
+    print(json.dumps(server.resilience_stats['/v1/hotels/search']))
+    proc.terminate()
+
+    proc = with_stand_in(error_rate=1.0)
+    server.breaker = server.Breaker(server.breaker_threshold, server.breaker_cooldown)
+    server.retry_attempts = 2
+    samples, failures = asyncio.run(run('/v1/hotels/reviews'))
+    summarize('upstream down, breaker', samples)
+    print(f'{"":<28} failed={failures}/{calls} short_circuited={server.resilience_stats["/v1/hotels/reviews"]["short_circuited"]}')
+    path, payload = '/v1/hotels/details', {'hotel_id': 1}
+    key = server._cache_key(path, payload)
+    server.response_cache.put(key, {'cached': True}, 16, -60)
+    body = asyncio.run(server._get(server.api_url + path, payload))
+    print(f'{"":<28} expired entry while down -> {body} (stale_served={server.response_cache.stats[path]["stale_served"]})')
+    proc.terminate()
+
+
+def bench_prefetch(server, url, args):
+    '''Search, think, contract, seat map sessions at several prefetch depths: follow-up latency, hit rate, upstream calls
+
+    The agent books the first itinerary 60% of the time, the second 20%, the third 10%, else one of the next seven.
+    '''
+    from fastmcp import Client
+    sessions, think = max(args.calls // 10, 8), args.think / 1000
+    flight_paths = ('/v2/flight/roundTrip', '/v2/flight/contract', '/v2/flight/seatMap')
+
+    async def session(client, i, gate, samples):
+        rng = random.Random(i)
+        sid = f'bench{i}'
+        async with gate:
+            await client.call_tool('search', {'sid': sid, 'adults': 1, 'departure_date': '2026-11-01'})
+            await asyncio.sleep(think)
+            pick = rng.choices([0, 1, 2, rng.randrange(3, 10)], weights=[6, 2, 1, 1])[0]
+            start = time.perf_counter()
+            await client.call_tool('contract', {'sid': sid, 'ppn_bundle': f'{sid}-{pick}'})
+            samples.append(time.perf_counter() - start)
+            await asyncio.sleep(think)
+            start = time.perf_counter()
+            await client.call_tool('seat_map', {'sid': sid, 'ppn_bundle': f'seats-{sid}-{pick}'})
+            samples.append(time.perf_counter() - start)
+
+    async def run():
+        samples, gate = [], asyncio.Semaphore(args.agents)
+        async with Client(server.mcp) as client:
+            await asyncio.gather(*(session(client, i, gate, samples) for i in range(sessions)))
+        return sorted(samples)
+
+    print(f'{"depth":>5} {"sessions":>8} {"follow p50 ms":>14} {"follow p95 ms":>14} {"hit rate":>9} {"upstream/session":>17}')
+    for depth in (int(d) for d in args.depths.split(',')):
+        reset_caches(server)
+        server.prefetcher = server.Prefetcher(depth) if depth else None
+        before = sum(sum(server.telemetry.statuses[path].values()) for path in flight_paths)
+        samples = asyncio.run(run())
+        upstream = sum(sum(server.telemetry.statuses[path].values()) for path in flight_paths) - before
+        stats = server.prefetcher.snapshot()['endpoints'] if depth else {}
+        used = sum(c.get('hits', 0) + c.get('joined', 0) for c in stats.values())
+        claims = used + sum(c.get('misses', 0) for c in stats.values())
+        print(f'{depth:>5} {sessions:>8} {percentile(samples, 0.50) * 1000:>14.3f} {percentile(samples, 0.95) * 1000:>14.3f} '
+              f'{(used / claims if claims else 0.0):>9.2f} {upstream / sessions:>17.2f}')
+
+
+def bench_stream(server, url, args):
+    '''Peak Python heap and wall time to mirror one downloadHotels page, read whole vs streamed record by record'''
+    path = '/v2/hotels/downloadHotels'
+    envelope, collection = DOWNLOADS[path][:2]
+
+    async def buffered(payload):
+        response = await server._fetch(path, payload, priority='bulk')
+        response.raise_for_status()
+        records = list(response.json()[envelope]['results'][collection].values())
+        count = server.mirror.save_records('hotels', records)
+        key = server._cache_key(path, payload)
+        server.mirror.stage_part('hotels', key, 0, zlib.compress(response.content, 6))
+        server.mirror.save_page('hotels', key, count, None)
+        return count
+
+    async def streamed(payload):
+        return (await server._sync_page('hotels', path, payload))[0]
+
+    async def run():
+        await streamed({'limit': 1})  # connection, imports and tables out of the way
+        for limit in (int(n) for n in args.records.split(',')):
+            payload = {'limit': limit}
+            await streamed(payload)  # the stand-in encodes each page once
+            for mode, page in (('read whole', buffered), ('streamed', streamed)):
+                start = time.perf_counter()
+                count = await page(payload)
+                elapsed = time.perf_counter() - start
+                tracemalloc.start()  # a second, traced pass for the peak; tracing slows Python code down
+                await page(payload)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f'{limit:>8} {mode:>11} {count:>8} {peak / 2 ** 20:>13.1f} {elapsed:>9.2f}')
+
+    server.mirror.start('hotels', None, server._utcnow())
+    print(f'{"records":>8} {"page":>11} {"stored":>8} {"peak heap MiB":>13} {"seconds":>9}')
+    asyncio.run(run())
+
+
+def bench_resort(server, url, args):
+    '''Hotel searches re-sorted, re-filtered and cut per location, with the result store off and on
+
+    Each location gets one base search_hotels and search_express_results call, then the follow-ups an agent
+    narrowing a choice makes. Every answer the store computes is checked against the stand-in's own.
+    '''
+    import httpx
+    from fastmcp import Client
+    locations = max(args.calls // 10, 8)
+    paths = ('/v1/hotels/search', '/v2/hotels/expressResults')
+    keys = {'/v1/hotels/search': ('hotels', 'hotelId', {'PRICE': lambda h: float(h['ratesSummary']['minPrice']),
+                                                         'STAR': lambda h: h['starRating'], 'PROXIMITY': lambda h: h['proximity']}),
+            '/v2/hotels/expressResults': ('hotel_data', 'id', {'gs': lambda h: h['review_rating'], 'sr': lambda h: h['star_rating'],
+                                                                 'lp': _express_price, 'hp': _express_price})}
+
+    def calls(i):
+        stay = {'date_checkin': '2026-11-01', 'date_checkout': '2026-11-03', 'location_id': str(3000 + i)}
+        express = {'check_in': '2026-11-01', 'check_out': '2026-11-03', 'city_id': str(800000 + i)}
+        return [('search_hotels', {**stay, 'sort_order': 'PRICE'}),
+                ('search_express_results', express),
+                ('search_hotels', {**stay, 'sort_order': 'STAR'}),
+                ('search_hotels', {**stay, 'sort_order': 'PROXIMITY'}),
+                ('search_hotels', {**stay, 'sort_order': 'PRICE', 'star_rating_ids': '4,4.5,5'}),
+                ('search_hotels', {**stay, 'sort_order': 'STAR', 'amenities_ids': 'FINTRNT,POOL'}),
+                ('search_express_results', {**express, 'sort_by': 'lp'}),
+                ('search_express_results', {**express, 'sort_by': 'sr', 'limit': 10}),
+                ('search_express_results', {**express, 'sort_by': 'hp', 'limit': 5})]
+
+    def hotels(path, body):
+        found = server._hotel_collection(body)[2]
+        return list(found.values()) if isinstance(found, dict) else found
+
+    def agrees(path, arguments, served, expected):
+        '''Same sort keys in the same order, and the same hotels up to those tied with the last one kept
+
+        Which of several hotels tied on the key makes a page or limit cut is up to the upstream's tie-break.
+        '''
+        _, id_field, sorts = keys[path]
+        ours, theirs = hotels(path, served), hotels(path, expected)
+        sort = sorts.get(arguments.get('sort_order', arguments.get('sort_by', 'gs')))
+        if [sort(h) for h in ours] != [sort(h) for h in theirs]:
+            return False
+        last = sort(ours[-1]) if ours else None
+        return {h[id_field] for h in ours if sort(h) != last} == {h[id_field] for h in theirs if sort(h) != last}
+
+    async def run(check):
+        samples, disagreements = [], 0
+        async with Client(server.mcp) as client, httpx.AsyncClient(base_url=url) as direct:
+            for i in range(locations):
+                for n, (tool, arguments) in enumerate(calls(i)):
+                    start = time.perf_counter()
+                    result = await client.call_tool(tool, arguments)
+                    if n >= 2:
+                        samples.append(time.perf_counter() - start)
+                    if check and n >= 2:
+                        path = server.endpoint_tools[tool][0]
+                        expected = (await direct.get(path, params=arguments)).json()
+                        disagreements += not agrees(path, arguments, result.structured_content, expected)
+        return sorted(samples), disagreements
+
+    print(f'{"store":>5} {"locations":>9} {"follow p50 ms":>14} {"follow p95 ms":>14} {"upstream/location":>18} '
+          f'{"served":>7} {"disagree":>8}')
+    for enabled in (False, True):
+        reset_caches(server)
+        server.result_store = server.ResultStore(64) if enabled else None
+        before = sum(sum(server.telemetry.statuses[path].values()) for path in paths)
+        samples, disagreements = asyncio.run(run(enabled))
+        upstream = sum(sum(server.telemetry.statuses[path].values()) for path in paths) - before
+        served = sum(c['served'] for c in server.result_store.stats.values()) if enabled else 0
+        print(f'{"on" if enabled else "off":>5} {locations:>9} {percentile(samples, 0.50) * 1000:>14.3f} '
+              f'{percentile(samples, 0.95) * 1000:>14.3f} {upstream / locations:>18.2f} {served / len(samples):>7.2f} {disagreements:>8}')
+    print(json.dumps(server.result_store.snapshot()))
+
+
+def bench_cars(server, url, args):
+    '''Cheapest car near a point: one search_car_rentals call per nearby location in turn vs one fan-out call
+
+    Both walk the same mirrored rental locations; the sequential agent also calls download_companies
+    after each search to name the companies, as it would without a local table.
+    '''
+    from fastmcp import Client
+    centers = max(args.calls // 50, 4)
+    rental_paths = ('/v1/cars-rentals/search', '/v2/cars/downloadCompanies')
+    stay = {'date_time_pickup': '2026-11-01T10:00:00', 'date_time_return': '2026-11-04T10:00:00'}
+    asyncio.run(server.sync_mirror(['locations']))
+    index = server.rental_location_index()
+    rng = random.Random(3)
+    points = [(rng.uniform(30, 45), rng.uniform(-120, -75)) for _ in range(centers)]
+
+    async def sequential(client, lat, lon):
+        idx, dist = index.within([(lat, lon)], args.radius, None, args.locations)[0]
+        best = None
+        for place in index.describe(idx, dist):
+            result = await client.call_tool('search_car_rentals', {**stay, 'location_pickup': place['id'],
+                                                                  'location_return': place['id']})
+            await client.call_tool('download_companies', {'limit': 500})
+            for offer in server._offers(result.structured_content):
+                price = server._number_of(offer, server.price_fields)
+                best = price if best is None or price < best else best
+        return best, len(idx)
+
+    async def fan_out(client, lat, lon):
+        result = await client.call_tool('search_car_rentals_nearby', {**stay, 'latitude': lat, 'longitude': lon,
+                                                                      'radius_miles': args.radius, 'max_locations': args.locations})
+        body = result.structured_content
+        return (body['results'][0]['price'] if body['results'] else None), len(body['locations'])
+
+    async def run(search):
+        samples, found = [], []
+        async with Client(server.mcp) as client:
+            for lat, lon in points:
+                start = time.perf_counter()
+                found.append(await search(client, lat, lon))
+                samples.append(time.perf_counter() - start)
+        return sorted(samples), found
+
+    print(f'{"mode":>10} {"centers":>7} {"locations":>9} {"p50 ms":>9} {"p95 ms":>9} {"upstream/center":>15}')
+    cheapest = {}
+    for mode, search in (('sequential', sequential), ('fan-out', fan_out)):
+        reset_caches(server)
+        before = sum(sum(server.telemetry.statuses[path].values()) for path in rental_paths)
+        samples, found = asyncio.run(run(search))
+        upstream = sum(sum(server.telemetry.statuses[path].values()) for path in rental_paths) - before
+        cheapest[mode] = [price for price, _ in found]
+        print(f'{mode:>10} {centers:>7} {sum(n for _, n in found) / centers:>9.1f} {percentile(samples, 0.50) * 1000:>9.1f} '
+              f'{percentile(samples, 0.95) * 1000:>9.1f} {upstream / centers:>15.2f}')
+    print('same cheapest offer per center:', cheapest['sequential'] == cheapest['fan-out'])
+
+
+def bench_warm(server, url, args):
+    '''Zipf-skewed search traffic with the cache warmer off and on: hot-query hit rate, latency, upstream calls
+
+    TTLs are cut to a few seconds so that many expiries fit into the run. Hot hits are calls to the queries the
+    access log holds hot that found a fresh response in memory; the warmer runs in both modes, with no quota
+    share when off. A call counts as fast when it takes under half the simulated latency; the head is the
+    `--top`/4 most popular queries.
+    '''
+    from fastmcp import Client
+    paths = ('/v1/hotels/search', '/v2/hotels/expressResults', '/v1/flights/search')
+    for path in paths:
+        server.endpoint_ttls[path] = args.ttl
+    server.warm_interval = 0.5
+    server.result_store = None
+    queries = []
+    for i in range(args.queries):
+        if i % 3 == 0:
+            queries.append(('search_hotels', {'date_checkin': '2026-11-01', 'date_checkout': '2026-11-03',
+                                              'location_id': str(3000 + i), 'sort_order': 'PRICE'}))
+        elif i % 3 == 1:
+            queries.append(('search_express_results', {'check_in': '2026-11-01', 'check_out': '2026-11-03',
+                                                       'city_id': str(800000 + i)}))
+        else:
+            queries.append(('search_flights', {'location_departure': 'JFK', 'location_arrival': f'A{i:04d}',
+                                               'date_departure': '2026-11-01', 'itinerary_type': 'ONE_WAY',
+                                               'class_type': 'ECO', 'sort_order': 'PRICE'}))
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(queries))]
+    hot = args.top // 4
+    fast = args.latency / 1000 / 2
+
+    async def agent(client, rng, until, samples):
+        while time.monotonic() < until:
+            rank = rng.choices(range(len(queries)), weights)[0]
+            tool, arguments = queries[rank]
+            start = time.perf_counter()
+            await client.call_tool(tool, arguments)
+            samples.append((rank < hot, time.perf_counter() - start))
+            await asyncio.sleep(0.1)
+
+    async def run():
+        samples = []
+        async with Client(server.mcp) as client:
+            until = time.monotonic() + args.seconds
+            await asyncio.gather(*(agent(client, random.Random(n), until, samples) for n in range(args.agents)))
+        if server.warmer is not None and server.warmer.task is not None:
+            server.warmer.task.cancel()
+        return samples
+
+    print(f'{"warmer":>6} {"calls":>6} {"hot hits":>8} {"warm hits":>9} {"head fast":>9} {"all fast":>8} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"upstream":>8} {"warm calls":>10} {"warm share":>10}')
+    share = server.warm_quota_share
+    for enabled in (False, True):
+        reset_caches(server)
+        # Off still logs calls, with no quota to warm, so both runs report hits on the same hot set
+        server.warm_quota_share = share if enabled else 0.0
+        server.warmer = server.Warmer(args.top)
+        before = {name: waits['calls'] for name, waits in server.scheduler.waits.items()}
+        samples = asyncio.run(run())
+        spent = {name: waits['calls'] - before.get(name, 0) for name, waits in server.scheduler.waits.items()}
+        upstream, warm = sum(spent.values()), spent.get('warm', 0)
+        hot_samples = [elapsed for is_hot, elapsed in samples if is_hot]
+        times = sorted(elapsed for _, elapsed in samples)
+        snapshot = server.warmer.snapshot()
+        print(f'{"on" if enabled else "off":>6} {len(samples):>6} {snapshot["hot_hit_rate"]:>8.3f} {snapshot["warm_hit_rate"]:>9.3f} '
+              f'{sum(t < fast for t in hot_samples) / len(hot_samples):>9.3f} {sum(t < fast for t in times) / len(times):>8.3f} '
+              f'{percentile(times, 0.50) * 1000:>8.1f} {percentile(times, 0.95) * 1000:>8.1f} {upstream:>8} {warm:>10} '
+              f'{(warm / upstream if upstream else 0):>10.3f}')
+    server.warm_quota_share = share
+    print(json.dumps(server.warmer.snapshot()))
+
+
+def bench_revalidate(server, url, args):
+    '''Upstream bytes for detail and download calls, fetched cold and again once expired: plain, gzip, gzip + 304s
+
+    The stand-in gzips for clients that accept it and answers conditional GETs whose ETag still matches with 304.
+    '''
+    calls = [('/v1/hotels/details', {'hotel_id': 700000 + i}) for i in range(200)]
+    calls += [('/v2/hotels/photos', {'hotel_ids': ','.join(str(700000 + 20 * i + n) for n in range(20))}) for i in range(20)]
+    calls += [('/v2/hotels/downloadPropertyTypes', {'limit': 20, 'resume_key': str(20 * i)}) for i in range(3)]
+    calls += [('/v2/hotels/downloadHotels', {'limit': 500, 'resume_key': str(500 * i)}) for i in range(20)]
+    paths = list(dict.fromkeys(path for path, _ in calls))
+    for path in paths:
+        server.endpoint_ttls[path] = args.ttl
+    proc, server.api_url = start_stand_in(args.latency / 1000, compress=True, validators=True)
+    revalidated = server.revalidated_endpoints
+    telemetry = server.telemetry
+
+    async def run():
+        gate = asyncio.Semaphore(8)
+
+        async def one(path, payload):
+            async with gate:
+                await server._get(server.api_url + path, payload)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(path, payload) for path, payload in calls))
+        return time.perf_counter() - start
+
+    def counters():
+        return {path: (telemetry.bytes_in[path], telemetry.wire_bytes[path], server.response_cache.stats[path]['revalidated'])
+                for path in paths}
+
+    print(f'{"mode":<22} {"endpoint":<34} {"body KiB":>9} {"cold wire":>9} {"expired wire":>12} {"304s":>5}')
+    for mode, encoding, validating in (('plain', 'identity', False), ('gzip', 'gzip', False), ('gzip + revalidate', 'gzip', True)):
+        reset_caches(server)
+        server.accept_encoding = encoding
+        server.revalidated_endpoints = revalidated if validating else set()
+        before = counters()
+        cold = asyncio.run(run())
+        middle = counters()
+        time.sleep(args.ttl)
+        expired = asyncio.run(run())
+        after = counters()
+        for path in paths:
+            body = middle[path][0] - before[path][0]
+            print(f'{mode:<22} {path:<34} {body / 1024:>9.0f} {(middle[path][1] - before[path][1]) / 1024:>9.0f} '
+                  f'{(after[path][1] - middle[path][1]) / 1024:>12.0f} {after[path][2] - middle[path][2]:>5}')
+        print(f'{mode:<22} {"seconds cold / expired":<34} {cold:>9.2f} {expired:>9.2f}')
+    server.revalidated_endpoints = revalidated
+    proc.terminate()
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+
+def rss_mb():
+    '''Resident set size of this process now, in MiB'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_caches(server):
+    '''Empty every local cache tier so the next run starts cold'''
+    server.response_cache.clear()
+    server.response_cache.stats.clear()
+    if server.disk_cache is not None:
+        server.disk_cache = server.DiskCache(os.path.join(tempfile.mkdtemp(prefix='priceline-bench-'), 'responses.sqlite3'),
+                                             server.disk_cache_max_bytes, 0)
+
+
+def workload_calls(workload, calls):
+    '''(tool, arguments) pairs for one workload'''
+    stay = {'date_checkin': '2026-11-01', 'date_checkout': '2026-11-03', 'sort_order': 'PRICE'}
+    if workload == 'bulk':
+        return [('downalods_hotels', {'limit': 500, 'resume_key': str(500 * i)}) for i in range(40)]
+    if workload == 'burst':
+        return [('search_hotels', {**stay, 'location_id': str(3000 + i % 5)}) if i % 2 else
+                ('search_express_results', {'check_in': '2026-11-01', 'check_out': '2026-11-03', 'city_id': str(800 + i % 5)})
+                for i in range(calls)]
+    mixed = []
+    for i in range(calls):
+        mixed.append([('hotel_details', {'hotel_id': 700000 + i}),
+                      ('search_hotels', {**stay, 'location_id': str(3000 + i)}),
+                      ('hotel_reviews', {'hotel_id': str(700000 + i)}),
+                      ('search_flights_locations', {'name': f'city{i}'})][i % 4])
+    return mixed
+
+
+async def drive(server, calls, concurrency):
+    '''Run tool calls through an in-memory MCP client; returns (latencies, errors, wall seconds)'''
+    from fastmcp import Client
+    from fastmcp.exceptions import ToolError
+    gate = asyncio.Semaphore(concurrency)
+    samples, errors = [], 0
+
+    async def one(client, tool, arguments):
+        nonlocal errors
+        async with gate:
+            start = time.perf_counter()
+            try:
+                await client.call_tool(tool, arguments)
+            except ToolError:
+                errors += 1
+            samples.append(time.perf_counter() - start)
+
+    async with Client(server.mcp) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, tool, arguments) for tool, arguments in calls))
+        return sorted(samples), errors, time.perf_counter() - start
+
+
+def bench_suite(server, url, args):
+    '''Cold cache, warm cache, bulk download and search burst workloads at each concurrency level'''
+    results = []
+    print(f'{"workload":<8} {"conc":>4} {"calls":>6} {"err":>4} {"calls/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"rss MiB":>8}')
+    for workload in args.workloads.split(','):
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            calls = workload_calls(workload, args.calls)
+            reset_caches(server)
+            if workload == 'warm':
+                asyncio.run(drive(server, calls, concurrency))
+            before = rss_mb()
+            samples, errors, wall = asyncio.run(drive(server, calls, concurrency))
+            row = {'workload': workload, 'concurrency': concurrency, 'calls': len(calls), 'errors': errors,
+                   'throughput': round(len(calls) / wall, 2),
+                   'p50_ms': round(percentile(samples, 0.50) * 1000, 3), 'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+                   'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+                   'rss_mb': round(rss_mb(), 1), 'rss_delta_mb': round(rss_mb() - before, 1)}
+            results.append(row)
+            print(f'{workload:<8} {concurrency:>4} {row["calls"]:>6} {errors:>4} {row["throughput"]:>9.1f} {row["p50_ms"]:>9.3f} '
+                  f'{row["p95_ms"]:>9.3f} {row["p99_ms"]:>9.3f} {row["rss_mb"]:>8.1f}')
+    report = {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {'latency_ms': args.latency, 'jitter_ms': args.jitter, 'error_rate': args.error_rate,
+                   'fixtures': args.fixtures, 'calls': args.calls, 'python': platform.python_version(),
+                   'cpus': os.cpu_count(), 'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)},
+        'results': results,
+    }
+    out = args.out or os.path.join('bench-results', f'suite-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f'saved {out}')
+    if args.compare:
+        compare(args.compare, report)
+
+
+def compare(baseline_path, report):
+    '''Print throughput and p95 changes against an earlier saved report'''
+    with open(baseline_path) as f:
+        baseline = {(r['workload'], r['concurrency']): r for r in json.load(f)['results']}
+    print(f'against {baseline_path}:')
+    for row in report['results']:
+        old = baseline.get((row['workload'], row['concurrency']))
+        if old:
+            change = lambda field: (row[field] - old[field]) / old[field] * 100 if old[field] else 0.0
+            print(f'{row["workload"]:<8} {row["concurrency"]:>4} throughput {change("throughput"):+7.1f}%  p95 {change("p95_ms"):+7.1f}%')
+
+
+def start_http_server(url, workers, shared_state, rate):
+    '''`python server.py PORT` against the stand-in with a cold cache directory; returns (process, MCP endpoint url)'''
+    import httpx
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = {**os.environ, 'PRICELINE_API_URL': url, 'PRICELINE_WORKERS': str(workers), 'PRICELINE_SHARED_STATE': shared_state,
+           'PRICELINE_CACHE_DIR': tempfile.mkdtemp(prefix='priceline-bench-'),
+           'PRICELINE_RATE_PER_SECOND': str(rate), 'PRICELINE_RATE_BURST': str(rate)}
+    proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'), str(port)],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/metrics')
+            break
+        except httpx.TransportError:
+            if time.monotonic() > deadline or proc.poll() is not None:
+                proc.kill()
+                raise RuntimeError('server.py did not start listening')
+            time.sleep(0.1)
+    return proc, f'http://127.0.0.1:{port}/mcp'
+
+
+async def agents(endpoint, calls, count):
+    '''Spread tool calls over `count` agents, each its own MCP HTTP client making one call at a time'''
+    from fastmcp import Client
+    from fastmcp.exceptions import ToolError
+    samples, errors = [], 0
+
+    async def agent(share):
+        nonlocal errors
+        async with Client(endpoint) as client:
+            for tool, arguments in share:
+                start = time.perf_counter()
+                try:
+                    await client.call_tool(tool, arguments)
+                except ToolError:
+                    errors += 1
+                samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(agent(calls[i::count]) for i in range(count)))
+    return sorted(samples), errors, time.perf_counter() - start
+
+
+def bench_workers(server, url, args):
+    '''HTTP workers behind one listener: a cold pass bounded by the per-key rate, then a warm pass, per state backend
+
+    With `memory` every worker spends the full per-key rate; the shared backends hold all workers to it together.
+    '''
+    print(f'{"backend":<7} {"workers":>7} {"pass":<5} {"calls":>6} {"err":>4} {"calls/s":>9} {"p50 ms":>9} {"p99 ms":>9}')
+    calls = [('hotel_details', {'hotel_id': 700000 + i}) for i in range(args.calls)]
+    for backend in args.backends.split(','):
+        for workers in (int(w) for w in args.workers.split(',')):
+            resp, shared_state = start_resp_stand_in() if backend == 'redis' else (None, {'sqlite': 'sqlite://'}.get(backend, backend))
+            proc, endpoint = start_http_server(url, workers, shared_state, args.rate)
+            try:
+                for phase in ('cold', 'warm'):
+                    samples, errors, wall = asyncio.run(agents(endpoint, calls, args.agents))
+                    print(f'{backend:<7} {workers:>7} {phase:<5} {len(calls):>6} {errors:>4} {len(calls) / wall:>9.1f} '
+                          f'{percentile(samples, 0.50) * 1000:>9.3f} {percentile(samples, 0.99) * 1000:>9.3f}')
+            finally:
+                proc.terminate()
+                proc.wait()
+                if resp is not None:
+                    resp.terminate()
+
+
+SCENARIOS = {'suite': bench_suite, 'pool': bench_pool, 'resolver': bench_resolver, 'geo': bench_geo, 'projection': bench_projection,
+             'scheduler': bench_scheduler, 'resilience': bench_resilience, 'workers': bench_workers, 'prefetch': bench_prefetch,
+             'stream': bench_stream, 'resort': bench_resort, 'cars': bench_cars, 'warm': bench_warm,
+             'revalidate': bench_revalidate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenario', nargs='?', choices=sorted(SCENARIOS), default='pool')
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=2.0, help='simulated upstream latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- jitter on the latency, in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of upstream requests answered 503')
+    parser.add_argument('--fixtures', help='directory of recorded responses, one <path_with_underscores>.json per endpoint')
+    parser.add_argument('--concurrency', default='1,8,64', help='suite: comma separated concurrency levels')
+    parser.add_argument('--workloads', default='cold,warm,bulk,burst', help='suite: comma separated workloads')
+    parser.add_argument('--out', help='suite: report path, default bench-results/suite-<timestamp>.json')
+    parser.add_argument('--compare', help='suite: earlier report to compare against')
+    parser.add_argument('--workers', default='1,4', help='workers: comma separated worker process counts')
+    parser.add_argument('--backends', default='memory,sqlite,redis', help='workers: comma separated shared state backends')
+    parser.add_argument('--agents', type=int, default=16, help='workers: concurrent MCP clients')
+    parser.add_argument('--rate', type=float, default=20, help='workers: per-key upstream calls per second')
+    parser.add_argument('--depths', default='0,1,3,5', help='prefetch: comma separated itineraries to prefetch')
+    parser.add_argument('--think', type=float, default=1000, help='prefetch: agent think time between calls, in ms')
+    parser.add_argument('--records', default='100,10000,100000', help='stream: comma separated records per page')
+    parser.add_argument('--radius', type=float, default=50, help='cars: miles around each point to search')
+    parser.add_argument('--locations', type=int, default=10, help='cars: most rental locations per point')
+    parser.add_argument('--seconds', type=float, default=40, help='warm: seconds of traffic per run')
+    parser.add_argument('--queries', type=int, default=3000, help='warm: distinct searches, called with Zipf(1.1) skew')
+    parser.add_argument('--top', type=int, default=256, help='warm: hot queries the access log tracks')
+    parser.add_argument('--ttl', type=float, default=8, help='warm, revalidate: seconds the called endpoints are cached')
+    args = parser.parse_args()
+    stand_in, url = start_stand_in(args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+                                   fixtures=args.fixtures)
+    os.environ['PRICELINE_API_URL'] = url
+    os.environ['PRICELINE_CACHE_DIR'] = tempfile.mkdtemp(prefix='priceline-bench-')
+    os.environ.setdefault('PRICELINE_RATE_PER_SECOND', '0')
+    import server
+    try:
+        SCENARIOS[args.scenario](server, url, args)
+    finally:
+        stand_in.terminate()
+
+
+if __name__ == '__main__':
+    main()
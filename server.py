@@ -1,11 +1,37 @@
-import requests
-from datetime import datetime
+import asyncio
+import bisect
+import codecs
+import concurrent.futures
+import contextvars
+import email.utils
+import functools
+import hashlib
+import heapq
+import httpx
+import importlib.util
+import inspect
+import json
+import math
+import pydantic_core
+import random
+import re
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict, defaultdict, deque
+from datetime import date, datetime, timedelta, timezone
 from typing import Union, Literal, List
-from mcp.server import FastMCP
 from pydantic import Field
 from typing import Annotated
-from mcp.server.fastmcp import FastMCP
 from fastmcp import FastMCP, Context
+from fastmcp.exceptions import ToolError
+from fastmcp.server.middleware import Middleware
+from fastmcp.tools.tool import Tool, ToolResult
+from mcp.types import TextContent
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -13,635 +39,3519 @@ rapid_api_key = os.getenv("RAPID_API_KEY")
 
 __rapidapi_url__ = 'https://rapidapi.com/tipsters/api/priceline-com-provider'
 
-mcp = FastMCP('priceline-com-provider')
+api_host = 'priceline-com-provider.p.rapidapi.com'
+api_url = os.getenv('PRICELINE_API_URL', f'https://{api_host}').rstrip('/')
 
-@mcp.tool()
-def search_car_rentals(date_time_pickup: Annotated[str, Field(description='Pickup date and time')],
-                       location_return: Annotated[str, Field(description='Location return code or id')],
-                       location_pickup: Annotated[str, Field(description='Location pickup code or id. Ex: JFK or 1365100023, use Search locations api point')],
-                       date_time_return: Annotated[str, Field(description='Return date and time')]) -> dict: 
-    '''Search car rentals by filter. Indicate the `location_id` -> use `Search locations` api point'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/cars-rentals/search'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'date_time_pickup': date_time_pickup,
-        'location_return': location_return,
-        'location_pickup': location_pickup,
-        'date_time_return': date_time_return,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+pool_size = int(os.getenv('PRICELINE_POOL_SIZE', '32'))
+pool_keepalive = int(os.getenv('PRICELINE_POOL_KEEPALIVE', '16'))
+keepalive_expiry = float(os.getenv('PRICELINE_KEEPALIVE_EXPIRY', '60'))
+connect_timeout = float(os.getenv('PRICELINE_CONNECT_TIMEOUT', '5'))
+read_timeout = float(os.getenv('PRICELINE_READ_TIMEOUT', '30'))
 
-@mcp.tool()
-def search_hotels(date_checkout: Annotated[str, Field(description='Checkout date')],
-                  date_checkin: Annotated[str, Field(description='Checkin date')],
-                  sort_order: Annotated[Literal['HDR', 'PRICE', 'STAR', 'PROXIMITY', 'DEALS'], Field(description='')],
-                  location_id: Annotated[str, Field(description='Location id, use Search locations api point')],
-                  page_number: Annotated[Union[int, float, None], Field(description='Number of page Default: 0 Minimum: 0 Maximum: 500')] = None,
-                  star_rating_ids: Annotated[Union[str, None], Field(description='Hotel star ratings')] = None,
-                  rooms_number: Annotated[Union[int, float, None], Field(description='Rooms number Default: 1 Minimum: 1 Maximum: 8')] = None,
-                  amenities_ids: Annotated[Union[str, None], Field(description='Amenities')] = None) -> dict: 
-    '''Get available hotels by the filter. Indicate the `location_id` -> use `Search locations`, check-in and check-out date'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/hotels/search'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'date_checkout': date_checkout,
-        'date_checkin': date_checkin,
-        'sort_order': sort_order,
-        'location_id': location_id,
-        'page_number': page_number,
-        'star_rating_ids': star_rating_ids,
-        'rooms_number': rooms_number,
-        'amenities_ids': amenities_ids,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+# Read timeouts (seconds) for endpoints that are known to be slower than the default.
+endpoint_read_timeouts = {
+    '/v1/flights/search': 60,
+    '/v2/flight/roundTrip': 60,
+    '/v2/hotels/expressResults': 45,
+    '/v2/hotels/downloadHotels': 120,
+    '/v2/cars/downloadLocations': 90,
+    '/v2/cars/downloadCities': 90,
+    '/v2/flight/downloadAirports': 90,
+}
 
-@mcp.tool()
-def search_cars_locations(name: Annotated[str, Field(description='Name')]) -> dict: 
-    '''Search locations by name'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/cars-rentals/locations'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'name': name,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+# Overall budget (seconds) for one call, including queueing, retries and backoff.
+request_deadline = float(os.getenv('PRICELINE_DEADLINE', '45'))
+endpoint_deadlines = {
+    '/v1/flights/locations': 10,
+    '/v1/hotels/locations': 10,
+    '/v2/flight/autoComplete': 10,
+    '/v2/hotels/autoSuggest': 10,
+    '/v1/flights/search': 90,
+    '/v2/flight/roundTrip': 90,
+    '/v2/hotels/expressResults': 60,
+    '/v2/hotels/downloadHotels': 300,
+    '/v2/cars/downloadLocations': 180,
+    '/v2/cars/downloadCities': 180,
+    '/v2/flight/downloadAirports': 180,
+}
 
-@mcp.tool()
-def hotel_details(hotel_id: Annotated[Union[int, float], Field(description='Hotel id Default: 6733503 Minimum: 1')],
-                  offset_of_reviews: Annotated[Union[int, float, None], Field(description='Offset of reviews Default: 0 Minimum: 0 Maximum: 1000')] = None) -> dict: 
-    '''Get all reviews and images of the hotel by hotel_id'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/hotels/details'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'hotel_id': hotel_id,
-        'offset_of_reviews': offset_of_reviews,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+retry_attempts = int(os.getenv('PRICELINE_RETRIES', '2'))
+backoff_base = float(os.getenv('PRICELINE_BACKOFF_BASE', '0.25'))
+backoff_cap = float(os.getenv('PRICELINE_BACKOFF_CAP', '4'))
+retry_statuses = {500, 502, 503, 504}
+# Quotes a bookable rate: a blind retry may hand back a different contract than the one the caller asked for.
+unretried_endpoints = {'/v2/hotels/expressContract'}
 
-@mcp.tool()
-def search_hotels_locations(name: Annotated[str, Field(description='Name')],
-                            search_type: Annotated[Literal['ALL', 'CITY', 'AIRPORT', 'POI', 'HOTEL'], Field(description='')]) -> dict: 
-    '''Search locations by name'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/hotels/locations'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'name': name,
-        'search_type': search_type,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+breaker_threshold = int(os.getenv('PRICELINE_BREAKER_THRESHOLD', '5'))
+breaker_cooldown = float(os.getenv('PRICELINE_BREAKER_COOLDOWN', '30'))
+# How long past expiry a cached response may still be served while the upstream is failing.
+stale_window = float(os.getenv('PRICELINE_STALE_FOR', str(24 * 3600)))
 
-@mcp.tool()
-def search_flights_locations(name: Annotated[str, Field(description='Name')]) -> dict: 
-    '''Search airports and locations by name'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/flights/locations'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'name': name,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+# Latency-critical endpoints that may send a second copy of a request still unanswered after the endpoint's p95.
+hedging_enabled = os.getenv('PRICELINE_HEDGE', '0') != '0'
+hedged_endpoints = {'/v1/hotels/search', '/v1/flights/search', '/v2/flight/roundTrip', '/v2/hotels/expressResults',
+                    '/v1/cars-rentals/search', '/v1/flights/locations', '/v1/hotels/locations',
+                    '/v2/flight/autoComplete', '/v2/hotels/autoSuggest'}
+hedge_min_samples = 20
+hedge_min_delay = float(os.getenv('PRICELINE_HEDGE_MIN_DELAY', '0.05'))
 
-@mcp.tool()
-def search_flights(location_departure: Annotated[str, Field(description='Departure location code. Use Search locations api point')],
-                   itinerary_type: Annotated[Literal['ONE_WAY', 'ROUND_TRIP'], Field(description='')],
-                   date_departure: Annotated[str, Field(description='Departure date')],
-                   class_type: Annotated[Literal['ECO', 'BUS', 'PEC', 'FST'], Field(description='')],
-                   sort_order: Annotated[Literal['PRICE', 'ARRIVETIME', 'DEPARTTIME', 'TRAVELTIME'], Field(description='')],
-                   location_arrival: Annotated[str, Field(description='Arrival location code')],
-                   date_departure_return: Annotated[Union[str, None], Field(description='Departure date back')] = None,
-                   price_max: Annotated[Union[int, float, None], Field(description='Price max Default: 20000 Minimum: 1 Maximum: 1000000')] = None,
-                   price_min: Annotated[Union[int, float, None], Field(description='Price min Default: 100 Minimum: 1 Maximum: 1000000')] = None,
-                   number_of_passengers: Annotated[Union[int, float, None], Field(description='Number of passengers Default: 1 Minimum: 1 Maximum: 7')] = None,
-                   number_of_stops: Annotated[Union[int, float, None], Field(description='Number of stops. 0 - is direct flight Default: 1 Minimum: 0 Maximum: 3')] = None,
-                   duration_max: Annotated[Union[int, float, None], Field(description='Duration max. Minutes Default: 2051 Minimum: 1 Maximum: 10000')] = None) -> dict: 
-    '''Search flights. Type: only `ONE_WAY`. Set location_departure and location_arrival, use `/flights/locations` api point. You can filter out tickets by price, max duration and number of stops'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/flights/search'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'location_departure': location_departure,
-        'itinerary_type': itinerary_type,
-        'date_departure': date_departure,
-        'class_type': class_type,
-        'sort_order': sort_order,
-        'location_arrival': location_arrival,
-        'date_departure_return': date_departure_return,
-        'price_max': price_max,
-        'price_min': price_min,
-        'number_of_passengers': number_of_passengers,
-        'number_of_stops': number_of_stops,
-        'duration_max': duration_max,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+try:
+    import h2  # noqa: F401
+    http2_enabled = os.getenv('PRICELINE_HTTP2', '1') != '0'
+except ImportError:
+    http2_enabled = False
+
+# Content encodings offered upstream, preferred first: brotli where its decoder is installed, else gzip.
+try:
+    import brotli  # noqa: F401
+    accept_encoding = 'br, gzip'
+except ImportError:
+    accept_encoding = 'gzip'
+if os.getenv('PRICELINE_COMPRESSION', '1') == '0':
+    accept_encoding = 'identity'
+
+max_concurrency = int(os.getenv('PRICELINE_MAX_CONCURRENCY', '256'))
+
+# RapidAPI keys to spread load over, `key[:per_second[:burst]]` comma separated. RAPID_API_KEY alone is a pool of one.
+rapid_api_keys = [k.strip() for k in os.getenv('RAPID_API_KEYS', rapid_api_key or '').split(',') if k.strip()] or ['']
+rate_per_second = float(os.getenv('PRICELINE_RATE_PER_SECOND', '10'))  # per key; 0 disables local throttling
+rate_burst = float(os.getenv('PRICELINE_RATE_BURST', '10'))
+# Share of a key's monthly quota that only interactive calls may spend.
+quota_reserve = float(os.getenv('PRICELINE_QUOTA_RESERVE', '0.1'))
+throttle_retries = int(os.getenv('PRICELINE_THROTTLE_RETRIES', '2'))
+
+# Scheduling classes, most urgent first: tool calls, speculative prefetch, cache warming, mirror sync.
+priorities = {'interactive': 0, 'prefetch': 1, 'warm': 2, 'bulk': 3}
+# After a round-trip search, fetch `contract` and then `seat_map` for this many of its itineraries at prefetch
+# priority, so the agent's follow-up calls are answered from the cache. Each costs up to two upstream calls; 0 disables.
+prefetch_itineraries = int(os.getenv('PRICELINE_PREFETCH', '0'))
+prefetch_sessions = 1024  # sids tracked for hit accounting, most recent first
+# Recent hotel search result sets kept as NumPy columns, per base query, so a re-sort, a narrower filter or a
+# smaller top-k of a complete set is answered locally. Number of base queries kept; 0 disables.
+result_store_size = int(os.getenv('PRICELINE_RESULT_STORE', '64'))
+# Refresh the most requested searches shortly before their cached responses expire, at `warm` priority. Number of
+# hot queries the access log tracks; 0 disables. Warming spends at most PRICELINE_WARM_QUOTA_SHARE of all upstream calls.
+warm_top = int(os.getenv('PRICELINE_WARM_TOP', '0'))
+warm_quota_share = float(os.getenv('PRICELINE_WARM_QUOTA_SHARE', '0.2'))
+warm_min_calls = float(os.getenv('PRICELINE_WARM_MIN_CALLS', '3'))  # decayed calls before a query is kept warm
+warm_half_life = float(os.getenv('PRICELINE_WARM_HALF_LIFE', '3600'))  # seconds over which call counts halve
+warm_interval = float(os.getenv('PRICELINE_WARM_INTERVAL', '5'))
+warm_lead = 0.25  # share of the TTL left when a hot response is refreshed
+warm_endpoints = ('/v1/hotels/search', '/v2/hotels/expressResults', '/v1/flights/search')
+batch_concurrency = int(os.getenv('PRICELINE_BATCH_CONCURRENCY', '8'))
+photos_chunk_size = int(os.getenv('PRICELINE_PHOTOS_CHUNK_SIZE', '50'))
+
+cache_max_entries = int(os.getenv('PRICELINE_CACHE_MAX_ENTRIES', '4096'))
+cache_max_bytes = int(os.getenv('PRICELINE_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+
+MINUTE, HOUR, DAY = 60, 3600, 86400
+
+# Freshness (seconds) of cached responses per endpoint. Endpoints not listed are never cached.
+endpoint_ttls = {
+    '/v1/cars-rentals/search': 5 * MINUTE,
+    '/v1/cars-rentals/locations': DAY,
+    '/v1/hotels/search': 10 * MINUTE,
+    '/v1/hotels/details': 6 * HOUR,
+    '/v1/hotels/locations': DAY,
+    '/v1/hotels/locations-by-geo': DAY,
+    '/v1/hotels/booking-details': 5 * MINUTE,
+    '/v1/flights/locations': DAY,
+    '/v1/flights/search': 5 * MINUTE,
+    '/v2/flight/roundTrip': 5 * MINUTE,
+    '/v2/flight/contract': 2 * MINUTE,
+    '/v2/flight/seatMap': 2 * MINUTE,
+    '/v2/flight/autoComplete': DAY,
+    '/v2/flight/downloadAirports': 7 * DAY,
+    '/v2/cars/downloadCompanies': 7 * DAY,
+    '/v2/cars/downloadCities': 7 * DAY,
+    '/v2/cars/downloadLocations': 7 * DAY,
+    '/v2/hotels/downloadPropertyTypes': 7 * DAY,
+    '/v2/hotels/downloadHotels': 2 * DAY,
+    '/v2/hotels/downloadAreas': 7 * DAY,
+    '/v2/hotels/downloadCountries': 7 * DAY,
+    '/v2/hotels/downloadChains': 7 * DAY,
+    '/v2/hotels/downloadAmenities': 7 * DAY,
+    '/v2/hotels/downloadStates': 7 * DAY,
+    '/v2/hotels/downloadCitiesClusters': 7 * DAY,
+    '/v2/hotels/downloadFilterAmenities': 7 * DAY,
+    '/v2/hotels/reviews': 6 * HOUR,
+    '/v2/hotels/expressResults': 5 * MINUTE,
+    '/v2/hotels/autoSuggest': DAY,
+    '/v2/hotels/photos': DAY,
+}
+
+# Slow-changing endpoints whose responses keep their ETag/Last-Modified: once expired they are asked for with a
+# conditional GET, and a 304 renews the cached body for another TTL without downloading it again.
+revalidated_endpoints = {
+    '/v1/hotels/details', '/v2/hotels/photos',
+    '/v2/flight/downloadAirports', '/v2/cars/downloadCompanies', '/v2/cars/downloadCities', '/v2/cars/downloadLocations',
+    '/v2/hotels/downloadPropertyTypes', '/v2/hotels/downloadHotels', '/v2/hotels/downloadAreas',
+    '/v2/hotels/downloadCountries', '/v2/hotels/downloadChains', '/v2/hotels/downloadAmenities',
+    '/v2/hotels/downloadStates', '/v2/hotels/downloadCitiesClusters', '/v2/hotels/downloadFilterAmenities',
+}
+
+class ResponseCache:
+    '''In-memory LRU cache of parsed upstream responses, bounded by entry count and body bytes'''
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()  # key -> (expires_at, size, body, conditional request headers or None)
+        self.stats = defaultdict(Counter)  # endpoint path -> hits/misses/bypassed/evictions/coalesced/revalidated/modified
+
+    def get(self, key: str, stale_for: float = 0.0):
+        '''Body for a key, also when it expired less than `stale_for` seconds ago; entries are kept for the stale window'''
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[0] + stale_for <= now:
+            if entry[0] + stale_window <= now:
+                self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[2]
+
+    def put(self, key: str, body, size: int, ttl: float, validators=None):
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (time.monotonic() + ttl, size, body, validators)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            evicted = next(iter(self.entries))
+            self.stats[evicted.split('?', 1)[0]]['evictions'] += 1
+            self._drop(evicted)
+
+    def _drop(self, key: str):
+        self.bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+response_cache = ResponseCache(cache_max_entries, cache_max_bytes)
+
+# Record every upstream exchange and tool call to an archive, or serve a recorded archive instead of the network.
+record_path = os.getenv('PRICELINE_RECORD')
+replay_path = os.getenv('PRICELINE_REPLAY')
+replay_speed = float(os.getenv('PRICELINE_REPLAY_SPEED', '1'))  # 1 = recorded response times, 0 = as fast as possible
+
+cache_dir = os.getenv('PRICELINE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'priceline-com-provider'))
+if record_path or replay_path:
+    # A recorded or replayed run starts from empty disk, mirror and shared tiers: every request it makes reaches
+    # the archive, whatever this machine happens to have cached, and carries no validators from an earlier run.
+    cache_dir = tempfile.mkdtemp(prefix='priceline-archive-run-')
+disk_cache_enabled = os.getenv('PRICELINE_DISK_CACHE', '1') != '0'
+disk_cache_max_bytes = int(os.getenv('PRICELINE_DISK_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+disk_cache_compact_interval = float(os.getenv('PRICELINE_DISK_CACHE_COMPACT_INTERVAL', '300'))
+
+# `python server.py PORT` serves MCP over HTTP (`http` is streamable HTTP, or `sse`) from this many worker processes.
+http_host = os.getenv('PRICELINE_HOST', '127.0.0.1')
+http_transport = os.getenv('PRICELINE_TRANSPORT', 'http')
+http_workers = int(os.getenv('PRICELINE_WORKERS', '1'))
+# Where workers share rate-limit state: `memory` (not shared), `sqlite://[/path]` (one host) or
+# `redis://host:port/db` (any host; also holds the second-level response cache).
+shared_state_url = os.getenv('PRICELINE_SHARED_STATE', 'sqlite://' if http_workers > 1 else 'memory')
+if record_path or replay_path:
+    shared_state_url = 'memory'
+redis_timeout = float(os.getenv('PRICELINE_REDIS_TIMEOUT', '0.25'))
+
+class DiskCache:
+    '''Persistent second-level cache: zlib-compressed response bodies in SQLite, addressed by sha256 of the request key'''
+
+    def __init__(self, path: str, max_bytes: int, compact_interval: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compact_interval = compact_interval
+        self._db = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        db.execute('PRAGMA journal_mode = WAL')
+        db.execute('PRAGMA synchronous = NORMAL')
+        db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                   'digest BLOB PRIMARY KEY, path TEXT NOT NULL, expires_at REAL NOT NULL, '
+                   'size INTEGER NOT NULL, body BLOB NOT NULL, validators TEXT) WITHOUT ROWID')
+        if 'validators' not in {row[1] for row in db.execute('PRAGMA table_info(responses)')}:
+            db.execute('ALTER TABLE responses ADD COLUMN validators TEXT')  # caches written before revalidation
+        db.execute('CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)')
+        return db
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._connect()
+                    if self.compact_interval > 0:
+                        threading.Thread(target=self._compact_forever, name='disk-cache-compactor', daemon=True).start()
+        return self._db
+
+    @staticmethod
+    def digest(key: str) -> bytes:
+        return hashlib.sha256(key.encode()).digest()
+
+    def get(self, key: str, stale_for: float = 0.0):
+        '''Return (raw body, seconds left) for a fresh entry, or one expired less than `stale_for` seconds ago, or None'''
+        row = self._conn().execute('SELECT expires_at, body FROM responses WHERE digest = ?', (self.digest(key),)).fetchone()
+        if row is None:
+            return None
+        remaining = row[0] - time.time()
+        if remaining <= -stale_for:
+            return None
+        return zlib.decompress(row[1]), remaining
+
+    def put(self, key: str, path: str, content: bytes, ttl: float, validators=None):
+        body = zlib.compress(content, 6)
+        with self._lock:
+            self._conn().execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                                 (self.digest(key), path, time.time() + ttl, len(body), body,
+                                  json.dumps(validators) if validators else None))
+
+    def held(self, key: str):
+        '''Return (raw body, conditional request headers) of an entry kept with validators, fresh or not, or None'''
+        row = self._conn().execute('SELECT body, validators FROM responses WHERE digest = ? AND validators IS NOT NULL',
+                                   (self.digest(key),)).fetchone()
+        return (zlib.decompress(row[0]), json.loads(row[1])) if row else None
+
+    def renew(self, key: str, ttl: float, validators):
+        '''Start a new TTL for an entry the upstream confirmed unchanged'''
+        with self._lock:
+            self._conn().execute('UPDATE responses SET expires_at = ?, validators = ? WHERE digest = ?',
+                                 (time.time() + ttl, json.dumps(validators), self.digest(key)))
+
+    def compact(self):
+        '''Drop entries past the stale window, evict the soonest-to-expire until under the size cap, and return freed pages'''
+        db = self._conn()
+        with self._lock:
+            db.execute('DELETE FROM responses WHERE expires_at <= ?', (time.time() - stale_window,))
+            total = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - int(self.max_bytes * 0.9)
+                victims = []
+                for digest, size in db.execute('SELECT digest, size FROM responses ORDER BY expires_at'):
+                    if excess <= 0:
+                        break
+                    victims.append((digest,))
+                    excess -= size
+                db.executemany('DELETE FROM responses WHERE digest = ?', victims)
+            db.execute('PRAGMA incremental_vacuum')
+            db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _compact_forever(self):
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                self.compact()
+            except sqlite3.Error:
+                pass
+
+def _disk_cache():
+    '''The disk cache, or None when cache_dir cannot hold it: responses are then cached in memory only'''
+    cache = DiskCache(os.path.join(cache_dir, 'responses.sqlite3'), disk_cache_max_bytes, disk_cache_compact_interval)
+    try:
+        cache._conn()
+    except (OSError, sqlite3.Error):
+        return None
+    return cache
+
+disk_cache = _disk_cache() if disk_cache_enabled else None
+
+class LocalState:
+    '''Rate-limit state of a single process: its own key buckets are the whole story'''
+    name = 'memory'
+    blocking = False
+
+    def __init__(self):
+        self.stats = Counter()
+
+    def admit(self, key: str, rate: float, burst: float) -> float:
+        return 0.0
+
+    def block(self, key: str, seconds: float):
+        pass
+
+def _window(rate: float, burst: float, now: float):
+    '''Fixed window a shared key budget is counted in: (window number, calls allowed in it, seconds left in it)
+
+    A window holds `burst` calls and lasts as long as the bucket takes to refill them, so the long-run rate matches.
+    '''
+    allowed = max(burst, 1.0)
+    span = allowed / rate
+    number = math.floor(now / span)
+    return number, allowed, (number + 1) * span - now
+
+class SqliteState:
+    '''Rate-limit state shared by the worker processes on one host through a SQLite file'''
+    name = 'sqlite'
+    blocking = True  # file I/O: called from worker threads, never the event loop
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = Counter()
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = OFF')
+            db.execute('CREATE TABLE IF NOT EXISTS counters ('
+                       'name TEXT PRIMARY KEY, value REAL NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID')
+            self._db = db
+        return self._db
+
+    def admit(self, key: str, rate: float, burst: float) -> float:
+        '''Count one call against a key's shared budget; seconds until it may be retried when over it, else 0'''
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            row = db.execute('SELECT value FROM counters WHERE name = ?', (f'blocked:{key}',)).fetchone()
+            if row is not None and row[0] > now:
+                self.stats['blocked'] += 1
+                return row[0] - now
+            if not rate:
+                return 0.0
+            number, allowed, left = _window(rate, burst, now)
+            count = db.execute('INSERT INTO counters VALUES (?, 1, ?) ON CONFLICT (name) DO UPDATE SET value = value + 1 '
+                               'RETURNING value', (f'rate:{key}:{number}', now + left)).fetchone()[0]
+            if count == 1:
+                db.execute('DELETE FROM counters WHERE expires_at < ?', (now,))
+        if count > allowed:
+            self.stats['over_budget'] += 1
+            return left
+        return 0.0
+
+    def block(self, key: str, seconds: float):
+        '''Hold a throttled key back in every worker'''
+        until = time.time() + seconds
+        with self._lock:
+            self._conn().execute('INSERT INTO counters VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET '
+                                 'value = max(value, excluded.value), expires_at = max(expires_at, excluded.expires_at)',
+                                 (f'blocked:{key}', until, until))
+
+class RedisState:
+    '''Rate-limit state and the second-level response cache in a Redis-protocol server, shared by workers on any host
+
+    Every call fails open: while the server is unreachable calls are admitted and the cache misses,
+    and it is not retried for a few seconds so a dead server costs one timeout, not one per call.
+    '''
+    name = 'redis'
+    prefix = 'priceline:'
+    blocking = True  # network round trips: called from worker threads, never the event loop
+
+    def __init__(self, url: str):
+        import redis
+        # RESP2 is the dialect every Redis-protocol server speaks; redis-py 8 would otherwise open with HELLO 3.
+        self.redis = redis.Redis.from_url(url, protocol=2, socket_timeout=redis_timeout, socket_connect_timeout=redis_timeout)
+        self.errors = redis.RedisError
+        self.stats = Counter()
+        self.down_until = 0.0
+
+    def _run(self, commands):
+        '''Send (command, args...) tuples in one round trip; None when the server is unreachable'''
+        if time.monotonic() < self.down_until:
+            return None
+        pipe = self.redis.pipeline(transaction=False)
+        for command in commands:
+            pipe.execute_command(*command)
+        try:
+            return pipe.execute()
+        except self.errors:
+            self.stats['errors'] += 1
+            self.down_until = time.monotonic() + 5.0
+            return None
+
+    def admit(self, key: str, rate: float, burst: float) -> float:
+        '''Count one call against a key's shared budget; seconds until it may be retried when over it, else 0'''
+        now = time.time()
+        commands = [('GET', f'{self.prefix}blocked:{key}')]
+        if rate:
+            number, allowed, left = _window(rate, burst, now)
+            counter = f'{self.prefix}rate:{key}:{number}'
+            commands += [('INCR', counter), ('PEXPIRE', counter, int(left * 1000) + 1000)]
+        replies = self._run(commands)
+        if replies is None:
+            return 0.0
+        if replies[0] is not None and float(replies[0]) > now:
+            self.stats['blocked'] += 1
+            return float(replies[0]) - now
+        if rate and replies[1] > allowed:
+            self.stats['over_budget'] += 1
+            return left
+        return 0.0
+
+    def block(self, key: str, seconds: float):
+        '''Hold a throttled key back in every worker'''
+        self._run([('SET', f'{self.prefix}blocked:{key}', repr(time.time() + seconds), 'PX', int(seconds * 1000) + 1)])
+
+    def get(self, key: str, stale_for: float = 0.0):
+        '''Return (raw body, seconds left) for a fresh entry, or one expired less than `stale_for` seconds ago, or None'''
+        replies = self._run([('GET', self.prefix + DiskCache.digest(key).hex())])
+        if not replies or replies[0] is None:
+            return None
+        remaining = struct.unpack('<d', replies[0][:8])[0] - time.time()
+        if remaining <= -stale_for:
+            return None
+        return zlib.decompress(replies[0][8:]), remaining
+
+    def put(self, key: str, path: str, content: bytes, ttl: float, validators=None):
+        name, keep = self.prefix + DiskCache.digest(key).hex(), int((ttl + stale_window) * 1000)
+        value = struct.pack('<d', time.time() + ttl) + zlib.compress(content, 6)
+        commands = [('SET', name, value, 'PX', keep)]
+        commands.append(('SET', name + ':validators', json.dumps(validators), 'PX', keep) if validators else
+                        ('DEL', name + ':validators'))
+        self._run(commands)
+
+    def held(self, key: str):
+        '''Return (raw body, conditional request headers) of an entry kept with validators, fresh or not, or None'''
+        name = self.prefix + DiskCache.digest(key).hex()
+        replies = self._run([('GET', name), ('GET', name + ':validators')])
+        if not replies or replies[0] is None or replies[1] is None:
+            return None
+        return zlib.decompress(replies[0][8:]), json.loads(replies[1])
+
+    def renew(self, key: str, ttl: float, validators):
+        '''Start a new TTL for an entry the upstream confirmed unchanged'''
+        held = self.held(key)
+        if held is not None:
+            self.put(key, '', held[0], ttl, validators)
+
+def _shared_state(url: str):
+    '''State backend named by PRICELINE_SHARED_STATE'''
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisState(url)
+    if url.startswith('sqlite://'):
+        return SqliteState(url[len('sqlite://'):] or os.path.join(cache_dir, 'state.sqlite3'))
+    if url == 'memory':
+        return LocalState()
+    raise ValueError(f'PRICELINE_SHARED_STATE must be memory, sqlite://[/path] or redis://host[:port][/db], not {url!r}')
+
+shared_state = _shared_state(shared_state_url)
+if isinstance(shared_state, RedisState):
+    # Workers on other hosts cannot open our SQLite file, so Redis takes the second cache tier too.
+    disk_cache = shared_state
+
+# Shared state and the second cache tier block on file or network I/O, so the event loop hands it to threads:
+# reads are awaited from a worker thread, and writes queue in order on one writer thread nobody waits for.
+_tier_writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='tier-writer')
+tier_write_errors = Counter()
+
+async def _tier_read(call, *args):
+    '''Read shared state or the second cache tier from a worker thread; a failed read is a miss'''
+    try:
+        return await asyncio.to_thread(call, *args)
+    except (sqlite3.Error, OSError):
+        return None
+
+def _tier_write(call, *args):
+    '''Queue a write to shared state or the second cache tier behind the ones before it'''
+    def write():
+        try:
+            call(*args)
+        except (sqlite3.Error, OSError) as e:
+            tier_write_errors[type(e).__name__] += 1
+    _tier_writer.submit(write)
+
+def _cache_key(path: str, payload: dict) -> str:
+    '''Stable key for an upstream request: endpoint path plus the sorted, normalized query'''
+    params = []
+    for k, v in sorted(payload.items()):
+        if isinstance(v, float) and v.is_integer():
+            v = int(v)
+        params.append((k, v))
+    return f'{path}?{httpx.QueryParams(params)}'
+
+_client = None
+_client_loop = None
+_semaphore = None
+
+def _http() -> httpx.AsyncClient:
+    '''Return the process-wide pooled async HTTP client, creating it on first use in the running loop'''
+    global _client, _client_loop, _semaphore
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            http2=http2_enabled,
+            headers={'x-rapidapi-host': api_host, 'accept-encoding': accept_encoding},
+            limits=httpx.Limits(max_connections=pool_size,
+                                max_keepalive_connections=pool_keepalive,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        _semaphore = asyncio.Semaphore(max_concurrency)
+        _client_loop = loop
+    return _client
+
+def _endpoint(url: str) -> str:
+    '''Path part of an upstream url, e.g. `/v1/hotels/search`'''
+    return httpx.URL(url).path
+
+# Datasets served by the paginated (resume_key/limit) download endpoints, mirrored by `python server.py sync`.
+mirror_datasets = {
+    'airports': '/v2/flight/downloadAirports',
+    'companies': '/v2/cars/downloadCompanies',
+    'cities': '/v2/cars/downloadCities',
+    'locations': '/v2/cars/downloadLocations',
+    'property_types': '/v2/hotels/downloadPropertyTypes',
+    'hotels': '/v2/hotels/downloadHotels',
+    'areas': '/v2/hotels/downloadAreas',
+    'countries': '/v2/hotels/downloadCountries',
+    'chains': '/v2/hotels/downloadChains',
+    'amenities': '/v2/hotels/downloadAmenities',
+    'states': '/v2/hotels/downloadStates',
+    'cities_clusters': '/v2/hotels/downloadCitiesClusters',
+    'filter_amenities': '/v2/hotels/downloadFilterAmenities',
+}
+mirror_paths = set(mirror_datasets.values())
+
+# Record fields tried, in order, as the primary key of a mirrored record.
+mirror_id_fields = {
+    'airports': ('iata', 'airport_code', 'id'),
+    'companies': ('company_code', 'code', 'id'),
+    'cities': ('cityid_ppn', 'city_id', 'id'),
+    'locations': ('location_id', 'id', 'code'),
+    'property_types': ('property_type_id', 'id'),
+    'hotels': ('hotelid_ppn', 'hotel_id', 'id'),
+    'areas': ('area_id', 'id'),
+    'countries': ('country_code', 'id'),
+    'states': ('state_code', 'id'),
+    'chains': ('chain_id', 'chain_code', 'id'),
+    'amenities': ('amenity_id', 'id'),
+    'cities_clusters': ('cluster_id', 'id'),
+    'filter_amenities': ('amenity_id', 'id'),
+}
+
+mirror_serve = os.getenv('PRICELINE_MIRROR_SERVE', '1') != '0'
+index_refresh = float(os.getenv('PRICELINE_INDEX_REFRESH', '60'))
+sync_concurrency = int(os.getenv('PRICELINE_SYNC_CONCURRENCY', '4'))
+sync_page_limit = int(os.getenv('PRICELINE_SYNC_PAGE_LIMIT', '0')) or None
+sync_batch = 500  # records upserted per transaction while a page streams in
+sync_part_bytes = 256 * 1024  # compressed page bytes written per part while a page streams in
+# Seconds before a failed background sync of the companies list is retried; doubles per failure, up to an hour.
+companies_retry = float(os.getenv('PRICELINE_COMPANIES_RETRY', '60'))
+
+class Mirror:
+    '''Local SQLite mirror of the download_* datasets: raw pages for serving tools, records for local indexes'''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._lock = threading.RLock()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    db.execute('PRAGMA journal_mode = WAL')
+                    db.execute('PRAGMA synchronous = NORMAL')
+                    db.execute('CREATE TABLE IF NOT EXISTS pages ('
+                               'digest BLOB PRIMARY KEY, dataset TEXT NOT NULL, body BLOB NOT NULL) WITHOUT ROWID')
+                    # Pages are written as they stream in, in parts; a staged part (part < 0) is not served.
+                    db.execute('CREATE TABLE IF NOT EXISTS page_parts ('
+                               'digest BLOB NOT NULL, part INTEGER NOT NULL, dataset TEXT NOT NULL, body BLOB NOT NULL, '
+                               'synced_at REAL, PRIMARY KEY (digest, part)) WITHOUT ROWID')
+                    if 'synced_at' not in {row[1] for row in db.execute('PRAGMA table_info(page_parts)')}:
+                        db.execute('ALTER TABLE page_parts ADD COLUMN synced_at REAL')  # mirrors written before it
+                    db.execute('CREATE TABLE IF NOT EXISTS records ('
+                               'dataset TEXT NOT NULL, record_id TEXT NOT NULL, body TEXT NOT NULL, '
+                               'PRIMARY KEY (dataset, record_id)) WITHOUT ROWID')
+                    db.execute('CREATE TABLE IF NOT EXISTS sync_state ('
+                               'dataset TEXT PRIMARY KEY, resume_key TEXT, changes_since TEXT, started_at TEXT, '
+                               'completed_at TEXT, pages INTEGER NOT NULL DEFAULT 0, records INTEGER NOT NULL DEFAULT 0)')
+                    self._db = db
+        return self._db
+
+    def available(self) -> bool:
+        return self._db is not None or os.path.exists(self.path)
+
+    def page(self, key: str, ttl: float):
+        '''Raw body of a mirrored page for this request key, or None when there is none still current
+
+        A page is current while it is younger than `ttl`, or when it was written by its dataset's last
+        completed sync: a page that sync did not fetch again, e.g. a full-walk page of `hotels` after an
+        incremental sync, ages out and is asked for upstream. Pages without a sync time are never served.
+        '''
+        if not mirror_serve or not self.available():
+            return None
+        rows = self._conn().execute(
+            'SELECT p.body, p.synced_at, s.started_at, s.completed_at FROM page_parts p '
+            'LEFT JOIN sync_state s ON s.dataset = p.dataset WHERE p.digest = ? AND p.part >= 0 ORDER BY p.part',
+            (DiskCache.digest(key),)).fetchall()
+        if not rows or rows[0][1] is None:
+            return None
+        _, synced_at, started_at, completed_at = rows[0]
+        if time.time() - synced_at >= ttl and not (
+                completed_at and synced_at >= datetime.fromisoformat(started_at).timestamp()):
+            return None
+        unpacker = zlib.decompressobj()
+        return b''.join(unpacker.decompress(body) for body, *_ in rows) + unpacker.flush()
+
+    def state(self, dataset: str):
+        row = self._conn().execute('SELECT resume_key, changes_since, started_at, completed_at, pages, records '
+                                   'FROM sync_state WHERE dataset = ?', (dataset,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('resume_key', 'changes_since', 'started_at', 'completed_at', 'pages', 'records'), row))
+
+    def start(self, dataset: str, changes_since, started_at: str):
+        with self._lock:
+            self._conn().execute('INSERT OR REPLACE INTO sync_state VALUES (?, NULL, ?, ?, NULL, 0, 0)',
+                                 (dataset, changes_since, started_at))
+
+    def save_records(self, dataset: str, records: list) -> int:
+        '''Upsert a batch of records in one transaction; safe to repeat when a page is fetched again'''
+        rows = [(dataset, _record_id(dataset, record), json.dumps(record, separators=(',', ':'))) for record in records]
+        with self._lock:
+            db = self._conn()
+            db.execute('BEGIN')
+            try:
+                db.executemany('INSERT OR REPLACE INTO records VALUES (?, ?, ?)', rows)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+    def stage_part(self, dataset: str, key: str, part: int, body: bytes):
+        '''Write the next part of a zlib-compressed page; it is not served until save_page publishes it'''
+        digest = DiskCache.digest(key)
+        with self._lock:
+            db = self._conn()
+            if part == 0:  # parts left behind by a page that was cut off
+                db.execute('DELETE FROM page_parts WHERE digest = ? AND part < 0', (digest,))
+            db.execute('INSERT OR REPLACE INTO page_parts VALUES (?, ?, ?, ?, NULL)', (digest, -part - 1, dataset, body))
+
+    def save_page(self, dataset: str, key: str, records: int, resume_key):
+        '''Publish the staged parts of a page in place of its last copy and advance the resume point, atomically'''
+        digest = DiskCache.digest(key)
+        with self._lock:
+            db = self._conn()
+            db.execute('BEGIN')
+            try:
+                db.execute('DELETE FROM pages WHERE digest = ?', (digest,))
+                db.execute('DELETE FROM page_parts WHERE digest = ? AND part >= 0', (digest,))
+                db.execute('UPDATE page_parts SET part = -part - 1, synced_at = ? WHERE digest = ? AND part < 0',
+                           (time.time(), digest))
+                db.execute('UPDATE sync_state SET resume_key = ?, pages = pages + 1, records = records + ? '
+                           'WHERE dataset = ?', (resume_key, records, dataset))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+    def complete(self, dataset: str):
+        with self._lock:
+            self._conn().execute('UPDATE sync_state SET resume_key = NULL, completed_at = ? WHERE dataset = ?',
+                                 (_utcnow(), dataset))
+
+    def records(self, dataset: str):
+        '''Iterate the mirrored records of a dataset'''
+        if not self.available():
+            return
+        for (body,) in self._conn().execute('SELECT body FROM records WHERE dataset = ?', (dataset,)):
+            yield json.loads(body)
+
+mirror = Mirror(os.path.join(cache_dir, 'mirror.sqlite3'))
+
+def _utcnow() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+def _record_id(dataset: str, record: dict) -> str:
+    for field in mirror_id_fields.get(dataset, ('id',)):
+        if record.get(field) not in (None, ''):
+            return str(record[field])
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+_json = json.JSONDecoder()
+_space = re.compile(r'[ \t\n\r]*')
+_number_tail = re.compile(r'[0-9.eE+-]*')  # what may still follow a number cut at a chunk boundary
+
+class PageDecoder:
+    '''Incremental decoder for a download_* page that hands back each record as soon as it is complete
+
+    Download responses wrap a `results` object holding a `resume_key` and one collection of records,
+    either a list or a dict keyed `airport_0`, `airport_1`, ... Only those wrappers are walked here;
+    each record, like every other value, is parsed whole by the json scanner, so the buffer holds one
+    record plus one network chunk at most. Scalars of `results` are kept in `meta`.
+    '''
+
+    def __init__(self):
+        self.meta = {}
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._stack = []  # [role, is object, state, current key] per open container
+        self._started = False
+        self._collected = False
+        self._retry = 0  # buffer length worth another attempt at an incomplete value
+        self._records = []
+
+    def feed(self, chunk: bytes) -> list:
+        '''Take the next chunk of the body; return the records completed by it'''
+        self._buf += self._text.decode(chunk)
+        return self._drain(False)
+
+    def close(self) -> list:
+        '''Finish the body; return the last records or raise ValueError if it is cut short'''
+        self._buf += self._text.decode(b'', final=True)
+        records = self._drain(True)
+        if self._stack or not self._started:
+            raise ValueError('download page ended before its JSON did')
+        if not self._collected:
+            raise ValueError(f'download page holds no collection of records, e.g. an error answer: {self.meta}')
+        return records
+
+    def _drain(self, final: bool) -> list:
+        if not final and len(self._buf) < self._retry:
+            return []
+        buf, pos, stack = self._buf, 0, self._stack
+        self._retry = 0
+        try:
+            while True:
+                pos = _space.match(buf, pos).end()
+                if pos == len(buf):
+                    break
+                c = buf[pos]
+                if not stack:
+                    if self._started or c != '{':
+                        raise ValueError(f'unexpected {c!r} in download page')
+                    self._started = True
+                    stack.append(['wrapper', True, 'first', None])
+                    pos += 1
+                    continue
+                frame = stack[-1]
+                role, is_object, state, key = frame
+                if state in ('first', 'after') and c == ('}' if is_object else ']'):
+                    stack.pop()
+                    if stack:
+                        stack[-1][2] = 'after'
+                    pos += 1
+                elif state == 'after':
+                    if c != ',':
+                        raise ValueError(f'unexpected {c!r} in download page')
+                    frame[2] = 'next'
+                    pos += 1
+                elif is_object and state in ('first', 'next'):
+                    key, end = self._value(buf, pos, final)
+                    if end is None:
+                        break
+                    if not isinstance(key, str):
+                        raise ValueError(f'unexpected {key!r} in download page')
+                    frame[2:] = ['colon', key]
+                    pos = end
+                elif state == 'colon':
+                    if c != ':':
+                        raise ValueError(f'unexpected {c!r} in download page')
+                    frame[2] = 'value'
+                    pos += 1
+                elif (child := self._child(frame, c)) is not None:
+                    stack.append([child, c == '{', 'first', None])
+                    pos += 1
+                else:
+                    value, end = self._value(buf, pos, final)
+                    if end is None:
+                        break
+                    if role == 'collection':
+                        if isinstance(value, dict):
+                            self._records.append(value)
+                    elif role == 'results':
+                        self.meta[key] = value
+                    frame[2] = 'after'
+                    pos = end
+        finally:
+            self._buf = buf[pos:]
+        records, self._records = self._records, []
+        return records
+
+    def _child(self, frame: list, c: str):
+        '''Role of a container opening here if it is walked rather than parsed whole, else None'''
+        role, is_object, _, key = frame
+        if c == '{' and role == 'wrapper' and is_object:
+            if key == 'results':
+                return 'results'
+            if len(self._stack) < 3:
+                return 'wrapper'
+        if c in '{[' and role == 'results' and not self._collected:
+            self._collected = True
+            return 'collection'
+        return None
+
+    def _value(self, buf: str, pos: int, final: bool) -> tuple:
+        '''Parse the value at pos, or return (None, None) and wait for more of it
+
+        A number is only whole once a delimiter follows it: `0.` at the end of a chunk parses as 0, so a
+        number followed by nothing but what could continue it waits too. After a failed attempt the
+        next one waits for the pending text to double, which keeps a huge value linear.
+        '''
+        try:
+            value, end = _json.raw_decode(buf, pos)
+        except ValueError:
+            if final:
+                raise
+            self._retry = 2 * (len(buf) - pos)
+            return None, None
+        if not final and (end == len(buf) or isinstance(value, (int, float)) and not isinstance(value, bool)
+                          and _number_tail.match(buf, end).end() == len(buf)):
+            self._retry = len(buf) - pos + 1
+            return None, None
+        return value, end
+
+async def _sync_page(dataset: str, path: str, payload: dict) -> tuple:
+    '''Stream one download_* page into the mirror; return (records stored, next resume_key)
+
+    Records are upserted in batches as they are decoded, and the compressed page is staged in parts of
+    sync_part_bytes, so memory holds one batch and one part whatever the page size. The page is published
+    with its resume point at the end: a page cut off midway is fetched again by the next sync, and its
+    records overwrite themselves.
+    '''
+    response = await _fetch(path, payload, priority='bulk', stream=True)
+    decoder, packer, key = PageDecoder(), zlib.compressobj(6), _cache_key(path, payload)
+    packed, parts, batch, count, received = bytearray(), 0, [], 0, 0
+    streamed = not response.is_closed  # buffered answers (errors, replays) were counted by _send
+    try:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            packed += packer.compress(chunk)
+            if len(packed) >= sync_part_bytes:
+                mirror.stage_part(dataset, key, parts, bytes(packed))
+                packed, parts = bytearray(), parts + 1
+            batch += decoder.feed(chunk)
+            if len(batch) >= sync_batch:
+                count += mirror.save_records(dataset, batch)
+                batch = []
+        batch += decoder.close()
+    finally:
+        await response.aclose()
+        if streamed:
+            telemetry.received(path, received, response.num_bytes_downloaded)
+    count += mirror.save_records(dataset, batch)
+    mirror.stage_part(dataset, key, parts, bytes(packed + packer.flush()))
+    next_key = decoder.meta.get('resume_key') or None
+    mirror.save_page(dataset, key, count, next_key)
+    return count, next_key
+
+async def sync_dataset(dataset: str, full: bool = False) -> dict:
+    '''Walk every page of one download_* dataset into the mirror
+
+    An interrupted sync continues from its last stored resume_key. Once `hotels` has completed a
+    full walk, later syncs only fetch hotels changed since the previous sync started.
+    '''
+    path = mirror_datasets[dataset]
+    state = mirror.state(dataset)
+    if state and not state['completed_at'] and state['resume_key'] and not full:
+        resume_key, changes_since = state['resume_key'], state['changes_since']
+    else:
+        resume_key = None
+        changes_since = state['started_at'] if dataset == 'hotels' and state and state['completed_at'] and not full else None
+        mirror.start(dataset, changes_since, _utcnow())
+    while True:
+        payload = {'resume_key': resume_key, 'limit': sync_page_limit, 'changes_since': changes_since}
+        payload = {k: v for k, v in payload.items() if v is not None}
+        count, next_key = await _sync_page(dataset, path, payload)
+        if not next_key or not count or next_key == resume_key:
+            break
+        resume_key = next_key
+    mirror.complete(dataset)
+    return mirror.state(dataset)
+
+async def sync_mirror(datasets=None, full: bool = False) -> dict:
+    '''Sync several datasets concurrently, at most PRICELINE_SYNC_CONCURRENCY at a time'''
+    gate = asyncio.Semaphore(sync_concurrency)
+
+    async def one(dataset):
+        async with gate:
+            try:
+                return dataset, await sync_dataset(dataset, full)
+            except (httpx.HTTPError, ValueError) as e:
+                return dataset, {'error': repr(e)}
+
+    return dict(await asyncio.gather(*(one(d) for d in datasets or mirror_datasets)))
+
+# Mirrored datasets indexed for offline location resolution, and the kind reported for each.
+location_kinds = {'airports': 'AIRPORT', 'cities': 'CITY', 'locations': 'LOCATION'}
+location_name_fields = ('name', 'airport', 'airport_name', 'city', 'city_name', 'location_name', 'display_name')
+location_code_fields = ('iata', 'airport_code', 'iata_code', 'code')
+shortlist_length = 3  # queries this short match the most names; their best matches are kept per query
+shortlist_size = 50
+shortlist_queries = 16384
+
+def _normalize(text: str) -> str:
+    '''Lowercase, strip accents and punctuation, collapse whitespace'''
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in text).split())
+
+def _trigrams(text: str) -> set:
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class LocationIndex:
+    '''In-process index over mirrored airports, cities and car rental locations
+
+    Prefix lookups bisect a sorted array of every name suffix starting at a word boundary (so `york`
+    finds "New York") plus codes and score the whole matching range; the best matches of short queries,
+    whose ranges are the longest, are kept per query. Fuzzy lookups score trigram overlap and only run
+    when no prefix matches.
+    '''
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        keys = []
+        self.trigrams = defaultdict(list)
+        for i, entry in enumerate(entries):
+            tokens = entry['_norm'].split()
+            for offset in range(len(tokens)):
+                keys.append((' '.join(tokens[offset:]), i, offset))
+            if entry['code']:
+                keys.append((entry['code'].lower(), i, -1))
+            for gram in entry['_grams']:
+                self.trigrams[gram].append(i)
+        keys.sort()
+        self.keys = [k[0] for k in keys]
+        self.refs = [(k[1], k[2]) for k in keys]
+        self.shortlists = {}  # (query, kinds) -> (size, best (entry, score) pairs), for queries of up to shortlist_length
+
+    @classmethod
+    def from_records(cls, records_by_dataset: dict) -> 'LocationIndex':
+        entries = []
+        for dataset, records in records_by_dataset.items():
+            for record in records:
+                name = next((record[f] for f in location_name_fields if record.get(f)), None)
+                if not name:
+                    continue
+                code = next((str(record[f]) for f in location_code_fields if record.get(f)), None)
+                norm = _normalize(name)
+                entries.append({'kind': location_kinds.get(dataset, dataset.upper()), 'id': _record_id(dataset, record),
+                                'name': name, 'code': code, 'record': record, '_norm': norm, '_grams': _trigrams(norm)})
+        return cls(entries)
+
+    def _prefix(self, query: str, kinds) -> dict:
+        scores = {}
+        lo = bisect.bisect_left(self.keys, query)
+        hi = bisect.bisect_left(self.keys, query + '\uffff', lo)
+        for key, (i, offset) in zip(self.keys[lo:hi], self.refs[lo:hi]):
+            if kinds and self.entries[i]['kind'] not in kinds:
+                continue
+            if offset == -1:
+                score = 4.0 if key == query else 2.5
+            elif key == query:
+                score = 3.0 if offset == 0 else 1.5
+            else:
+                score = (2.0 if offset == 0 else 1.0) + len(query) / len(self.entries[i]['_norm'])
+            if score > scores.get(i, 0):
+                scores[i] = score
+        return scores
+
+    def _fuzzy(self, query: str, threshold: float = 0.35) -> dict:
+        grams = _trigrams(query)
+        # Any entry within the Jaccard threshold shares at least `needed` grams with the query, so it must
+        # appear in one of the rarest len(grams) - needed + 1 posting lists; only those generate candidates.
+        needed = math.ceil(threshold * len(grams))
+        rarest = sorted(grams, key=lambda gram: len(self.trigrams.get(gram, ())))[:len(grams) - needed + 1]
+        candidates = set()
+        for gram in rarest:
+            candidates.update(self.trigrams.get(gram, ()))
+        # Jaccard >= threshold also bounds the entry's gram count relative to the query's.
+        low, high = threshold * len(grams), len(grams) / threshold
+        scores = {}
+        for i in candidates:
+            entry_grams = self.entries[i]['_grams']
+            if not low <= len(entry_grams) <= high:
+                continue
+            shared = len(grams & entry_grams)
+            score = shared / (len(grams) + len(entry_grams) - shared)
+            if score >= threshold:
+                scores[i] = score
+        return scores
+
+    def search(self, name: str, kinds=None, limit: int = 10) -> list:
+        query = _normalize(name)
+        if not query:
+            return []
+        kinds = tuple(sorted(kinds)) if kinds else None
+        short = len(query) <= shortlist_length
+        kept = self.shortlists.get((query, kinds)) if short else None
+        if kept is not None and kept[0] >= limit:
+            best = kept[1]
+        else:
+            size = max(limit, shortlist_size) if short else limit
+            scores = self._prefix(query, kinds)
+            if not scores:
+                scores = self._fuzzy(query)
+                if kinds:
+                    scores = {i: s for i, s in scores.items() if self.entries[i]['kind'] in kinds}
+            # Ties favour cities over airports over other kinds, then shorter names, as upstream does.
+            kind_rank = {'CITY': 0, 'AIRPORT': 1}
+            best = heapq.nsmallest(size, scores.items(), key=lambda item: (
+                -item[1], kind_rank.get(self.entries[item[0]]['kind'], 2), len(self.entries[item[0]]['_norm'])))
+            if short:
+                if len(self.shortlists) >= shortlist_queries:
+                    self.shortlists.clear()
+                self.shortlists[(query, kinds)] = (size, best)
+        return [{'kind': self.entries[i]['kind'], 'id': self.entries[i]['id'], 'name': self.entries[i]['name'],
+                 'code': self.entries[i]['code'], 'score': round(score, 3), 'record': self.entries[i]['record']}
+                for i, score in best[:limit]]
+
+_indexes = {}  # name -> [index, mirror version, last checked]
+
+def _mirror_index(name: str, datasets, build):
+    '''Index built from mirrored datasets, rebuilt when a newer sync of any of them has completed'''
+    now = time.monotonic()
+    slot = _indexes.get(name)
+    if slot is None or now - slot[2] > index_refresh:
+        version = tuple((mirror.state(d) or {}).get('completed_at') for d in datasets) if mirror.available() else None
+        if slot is None or version != slot[1]:
+            slot = _indexes[name] = [build({d: mirror.records(d) for d in datasets}), version, now]
+        slot[2] = now
+    return slot[0]
+
+def location_index() -> LocationIndex:
+    return _mirror_index('locations', location_kinds, LocationIndex.from_records)
+
+# Mirrored datasets with coordinates indexed for proximity queries, and the kind reported for each.
+geo_kinds = {'hotels': 'HOTEL', 'cities': 'CITY', 'airports': 'AIRPORT'}
+geo_cell_degrees = float(os.getenv('PRICELINE_GEO_CELL_DEGREES', '0.25'))
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.05
+
+def _coordinate(record: dict, fields):
+    for field in fields:
+        try:
+            return float(record[field])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+class GeoIndex:
+    '''Grid index over mirrored hotel, city and airport coordinates with vectorized haversine (NumPy)
+
+    Points are sorted by grid cell so each cell is one contiguous slice; a query gathers the slices
+    covering its bounding box and computes exact distances for those candidates in one array operation.
+    '''
+
+    def __init__(self, kinds: list, ids: list, names: list, lat: list, lon: list, cell: float = geo_cell_degrees):
+        import numpy as np
+        self.np = np
+        self.cell = cell
+        self.rows = int(math.ceil(180 / cell)) + 1
+        self.cols = int(math.ceil(360 / cell))
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        cell_ids = self._cell_row(lat) * self.cols + self._cell_col(lon)
+        order = np.argsort(cell_ids, kind='stable')
+        self.lat = np.radians(lat[order])
+        self.lon = np.radians(lon[order])
+        self.kinds = np.asarray(kinds, dtype=object)[order] if kinds else np.empty(0, dtype=object)
+        self.ids = [ids[i] for i in order]
+        self.names = [names[i] for i in order]
+        sorted_cells = cell_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]]) if len(order) else np.empty(0, int)
+        ends = np.r_[starts[1:], len(order)]
+        self.slices = {int(c): (int(a), int(b)) for c, a, b in zip(sorted_cells[starts], starts, ends)}
+
+    @classmethod
+    def from_records(cls, records_by_dataset: dict) -> 'GeoIndex':
+        kinds, ids, names, lat, lon = [], [], [], [], []
+        for dataset, records in records_by_dataset.items():
+            for record in records:
+                y = _coordinate(record, ('latitude', 'lat'))
+                x = _coordinate(record, ('longitude', 'lon', 'lng'))
+                if y is None or x is None or not (-90 <= y <= 90 and -180 <= x <= 180):
+                    continue
+                kinds.append(geo_kinds.get(dataset) or location_kinds.get(dataset, dataset.upper()))
+                ids.append(_record_id(dataset, record))
+                names.append(next((record[f] for f in ('hotel_name', 'name') + location_name_fields if record.get(f)), None))
+                lat.append(y)
+                lon.append(x)
+        return cls(kinds, ids, names, lat, lon)
+
+    def _cell_row(self, lat):
+        return self.np.clip(self.np.floor((lat + 90) / self.cell), 0, self.rows - 1).astype(self.np.int64)
+
+    def _cell_col(self, lon):
+        return self.np.floor((lon + 180) / self.cell).astype(self.np.int64) % self.cols
+
+    def _candidates(self, lat: float, lon: float, miles: float):
+        '''Indices of every point in the grid cells covering a `miles` box around (lat, lon)'''
+        np = self.np
+        dlat = miles / MILES_PER_DEGREE
+        row_lo, row_hi = (int(r) for r in self._cell_row(np.array([lat - dlat, lat + dlat])))
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        dlon = miles / (MILES_PER_DEGREE * cos_lat)
+        if dlon >= 180:
+            cols = range(self.cols)
+        else:
+            first, last = (int(c) for c in np.floor((np.array([lon - dlon, lon + dlon]) + 180) / self.cell))
+            cols = [c % self.cols for c in range(first, last + 1)]
+        spans = [self.slices[key] for row in range(row_lo, row_hi + 1)
+                 for key in (row * self.cols + col for col in cols) if key in self.slices]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(a, b) for a, b in spans])
+
+    def _distances(self, lat: float, lon: float, idx):
+        np = self.np
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        lat2, lon2 = self.lat[idx], self.lon[idx]
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def _select(self, idx, dist, kinds, limit):
+        np = self.np
+        if kinds:
+            keep = np.isin(self.kinds[idx], list(kinds))
+            idx, dist = idx[keep], dist[keep]
+        if limit is not None and len(dist) > limit:
+            part = np.argpartition(dist, limit - 1)[:limit]
+            idx, dist = idx[part], dist[part]
+        order = np.argsort(dist, kind='stable')
+        return idx[order], dist[order]
+
+    def within(self, points, miles: float, kinds=None, limit=None) -> list:
+        '''For each (lat, lon) point, the indexed places within `miles`, nearest first'''
+        results = []
+        for lat, lon in points:
+            idx = self._candidates(lat, lon, miles)
+            dist = self._distances(lat, lon, idx)
+            inside = dist <= miles
+            results.append(self._select(idx[inside], dist[inside], kinds, limit))
+        return results
+
+    def nearest(self, points, k: int, kinds=None, max_miles: float = 12500) -> list:
+        '''For each (lat, lon) point, the `k` nearest indexed places, widening the search box until they are exact'''
+        results = []
+        for lat, lon in points:
+            miles = max(self.cell * MILES_PER_DEGREE, 1.0)
+            while True:
+                idx = self._candidates(lat, lon, miles)
+                dist = self._distances(lat, lon, idx)
+                inside = dist <= miles
+                idx, dist = self._select(idx[inside], dist[inside], kinds, k)
+                if len(idx) >= k or miles >= max_miles:
+                    break
+                miles *= 4
+            results.append((idx, dist))
+        return results
+
+    def describe(self, idx, dist) -> list:
+        return [{'kind': self.kinds[i], 'id': self.ids[i], 'name': self.names[i], 'distance_miles': round(float(d), 3),
+                 'latitude': round(math.degrees(self.lat[i]), 6), 'longitude': round(math.degrees(self.lon[i]), 6)}
+                for i, d in zip(idx.tolist(), dist.tolist())]
+
+def geo_index() -> GeoIndex:
+    return _mirror_index('geo', geo_kinds, GeoIndex.from_records)
+
+def rental_location_index() -> GeoIndex:
+    return _mirror_index('rental_locations', ('locations',), GeoIndex.from_records)
+
+_companies_sync = None
+_companies_failures = 0
+_companies_retry_at = 0.0
+
+def company_table() -> dict:
+    '''Rental company code -> mirrored download_companies record
+
+    Never waits on the upstream: until the small dataset has synced this returns what the mirror holds, possibly
+    nothing, and starts the sync in the background. A failed sync is retried after `companies_retry` seconds,
+    doubling per consecutive failure.
+    '''
+    global _companies_sync
+    state = mirror.state('companies') if mirror.available() else None
+    if not (state and state['completed_at']) and _companies_sync is None and time.monotonic() >= _companies_retry_at:
+        _companies_sync = asyncio.ensure_future(sync_dataset('companies'))
+        _companies_sync.add_done_callback(_companies_synced)
+    if state is None:
+        return {}
+    return _mirror_index('companies', ('companies',),
+                         lambda records: {_record_id('companies', r): r for r in records['companies']})
+
+def _companies_synced(task: asyncio.Task):
+    global _companies_sync, _companies_failures, _companies_retry_at
+    _companies_sync = None
+    if task.cancelled() or task.exception() is not None:
+        _companies_failures += 1
+        _companies_retry_at = time.monotonic() + min(companies_retry * 2 ** (_companies_failures - 1), HOUR)
+    else:
+        _companies_failures, _companies_retry_at = 0, 0.0
+        _indexes.pop('companies', None)
+
+class KeyBucket:
+    '''Token bucket and last reported RapidAPI quota for one API key'''
+    def __init__(self, spec: str):
+        key, _, limits = spec.partition(':')
+        rate, _, burst = limits.partition(':')
+        self.key = key
+        self.shared_key = hashlib.sha256(key.encode()).hexdigest()[:16]  # the key itself never leaves the process
+        self.rate = float(rate) if rate else rate_per_second
+        self.burst = float(burst) if burst else max(rate_burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.limit = self.remaining = self.reset_at = None
+        self.stats = Counter()
+
+    def refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.reset_at is not None and now >= self.reset_at:
+            self.remaining = self.reset_at = None
+
+    def allows(self, priority: str) -> bool:
+        '''Whether the quota left on this key may be spent on a call of this class'''
+        if self.remaining is None:
+            return True
+        reserve = 0 if priority == 'interactive' else quota_reserve * (self.limit or 0)
+        return self.remaining > reserve
+
+    def ready_in(self, priority: str, now: float) -> float:
+        '''Seconds until this key can serve a call of this class'''
+        if not self.allows(priority):
+            return self.reset_at - now if self.reset_at is not None else 60.0
+        wait = max(0.0, self.blocked_until - now)
+        if self.rate and self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+def _retry_after(value) -> float:
+    '''Seconds from a Retry-After header holding either delta-seconds or an HTTP date'''
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, (email.utils.parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return 1.0
+
+class Ticket:
+    '''Class of one upstream request, which rises when a more urgent caller joins it, also while it is queued'''
+    __slots__ = ('priority', 'entries')
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.entries = []  # its queue entries; a hedged request has two
+
+class Scheduler:
+    '''Hands out API keys to upstream calls within each key's rate and quota, most urgent class first
+
+    Waiters queue in a heap ordered by (priority, arrival). Only the head of the queue polls the
+    buckets; when it is served it wakes the next head, so bulk work never jumps interactive calls.
+    A waiter promoted to a more urgent class moves up the heap and keeps its arrival.
+    '''
+    def __init__(self, specs):
+        self.buckets = [KeyBucket(spec) for spec in specs]
+        self.waiting = []
+        self.arrivals = 0
+        self.depth = Counter()
+        self.waits = defaultdict(Counter)
+
+    async def _take(self, priority: str, now: float):
+        ready = []
+        for bucket in self.buckets:
+            bucket.refill(now)
+            if bucket.blocked_until > now or not bucket.allows(priority) or (bucket.rate and bucket.tokens < 1):
+                continue
+            ready.append(bucket)
+        # Other workers spend the same keys, so the shared state has the last word; fullest bucket first.
+        for best in sorted(ready, key=lambda bucket: -bucket.tokens):
+            if shared_state.blocking:
+                wait = await asyncio.to_thread(shared_state.admit, best.shared_key, best.rate, best.burst)
+            else:
+                wait = shared_state.admit(best.shared_key, best.rate, best.burst)
+            if wait > 0:
+                best.blocked_until = now + wait
+                best.stats['shared_waits'] += 1
+                continue
+            if best.rate:
+                best.tokens -= 1
+            best.stats['requests'] += 1
+            if best.remaining is not None:
+                best.remaining -= 1
+            return best
+        return None
+
+    def _wake_head(self):
+        if self.waiting:
+            self.waiting[0][2].set()
+
+    def _served(self, priority: str, waited: float):
+        waits = self.waits[priority]
+        waits['calls'] += 1
+        waits['seconds'] += waited
+        waits['max_seconds'] = max(waits['max_seconds'], waited)
+
+    async def acquire(self, priority='interactive') -> KeyBucket:
+        '''Wait for a key that may serve one call of this class, or of this Ticket's class, and spend a token on it'''
+        ticket = priority if isinstance(priority, Ticket) else Ticket(priority)
+        start = time.monotonic()
+        if not self.waiting:
+            bucket = await self._take(ticket.priority, start)
+            if bucket is not None:
+                self._served(ticket.priority, 0.0)
+                return bucket
+        entry = [priorities[ticket.priority], self.arrivals, asyncio.Event()]
+        self.arrivals += 1
+        heapq.heappush(self.waiting, entry)
+        ticket.entries.append(entry)
+        self.depth[ticket.priority] += 1
+        try:
+            while True:
+                if self.waiting[0] is entry:
+                    now = time.monotonic()
+                    bucket = await self._take(ticket.priority, now)
+                    if bucket is not None:
+                        self._served(ticket.priority, now - start)
+                        return bucket
+                    delay = min(bucket.ready_in(ticket.priority, now) for bucket in self.buckets)
+                    try:
+                        await asyncio.wait_for(entry[2].wait(), max(delay, 0.001))
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await entry[2].wait()
+                entry[2].clear()
+        finally:
+            self.depth[ticket.priority] -= 1
+            ticket.entries.remove(entry)
+            head = self.waiting[0] is entry
+            self.waiting.remove(entry)
+            heapq.heapify(self.waiting)
+            if head:
+                self._wake_head()
+
+    def promote(self, ticket: Ticket, priority: str) -> bool:
+        '''Raise a request to a more urgent class, moving its queued entries up; False when it is urgent enough'''
+        if priorities[priority] >= priorities[ticket.priority]:
+            return False
+        for entry in ticket.entries:
+            self.depth[ticket.priority] -= 1
+            self.depth[priority] += 1
+            entry[0] = priorities[priority]
+        ticket.priority = priority
+        if ticket.entries:
+            heapq.heapify(self.waiting)
+            self._wake_head()
+        return True
+
+    def observe(self, bucket: KeyBucket, response: httpx.Response):
+        '''Record the quota headers of a response and back the key off when upstream throttles it'''
+        headers, now = response.headers, time.monotonic()
+        remaining = headers.get('x-ratelimit-requests-remaining')
+        if remaining is not None and remaining.isdigit():
+            bucket.remaining = int(remaining)
+            limit, reset = headers.get('x-ratelimit-requests-limit'), headers.get('x-ratelimit-requests-reset')
+            bucket.limit = int(limit) if limit and limit.isdigit() else bucket.limit
+            bucket.reset_at = now + float(reset) if reset and reset.isdigit() else bucket.reset_at
+        if response.status_code == 429 or 'retry-after' in headers:
+            delay = _retry_after(headers.get('retry-after'))
+            bucket.blocked_until = max(bucket.blocked_until, now + delay)
+            if shared_state.blocking:
+                _tier_write(shared_state.block, bucket.shared_key, delay)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.stats['throttled'] += 1
+            self._wake_head()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            'shared_state': {'backend': shared_state.name, **shared_state.stats},
+            'queued': {name: self.depth[name] for name in priorities},
+            'waits': {name: {'calls': w['calls'], 'mean_ms': round(w['seconds'] / w['calls'] * 1000, 3) if w['calls'] else 0.0,
+                             'max_ms': round(w['max_seconds'] * 1000, 3)}
+                      for name, w in self.waits.items()},
+            'keys': [{'key': f'...{b.key[-4:]}' if b.key else None, 'per_second': b.rate, 'burst': b.burst,
+                      'tokens': round(b.tokens, 2), 'quota_limit': b.limit, 'quota_remaining': b.remaining,
+                      'quota_reset_in': round(b.reset_at - now, 1) if b.reset_at is not None else None,
+                      'blocked_for': round(max(0.0, b.blocked_until - now), 3), **b.stats}
+                     for b in self.buckets],
+        }
+
+scheduler = Scheduler(rapid_api_keys)
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style.
+latency_buckets = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+metrics_file = os.getenv('PRICELINE_METRICS_FILE')
+metrics_interval = float(os.getenv('PRICELINE_METRICS_INTERVAL', '15'))
+
+class Histogram:
+    '''Fixed-bucket latency histogram: one bisect and three adds per observation'''
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(latency_buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(latency_buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        '''Estimate by linear interpolation inside the bucket holding the q-th observation'''
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = latency_buckets[i - 1] if i else 0.0
+                upper = latency_buckets[min(i, len(latency_buckets) - 1)]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return 0.0
+
+    def summary(self) -> dict:
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {'count': self.count, 'mean_ms': ms(self.sum / self.count) if self.count else 0.0,
+                'p50_ms': ms(self.quantile(0.5)), 'p95_ms': ms(self.quantile(0.95)), 'p99_ms': ms(self.quantile(0.99))}
+
+class Telemetry:
+    '''Counters and latency histograms for tool calls and upstream requests
+
+    Upstream phases per endpoint: connect (DNS and TCP), tls, first_byte (request sent to response
+    headers), upstream (whole exchange) and decode (JSON parsing). Tools record the whole call and,
+    separately, the serialization of their result.
+    '''
+    def __init__(self):
+        self.started = time.time()
+        self.tools = defaultdict(Histogram)
+        self.serialize = defaultdict(Histogram)
+        self.tool_errors = Counter()
+        self.bytes_out = Counter()  # tool -> serialized result bytes
+        self.phases = defaultdict(lambda: defaultdict(Histogram))  # endpoint path -> phase -> histogram
+        self.statuses = defaultdict(Counter)  # endpoint path -> status code (or exception name) -> count
+        self.bytes_in = Counter()  # endpoint path -> response body bytes
+        self.wire_bytes = Counter()  # endpoint path -> response body bytes as transferred, compressed or not
+        self.bytes_saved = defaultdict(Counter)  # endpoint path -> compression/not_modified -> body bytes not transferred
+        self.in_flight = Counter()  # 'tools' / 'upstream' -> calls running now
+        self.peak = Counter()
+        self.exported_at = 0.0
+
+    def enter(self, kind: str):
+        self.in_flight[kind] += 1
+        self.peak[kind] = max(self.peak[kind], self.in_flight[kind])
+
+    def leave(self, kind: str):
+        self.in_flight[kind] -= 1
+
+    def received(self, path: str, size: int, wire: int):
+        '''Count a response body of `size` bytes that took `wire` bytes to transfer'''
+        self.bytes_in[path] += size
+        self.wire_bytes[path] += wire
+        self.bytes_saved[path]['compression'] += max(0, size - wire)
+
+    def tracer(self, path: str, start: float):
+        '''httpx trace hook timing connection setup and time to first byte for one request'''
+        phases, marks = self.phases[path], {}
+
+        async def trace(event, info):
+            name, _, stage = event.rpartition('.')
+            if stage == 'started':
+                marks[name] = time.perf_counter()
+            elif stage == 'complete':
+                if name == 'connection.connect_tcp':
+                    phases['connect'].observe(time.perf_counter() - marks.get(name, start))
+                elif name == 'connection.start_tls':
+                    phases['tls'].observe(time.perf_counter() - marks.get(name, start))
+                elif name.endswith('receive_response_headers'):
+                    phases['first_byte'].observe(time.perf_counter() - start)
+        return trace
+
+    def snapshot(self) -> dict:
+        endpoints = {}
+        for path in sorted(set(self.phases) | set(response_cache.stats)):
+            counts = response_cache.stats[path]
+            hits = counts['hits'] + counts['mirror_hits'] + counts['disk_hits']
+            endpoints[path] = {
+                'statuses': {str(k): v for k, v in self.statuses[path].items()},
+                'bytes_in': self.bytes_in[path],
+                'wire_bytes': self.wire_bytes[path],
+                'bytes_saved': dict(self.bytes_saved[path]),
+                'cache_hit_ratio': round(hits / (hits + counts['misses']), 4) if hits + counts['misses'] else None,
+                'phases': {phase: h.summary() for phase, h in self.phases[path].items()},
+            }
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'in_flight': dict(self.in_flight),
+            'peak_in_flight': dict(self.peak),
+            'tools': {name: {**h.summary(), 'errors': self.tool_errors[name], 'bytes_out': self.bytes_out[name],
+                             'serialize': self.serialize[name].summary()}
+                      for name, h in sorted(self.tools.items())},
+            'endpoints': endpoints,
+        }
+
+    def prometheus(self) -> str:
+        '''All metrics in the Prometheus text exposition format'''
+        lines = []
+
+        def histogram(metric, labels, h):
+            cumulative = 0
+            for bound, n in zip(latency_buckets + ('+Inf',), h.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{labels}}} {h.sum}')
+            lines.append(f'{metric}_count{{{labels}}} {h.count}')
+
+        lines += ['# TYPE priceline_tool_duration_seconds histogram']
+        for name, h in sorted(self.tools.items()):
+            histogram('priceline_tool_duration_seconds', f'tool="{name}"', h)
+        lines += ['# TYPE priceline_tool_serialize_seconds histogram']
+        for name, h in sorted(self.serialize.items()):
+            histogram('priceline_tool_serialize_seconds', f'tool="{name}"', h)
+        lines += ['# TYPE priceline_tool_errors_total counter']
+        lines += [f'priceline_tool_errors_total{{tool="{name}"}} {n}' for name, n in sorted(self.tool_errors.items())]
+        lines += ['# TYPE priceline_tool_response_bytes_total counter']
+        lines += [f'priceline_tool_response_bytes_total{{tool="{name}"}} {n}' for name, n in sorted(self.bytes_out.items())]
+        lines += ['# TYPE priceline_upstream_duration_seconds histogram']
+        for path, phases in sorted(self.phases.items()):
+            for phase, h in sorted(phases.items()):
+                histogram('priceline_upstream_duration_seconds', f'endpoint="{path}",phase="{phase}"', h)
+        lines += ['# TYPE priceline_upstream_responses_total counter']
+        lines += [f'priceline_upstream_responses_total{{endpoint="{path}",status="{status}"}} {n}'
+                  for path, statuses in sorted(self.statuses.items()) for status, n in sorted(statuses.items(), key=str)]
+        lines += ['# TYPE priceline_upstream_response_bytes_total counter']
+        lines += [f'priceline_upstream_response_bytes_total{{endpoint="{path}"}} {n}' for path, n in sorted(self.bytes_in.items())]
+        lines += ['# TYPE priceline_upstream_wire_bytes_total counter']
+        lines += [f'priceline_upstream_wire_bytes_total{{endpoint="{path}"}} {n}' for path, n in sorted(self.wire_bytes.items())]
+        lines += ['# TYPE priceline_upstream_saved_bytes_total counter']
+        lines += [f'priceline_upstream_saved_bytes_total{{endpoint="{path}",reason="{reason}"}} {n}'
+                  for path, saved in sorted(self.bytes_saved.items()) for reason, n in sorted(saved.items())]
+        lines += ['# TYPE priceline_cache_requests_total counter']
+        lines += [f'priceline_cache_requests_total{{endpoint="{path}",result="{result}"}} {n}'
+                  for path, counts in sorted(response_cache.stats.items()) for result, n in sorted(counts.items())]
+        lines += ['# TYPE priceline_in_flight gauge']
+        lines += [f'priceline_in_flight{{kind="{kind}"}} {n}' for kind, n in sorted(self.in_flight.items())]
+        lines += ['# TYPE priceline_scheduler_queued gauge']
+        lines += [f'priceline_scheduler_queued{{priority="{name}"}} {scheduler.depth[name]}' for name in priorities]
+        if prefetcher is not None:
+            lines += ['# TYPE priceline_prefetch_total counter']
+            lines += [f'priceline_prefetch_total{{endpoint="{path}",result="{result}"}} {n}'
+                      for path, counts in sorted(prefetcher.stats.items()) for result, n in sorted(counts.items())]
+        if warmer is not None:
+            lines += ['# TYPE priceline_warm_total counter']
+            lines += [f'priceline_warm_total{{result="{result}"}} {n}' for result, n in sorted(warmer.stats.items())]
+        return '\n'.join(lines) + '\n'
+
+    def export_if_due(self):
+        '''Rewrite PRICELINE_METRICS_FILE (textfile-collector style) at most every PRICELINE_METRICS_INTERVAL seconds'''
+        now = time.monotonic()
+        if not metrics_file or now - self.exported_at < metrics_interval:
+            return
+        self.exported_at = now
+        tmp = f'{metrics_file}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, metrics_file)
+
+telemetry = Telemetry()
+
+# Response headers that describe the wire encoding rather than the (already decoded) body we archive.
+_wire_headers = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+def _archive(path: str) -> sqlite3.Connection:
+    '''Open a traffic archive: zlib bodies addressed by the sha256 of their content, plus timed exchanges and tool calls'''
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = NORMAL')
+    db.execute('CREATE TABLE IF NOT EXISTS blobs (digest BLOB PRIMARY KEY, body BLOB NOT NULL) WITHOUT ROWID')
+    db.execute('CREATE TABLE IF NOT EXISTS exchanges (seq INTEGER PRIMARY KEY, at REAL NOT NULL, duration REAL NOT NULL, '
+               'key TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL, digest BLOB NOT NULL)')
+    db.execute('CREATE TABLE IF NOT EXISTS calls (seq INTEGER PRIMARY KEY, at REAL NOT NULL, tool TEXT NOT NULL, arguments TEXT NOT NULL)')
+    return db
+
+def _exchange_key(path: str, payload: dict, headers: dict = None) -> str:
+    '''Archive key of one upstream request: its cache key, plus any conditional headers it was sent with'''
+    key = _cache_key(path, payload)
+    return f'{key} {json.dumps(headers, sort_keys=True)}' if headers else key
+
+class Recorder:
+    '''Appends upstream exchanges and tool calls to a traffic archive, storing each distinct body once'''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = _archive(path)
+        self.started = time.monotonic()
+        self.counts = Counter()
+        self._lock = threading.RLock()
+
+    def exchange(self, path: str, payload: dict, response: httpx.Response, duration: float, request_headers: dict = None):
+        content = response.content
+        digest = hashlib.sha256(content).digest()
+        headers = json.dumps([(k, v) for k, v in response.headers.items() if k.lower() not in _wire_headers])
+        with self._lock:
+            self.db.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?)', (digest, zlib.compress(content, 6)))
+            self.db.execute('INSERT INTO exchanges (at, duration, key, status, headers, digest) VALUES (?, ?, ?, ?, ?, ?)',
+                            (time.monotonic() - self.started - duration, duration, _exchange_key(path, payload, request_headers),
+                             response.status_code, headers, digest))
+        self.counts['exchanges'] += 1
+
+    def call(self, tool: str, arguments: dict):
+        with self._lock:
+            self.db.execute('INSERT INTO calls (at, tool, arguments) VALUES (?, ?, ?)',
+                            (time.monotonic() - self.started, tool, json.dumps(arguments, sort_keys=True)))
+        self.counts['calls'] += 1
+
+    def report(self) -> dict:
+        blobs, stored = self.db.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM blobs').fetchone()
+        return {'archive': self.path, **self.counts, 'distinct_bodies': blobs, 'stored_bytes': stored}
+
+class ReplayMismatch(httpx.HTTPError):
+    '''Raised for an upstream request the replayed archive holds no response for'''
+
+class Replayer:
+    '''Answers upstream requests from a traffic archive, in recorded order per request key, without touching the network
+
+    A key requested more often than it was recorded keeps getting its last recorded response. Keys
+    that were never recorded raise ReplayMismatch and are listed in report().
+    '''
+    def __init__(self, path: str, speed: float):
+        self.path = path
+        self.speed = speed
+        self.db = _archive(path)
+        self.exchanges = defaultdict(deque)
+        for key, duration, status, headers, digest in self.db.execute(
+                'SELECT key, duration, status, headers, digest FROM exchanges ORDER BY seq'):
+            self.exchanges[key].append((duration, status, json.loads(headers), digest))
+        self.bodies = {}
+        self.exhausted = set()  # keys down to their last recorded response
+        self.counts = Counter()
+        self.mismatches = Counter()
+
+    async def respond(self, path: str, payload: dict, request_headers: dict = None) -> httpx.Response:
+        key = _exchange_key(path, payload, request_headers)
+        recorded = self.exchanges.get(key)
+        if not recorded:
+            self.counts['mismatched'] += 1
+            self.mismatches[key] += 1
+            raise ReplayMismatch(f'No recorded response for {key}')
+        if len(recorded) > 1:
+            duration, status, headers, digest = recorded.popleft()
+        else:
+            duration, status, headers, digest = recorded[0]
+            self.counts['reused'] += key in self.exhausted
+            self.exhausted.add(key)
+        self.counts['served'] += 1
+        if digest not in self.bodies:
+            self.bodies[digest] = zlib.decompress(self.db.execute('SELECT body FROM blobs WHERE digest = ?', (digest,)).fetchone()[0])
+        if self.speed:
+            await asyncio.sleep(duration / self.speed)
+        return httpx.Response(status, headers=headers, content=self.bodies[digest],
+                              request=httpx.Request('GET', api_url + path, params=payload))
+
+    def calls(self) -> list:
+        return [(at, tool, json.loads(arguments)) for at, tool, arguments in
+                self.db.execute('SELECT at, tool, arguments FROM calls ORDER BY seq')]
+
+    def report(self) -> dict:
+        return {'archive': self.path, 'speed': self.speed, **self.counts,
+                'mismatches': [{'request': key, 'count': n} for key, n in self.mismatches.most_common()]}
+
+recorder = Recorder(record_path) if record_path else None
+replayer = Replayer(replay_path, replay_speed) if replay_path else None
+
+_inflight = {}  # request key -> (task fetching it, its Ticket)
+
+class CircuitOpen(httpx.HTTPError):
+    '''Raised without touching the network while an endpoint's breaker is open'''
+
+class DeadlineExceeded(httpx.TimeoutException):
+    '''Raised when a call, with its queueing and retries, outlives the endpoint's deadline'''
+
+class Breaker:
+    '''Per-endpoint circuit breaker: opens after consecutive failures, then lets one probe through per cooldown'''
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = Counter()
+        self.opened_at = {}
+
+    def allow(self, path: str) -> bool:
+        opened = self.opened_at.get(path)
+        if opened is None:
+            return True
+        now = time.monotonic()
+        if now - opened < self.cooldown:
+            return False
+        self.opened_at[path] = now  # half open: this call probes, everyone else waits out another cooldown
+        return True
+
+    def record(self, path: str, ok: bool):
+        if ok:
+            self.failures[path] = 0
+            self.opened_at.pop(path, None)
+        else:
+            self.failures[path] += 1
+            if self.failures[path] >= self.threshold:
+                self.opened_at[path] = time.monotonic()
+
+    def state(self, path: str) -> str:
+        opened = self.opened_at.get(path)
+        if opened is None:
+            return 'closed'
+        return 'open' if time.monotonic() - opened < self.cooldown else 'half_open'
+
+breaker = Breaker(breaker_threshold, breaker_cooldown)
+latencies = defaultdict(lambda: deque(maxlen=200))  # endpoint path -> recent upstream response times
+resilience_stats = defaultdict(Counter)  # endpoint path -> retries/deadline_exceeded/short_circuited/hedges/hedge_wins
+
+def _p95(path: str):
+    '''95th percentile of recent response times for an endpoint, in seconds, or None before any'''
+    samples = latencies[path]
+    return sorted(samples)[int(len(samples) * 0.95)] if samples else None
+
+async def _send(path: str, payload: dict, priority: Union[str, Ticket] = 'interactive', stream: bool = False,
+                headers: dict = None) -> httpx.Response:
+    '''Issue one upstream GET for an endpoint path, bypassing every local tier
+
+    The call waits its turn in the scheduler, in the class `priority` names or its Ticket holds at the time;
+    a 429 puts it back in the queue behind the key's Retry-After.
+    When replaying an archive the recorded response stands in for the network and the scheduler is skipped.
+    With `stream` a successful body is left unread for the caller to iterate and close; anything else,
+    and anything being recorded, is read here as usual. `headers` go out with the request, e.g. validators.
+    '''
+    timeout = httpx.Timeout(endpoint_read_timeouts.get(path, read_timeout), connect=connect_timeout)
+    client = _http()
+    for _ in range(throttle_retries + 1):
+        bucket = await scheduler.acquire(priority) if replayer is None else None
+        async with _semaphore:
+            telemetry.enter('upstream')
+            start = time.perf_counter()
+            try:
+                if replayer is not None:
+                    response = await replayer.respond(path, payload, headers)
+                else:
+                    request = client.build_request('GET', api_url + path, params=payload, timeout=timeout,
+                                                   headers={'x-rapidapi-key': bucket.key, **(headers or {})},
+                                                   extensions={'trace': telemetry.tracer(path, start)})
+                    response = await client.send(request, stream=stream)
+                    if stream and (response.status_code != 200 or recorder is not None):
+                        await response.aread()
+            except httpx.HTTPError as e:
+                telemetry.statuses[path][type(e).__name__] += 1
+                raise
+            finally:
+                telemetry.leave('upstream')
+        elapsed = time.perf_counter() - start
+        telemetry.phases[path]['upstream'].observe(elapsed)
+        telemetry.statuses[path][response.status_code] += 1
+        if response.is_closed:  # replayed responses never crossed the wire and count as sent uncompressed
+            telemetry.received(path, len(response.content), response.num_bytes_downloaded or len(response.content))
+        if response.status_code < 500:
+            latencies[path].append(elapsed)
+        if recorder is not None:
+            recorder.exchange(path, payload, response, elapsed, headers)
+        if bucket is not None:
+            scheduler.observe(bucket, response)
+        if response.status_code != 429:
+            break
+    return response
+
+async def _hedged(path: str, payload: dict, priority: Union[str, Ticket], headers: dict = None) -> httpx.Response:
+    '''Send a request and, once it is slower than the endpoint's p95, a second copy; the first answer wins'''
+    first = asyncio.ensure_future(_send(path, payload, priority, headers=headers))
+    if len(latencies[path]) < hedge_min_samples:
+        return await first
+    delay = max(hedge_min_delay, _p95(path))
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            resilience_stats[path]['hedges'] += 1
+            tasks.add(asyncio.ensure_future(_send(path, payload, priority, headers=headers)))
+        while True:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None or not tasks:
+                    if task is not first:
+                        resilience_stats[path]['hedge_wins'] += 1
+                    return task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _fetch(path: str, payload: dict, priority: Union[str, Ticket] = 'interactive', stream: bool = False,
+                 headers: dict = None) -> httpx.Response:
+    '''Upstream GET behind the endpoint's circuit breaker and deadline
+
+    Transport errors and 5xx answers are retried with full-jitter exponential backoff while the
+    deadline allows; the last 5xx response is returned as is once retries run out. A streamed
+    request is never hedged, and its deadline and retries end once the headers are in.
+    '''
+    stats = resilience_stats[path]
+    if not breaker.allow(path):
+        stats['short_circuited'] += 1
+        raise CircuitOpen(f'{path} is failing upstream; not retrying for {breaker.cooldown:g}s')
+    deadline = time.monotonic() + endpoint_deadlines.get(path, request_deadline)
+    if hedging_enabled and path in hedged_endpoints and not stream:
+        send = functools.partial(_hedged, headers=headers)
+    else:
+        send = functools.partial(_send, stream=stream, headers=headers)
+    attempts = 1 if path in unretried_endpoints else retry_attempts + 1
+    for attempt in range(attempts):
+        try:
+            response = await asyncio.wait_for(send(path, payload, priority), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            breaker.record(path, False)
+            stats['deadline_exceeded'] += 1
+            raise DeadlineExceeded(f'{path} did not answer within its {endpoint_deadlines.get(path, request_deadline):g}s deadline') from None
+        except httpx.TransportError as e:
+            error, response = e, None
+        else:
+            if response.status_code not in retry_statuses:
+                breaker.record(path, True)
+                return response
+        breaker.record(path, False)
+        delay = random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+        if attempt + 1 == attempts or time.monotonic() + delay >= deadline or not breaker.allow(path):
+            break
+        stats['retries'] += 1
+        await asyncio.sleep(delay)
+    if response is None:
+        raise error
+    return response
+
+async def _stale(path: str, key: str):
+    '''A recently expired body for a request key, served while the upstream is failing'''
+    body = response_cache.get(key, stale_for=stale_window)
+    if body is None and disk_cache:
+        cached = await _tier_read(disk_cache.get, key, stale_window)
+        body = json.loads(cached[0]) if cached is not None else None
+    if body is not None:
+        response_cache.stats[path]['stale_served'] += 1
+    return body
+
+async def _lookup(path: str, key: str, ttl, stats: Counter):
+    '''Fresh body for a request key from memory, the mirror or disk, or None'''
+    body = response_cache.get(key)
+    if body is not None:
+        stats['hits'] += 1
+        return body
+    content = mirror.page(key, ttl) if path in mirror_paths else None
+    if content is not None:
+        body = json.loads(content)
+        response_cache.put(key, body, len(content), ttl)
+        stats['mirror_hits'] += 1
+        return body
+    cached = await _tier_read(disk_cache.get, key) if disk_cache else None
+    if cached is not None:
+        content, remaining = cached
+        body = json.loads(content)
+        response_cache.put(key, body, len(content), remaining)
+        stats['disk_hits'] += 1
+        return body
+    return None
+
+async def _get(url: str, payload: dict, bypass_cache: bool = False, priority: str = 'interactive') -> dict:
+    '''Single upstream call path shared by every tool'''
+    path = _endpoint(url)
+    ttl = endpoint_ttls.get(path)
+    key = _cache_key(path, payload)
+    stats = response_cache.stats[path]
+    if ttl:
+        if bypass_cache:
+            stats['bypassed'] += 1
+        else:
+            body = await _lookup(path, key, ttl, stats)
+            if body is not None:
+                return body
+            stats['misses'] += 1
+    # Single flight: identical requests already on the wire are awaited rather than repeated. A caller more
+    # urgent than the request it joins raises its class, so an interactive call never waits as a prefetch.
+    flight = _inflight.get(key)
+    if flight is None:
+        ticket = Ticket(priority)
+        task = asyncio.ensure_future(_load(path, key, payload, ttl, ticket))
+        _inflight[key] = (task, ticket)
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        task, ticket = flight
+        stats['coalesced'] += 1
+        if scheduler.promote(ticket, priority):
+            stats['promoted'] += 1
+    return await asyncio.shield(task)
+
+def _validators(response: httpx.Response):
+    '''Conditional request headers asking whether a response has changed since, or None when it has no validators'''
+    validators = {}
+    if 'etag' in response.headers:
+        validators['if-none-match'] = response.headers['etag']
+    if 'last-modified' in response.headers:
+        validators['if-modified-since'] = response.headers['last-modified']
+    return validators or None
+
+async def _held(key: str):
+    '''(body, size, conditional request headers) of a response cached with validators, fresh or expired, or None'''
+    entry = response_cache.entries.get(key)
+    if entry is not None and entry[3]:
+        return entry[2], entry[1], entry[3]
+    held = await _tier_read(disk_cache.held, key) if disk_cache else None
+    if held is not None:
+        content, validators = held
+        return json.loads(content), len(content), validators
+    return None
+
+def _renew(path: str, key: str, ttl, held: tuple, response: httpx.Response) -> dict:
+    '''Serve a held body the upstream answered 304 Not Modified for, cached again for a full TTL'''
+    body, size, validators = held
+    validators = {**validators, **(_validators(response) or {})}
+    response_cache.put(key, body, size, ttl, validators)
+    if disk_cache:
+        _tier_write(disk_cache.renew, key, ttl, validators)
+    response_cache.stats[path]['revalidated'] += 1
+    telemetry.bytes_saved[path]['not_modified'] += size
+    return body
+
+async def _load(path: str, key: str, payload: dict, ttl, priority: Union[str, Ticket] = 'interactive') -> dict:
+    '''Fetch one request upstream and store a successful response in the cache tiers
+
+    When the upstream fails or answers 5xx, a cached response up to PRICELINE_STALE_FOR past its expiry is served instead.
+    A revalidated endpoint's request carries the validators of its cached response, which a 304 keeps serving.
+    A 304 to a request that held no body, e.g. from a shared cache on the way, is a miss: fetched again past it.
+    '''
+    held = await _held(key) if ttl and path in revalidated_endpoints else None
+    try:
+        response = await _fetch(path, payload, priority, headers=held[2] if held else None)
+        if response.status_code == 304 and held is None:
+            response_cache.stats[path]['unsolicited_304'] += 1
+            response = await _fetch(path, payload, priority, headers={'cache-control': 'no-cache'})
+            if response.status_code == 304:
+                raise httpx.HTTPStatusError(f'304 Not Modified for unconditional request {key}',
+                                            request=response.request, response=response)
+    except httpx.HTTPError:
+        body = await _stale(path, key) if ttl else None
+        if body is None:
+            raise
+        return body
+    if response.status_code == 304 and held is not None:
+        return _renew(path, key, ttl, held, response)
+    if response.status_code >= 500 and ttl:
+        body = await _stale(path, key)
+        if body is not None:
+            return body
+    start = time.perf_counter()
+    body = response.json()
+    telemetry.phases[path]['decode'].observe(time.perf_counter() - start)
+    if ttl and response.is_success:
+        validators = _validators(response) if path in revalidated_endpoints else None
+        response_cache.put(key, body, len(response.content), ttl, validators)
+        if disk_cache:
+            _tier_write(disk_cache.put, key, path, response.content, ttl, validators)
+        if held is not None:
+            response_cache.stats[path]['modified'] += 1
+    return body
+
+async def _fan_out(calls: dict, limit: int = batch_concurrency) -> dict:
+    '''Await keyed upstream calls concurrently, at most `limit` at a time, collecting failures per key'''
+    gate = asyncio.Semaphore(limit)
+    results, errors = {}, {}
+
+    async def one(key, call):
+        async with gate:
+            try:
+                results[key] = await call()
+            except (httpx.HTTPError, ValueError) as e:
+                errors[key] = repr(e)
+
+    await asyncio.gather(*(one(key, call) for key, call in calls.items()))
+    return {'results': {key: results[key] for key in calls if key in results}, 'errors': errors}
+
+def _unique_ids(hotel_ids) -> list:
+    return list(dict.fromkeys(str(int(i)) if isinstance(i, float) else str(i).strip() for i in hotel_ids if str(i).strip()))
+
+def _split_by_hotel(body, hotel_ids: list) -> dict:
+    '''Map each requested hotel id to the object in a multi-hotel response that carries it'''
+    wanted, found = set(hotel_ids), {}
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for field in ('hotel_id', 'hotelid_ppn', 'ppn_hotel_id'):
+                if str(node.get(field)) in wanted:
+                    found.setdefault(str(node[field]), node)
+                    break
+            else:
+                stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return found
+
+# Fields that carry an itinerary's or hotel's price in search responses, most specific first.
+price_fields = ('totalAllInclusivePrice', 'totalFare', 'total_fare', 'totalPrice', 'total_price', 'totalAmount', 'display_total',
+                'display_total_fare', 'minPrice', 'min_price', 'price', 'amount', 'fare')
+star_fields = ('starRating', 'star_rating', 'stars')
+rating_fields = ('overallScore', 'overall_score', 'average_rating', 'rating', 'score')
+# Fields naming the rental company, the vehicle and the pickup location of a car rental offer.
+company_fields = ('partnerCode', 'partner_code', 'company_code', 'companyCode', 'vendorCode', 'vendor_code')
+company_name_fields = ('company_name', 'partnerName', 'partner_name', 'name')
+vehicle_fields = ('vehicleCode', 'vehicle_code', 'sippCode', 'sipp_code', 'carTypeCode', 'vehicleName')
+pickup_fields = ('pickupLocationId', 'pickup_location_id', 'locationId', 'location_id')
+
+def _number_of(node, fields):
+    '''First numeric value under one of `fields` in a record, searching breadth first'''
+    queue = [node]
+    while queue:
+        current = queue.pop(0)
+        if isinstance(current, dict):
+            for field in fields:
+                value = current.get(field)
+                try:
+                    if value is not None and not isinstance(value, (dict, list, bool)):
+                        return float(str(value).replace(',', '').lstrip('$'))
+                except ValueError:
+                    pass
+            queue.extend(v for v in current.values() if isinstance(v, (dict, list)))
+        elif isinstance(current, list):
+            queue.extend(current)
+    return None
+
+def _text_of(node, fields):
+    '''First non-empty scalar under one of `fields` in a record, as a string, searching breadth first'''
+    queue = [node]
+    while queue:
+        current = queue.pop(0)
+        if isinstance(current, dict):
+            for field in fields:
+                value = current.get(field)
+                if value not in (None, '') and not isinstance(value, (dict, list)):
+                    return str(value)
+            queue.extend(v for v in current.values() if isinstance(v, (dict, list)))
+        elif isinstance(current, list):
+            queue.extend(current)
+    return None
+
+def _record_list(body) -> list:
+    '''The largest list of objects in a response, i.e. its itineraries, hotels or reviews'''
+    best, stack = [], [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            if len(node) > len(best) and all(isinstance(item, dict) for item in node):
+                best = node
+            stack.extend(node)
+    return best
+
+def _offers(body) -> list:
+    '''The priced records of a search response: its largest list, or object keyed by id, of priced objects'''
+    best, stack = [], [body]
+    while stack:
+        node = stack.pop()
+        items = list(node.values()) if isinstance(node, dict) else node
+        if len(items) > len(best) and all(isinstance(item, dict) for item in items) \
+                and _number_of(items[0], price_fields) is not None:
+            best = items
+        stack.extend(item for item in items if isinstance(item, (dict, list)))
+    return best
+
+def _cheapest_itinerary(body):
+    '''(price, itinerary) of the cheapest itinerary in a flight search response'''
+    priced = [(price, item) for item in _offers(body) if (price := _number_of(item, price_fields)) is not None]
+    return min(priced, key=lambda pair: pair[0]) if priced else (None, None)
+
+def _bundles(body, field: str) -> list:
+    '''Distinct string values of `field` in a response, in document order'''
+    found, stack = {}, [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            value = node.get(field)
+            if isinstance(value, str) and value:
+                found[value] = None
+            stack.extend(reversed([v for v in node.values() if isinstance(v, (dict, list))]))
+        elif isinstance(node, list):
+            stack.extend(reversed([v for v in node if isinstance(v, (dict, list))]))
+    return list(found)
+
+class Prefetcher:
+    '''Speculative contract and seat map fetches for the first itineraries of each round-trip search, tracked per sid
+
+    A prefetch sends exactly the query the follow-up tool call would, so that call is answered from the
+    cache, or joins the prefetch still on the wire through single flight.
+    '''
+    contract_path = '/v2/flight/contract'
+    seat_map_path = '/v2/flight/seatMap'
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.sessions = OrderedDict()  # sid -> {cache key: 'pending' | 'ready' | 'failed' | 'claimed'}
+        self.stats = defaultdict(Counter)  # endpoint path -> issued/ready/failed/hits/joined/misses
+        self.tasks = set()
+
+    def claim(self, path: str, payload: dict):
+        '''Count a contract or seat map tool call as a hit on a prefetch, or as a miss for a prefetched sid'''
+        if path not in (self.contract_path, self.seat_map_path):
+            return
+        session = self.sessions.get(payload.get('sid'))
+        if session is None:
+            return
+        key = _cache_key(path, payload)
+        state = session.get(key)
+        if state == 'ready':
+            self.stats[path]['hits'] += 1
+        elif state == 'pending':
+            self.stats[path]['joined'] += 1
+        else:
+            self.stats[path]['misses'] += 1
+            return
+        session[key] = 'claimed'
+
+    def follow(self, path: str, payload: dict, body):
+        '''Start prefetching behind a round-trip search response'''
+        sid = payload.get('sid')
+        if path != '/v2/flight/roundTrip' or not sid:
+            return
+        self.sessions[sid] = self.sessions.pop(sid, None) or {}
+        while len(self.sessions) > prefetch_sessions:
+            self.sessions.popitem(last=False)
+        for bundle in _bundles(body, 'ppn_bundle')[:self.depth]:
+            task = asyncio.ensure_future(self._chain(sid, bundle))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _chain(self, sid: str, bundle: str):
+        contract = await self._fetch(sid, self.contract_path, {'sid': sid, 'ppn_bundle': bundle})
+        seat_bundles = _bundles(contract, 'ppn_seat_bundle') if contract is not None else ()
+        if seat_bundles:
+            await self._fetch(sid, self.seat_map_path, {'ppn_bundle': seat_bundles[0], 'sid': sid})
+
+    async def _fetch(self, sid: str, path: str, payload: dict):
+        session, key, stats = self.sessions.get(sid), _cache_key(path, payload), self.stats[path]
+        if session is None or key in session:
+            return None
+        session[key] = 'pending'
+        stats['issued'] += 1
+        try:
+            body = await _get(f'https://{api_host}{path}', payload, priority='prefetch')
+        except httpx.HTTPError:
+            body = None
+        ok = body is not None
+        stats['ready' if ok else 'failed'] += 1
+        if session.get(key) == 'pending':
+            session[key] = 'ready' if ok else 'failed'
+        return body
+
+    def snapshot(self) -> dict:
+        endpoints = {}
+        for path, counts in sorted(self.stats.items()):
+            used = counts['hits'] + counts['joined']
+            endpoints[path] = {**counts,
+                               'hit_rate': round(used / (used + counts['misses']), 4) if used + counts['misses'] else None,
+                               'used_share': round(used / counts['issued'], 4) if counts['issued'] else None}
+        return {'itineraries': self.depth, 'sessions': len(self.sessions), 'running': len(self.tasks),
+                'upstream_calls': scheduler.waits['prefetch']['calls'], 'endpoints': endpoints}
+
+prefetcher = Prefetcher(prefetch_itineraries) if prefetch_itineraries > 0 else None
+
+# Params that only sort, filter, page or cut the results of a hotel search; the rest of the query is its base.
+result_views = {
+    '/v1/hotels/search': ('sort_order', 'star_rating_ids', 'amenities_ids', 'page_number'),
+    '/v2/hotels/expressResults': ('sort_by', 'limit'),
+}
+# Column and direction each sort option orders by. Options left out (HDR, DEALS, mp) rank by upstream
+# signals the store does not hold, and always go upstream.
+result_sorts = {
+    '/v1/hotels/search': {'PRICE': ('price', False), 'STAR': ('stars', True), 'PROXIMITY': ('distance', False)},
+    '/v2/hotels/expressResults': {None: ('score', True), 'gs': ('score', True), 'sr': ('stars', True),
+                                  'lp': ('price', False), 'hp': ('price', True), 'ds': ('distance', False)},
+}
+express_default_limit = 100
+
+def _number(node, *keys):
+    '''Float at a key path in a response, or None'''
+    for key in keys:
+        if not isinstance(node, dict):
+            return None
+        node = node.get(key)
+    try:
+        return float(node)
+    except (TypeError, ValueError):
+        return None
+
+def _codes(text) -> frozenset:
+    return frozenset(code.strip() for code in str(text).split(',') if code.strip()) if text else None
+
+def _hotel_collection(body):
+    '''(trail of keys to the object holding the hotels, collection key, collection) in a hotel search response, or None'''
+    trail, node = (), body
+    for _ in range(4):
+        if not isinstance(node, dict):
+            return None
+        for key in ('hotels', 'hotel_data'):
+            if isinstance(node.get(key), (list, dict)):
+                return trail, key, node[key]
+        if isinstance(node.get('results'), dict):
+            step = 'results'
+        elif len(node) == 1:
+            step = next(iter(node))
+        else:
+            return None
+        trail, node = trail + (step,), node[step]
+    return None
+
+def _hotel_row(path: str, hotel: dict, center) -> tuple:
+    '''(id, price, stars, distance, guest score, amenity codes) of one hotel in a search response'''
+    if path == '/v1/hotels/search':
+        features = hotel.get('hotelFeatures') if isinstance(hotel.get('hotelFeatures'), dict) else {}
+        return (str(hotel.get('hotelId')), _number(hotel, 'ratesSummary', 'minPrice'), _number(hotel, 'starRating'),
+                _number(hotel, 'proximity'), _number(hotel, 'overallGuestRating'), features.get('hotelAmenityCodes') or ())
+    prices = [_number(rate, 'price_details', 'display_price')
+              for room in (hotel.get('room_data') or {}).values() if isinstance(room, dict)
+              for rate in room.get('rate_data') or () if isinstance(rate, dict)]
+    prices = [price for price in prices if price is not None]
+    distance = _number(hotel, 'distance')
+    lat, lon = _number(hotel, 'geo', 'latitude'), _number(hotel, 'geo', 'longitude')
+    if distance is None and center is not None and lat is not None and lon is not None:
+        lat1, lon1, lat2, lon2 = map(math.radians, (center[0], center[1], lat, lon))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distance = 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(min(a, 1.0)))
+    codes = [a.get('code') for a in hotel.get('amenity_data') or () if isinstance(a, dict) and a.get('code')]
+    return (str(hotel.get('id', hotel.get('hotelid_ppn'))), min(prices) if prices else None, _number(hotel, 'star_rating'),
+            distance, _number(hotel, 'review_rating'), codes)
+
+class ResultStore:
+    '''Recent hotel search results per base query as NumPy columns: price, stars, distance, guest score, amenity bitsets
+
+    Every page fetched for a base query (the query minus its `result_views` params) and one set of filters is
+    merged into a single set. Once that set holds every hotel the upstream has for it, another sort order, a
+    narrower star or amenity filter, another page or a smaller limit is computed from the columns instead of
+    being sent upstream. An incomplete set still answers a smaller limit in the order it was fetched in.
+    '''
+
+    def __init__(self, size: int):
+        self.size = size
+        self.bases = OrderedDict()  # (path, base key) -> {filters: entry}
+        self.stats = defaultdict(Counter)  # endpoint path -> kept/served/not_stored/incomplete/unsorted
+
+    @functools.cached_property
+    def np(self):
+        import numpy as np  # when a set is first served from its columns, not at startup
+        return np
+
+    def _base(self, path: str, payload: dict) -> tuple:
+        views = result_views[path]
+        return path, _cache_key(path, {k: v for k, v in payload.items() if k not in views})
+
+    @staticmethod
+    def _filters(path: str, payload: dict) -> tuple:
+        if path != '/v1/hotels/search':
+            return None, None
+        stars = _codes(payload.get('star_rating_ids'))
+        return frozenset(float(s) for s in stars) if stars else None, _codes(payload.get('amenities_ids'))
+
+    def keep(self, path: str, payload: dict, body):
+        '''Merge the hotels of a search response into its base query's set'''
+        found = _hotel_collection(body) if path in result_views else None
+        if found is None:
+            return
+        trail, field, hotels = found
+        hotels = [hotel for hotel in (hotels.values() if isinstance(hotels, dict) else hotels) if isinstance(hotel, dict)]
+        try:
+            base, filters = self._base(path, payload), self._filters(path, payload)
+        except ValueError:
+            return
+        entries = self.bases.pop(base, None) or {}
+        self.bases[base] = entries
+        while len(self.bases) > self.size:
+            self.bases.popitem(last=False)
+        entry, now = entries.get(filters), time.monotonic()
+        if entry is not None and entry['expires'] > now and path == '/v2/hotels/expressResults' \
+                and len(entry['hotels']) >= len(hotels):
+            entry['keys'].add(_cache_key(path, payload))
+            return
+        # Search pages merge into one set; an express response is a whole set, so a larger one replaces it.
+        if entry is None or entry['expires'] <= now or path == '/v2/hotels/expressResults':
+            center = (_number(payload, 'latitude'), _number(payload, 'longitude'))
+            entry = entries[filters] = {
+                'body': body, 'trail': trail, 'field': field, 'hotels': [], 'ids': set(), 'keys': set(),
+                'center': center if None not in center else None, 'expires': now + endpoint_ttls.get(path, MINUTE),
+                'sort': payload.get('sort_by'), 'limit': int(payload.get('limit') or express_default_limit),
+                'total': None, 'page_size': 0, 'columns': None}
+        entry['keys'].add(_cache_key(path, payload))
+        for hotel in hotels:
+            row = _hotel_row(path, hotel, entry['center'])
+            if row[0] not in entry['ids']:
+                entry['ids'].add(row[0])
+                entry['hotels'].append((hotel, row))
+        entry['columns'] = None
+        if path == '/v1/hotels/search':
+            entry['total'] = _number(body, 'totalSize')
+            entry['page_size'] = max(entry['page_size'], len(hotels))
+        self.stats[path]['kept'] += 1
+
+    def _complete(self, path: str, entry: dict) -> bool:
+        if path == '/v1/hotels/search':
+            return entry['total'] is not None and len(entry['hotels']) >= entry['total']
+        return len(entry['hotels']) < entry['limit']
+
+    def _columns(self, entry: dict) -> dict:
+        '''Column arrays of an entry, built on first use after each merge'''
+        if entry['columns'] is None:
+            np = self.np
+            rows = [row for _, row in entry['hotels']]
+            vocabulary = {}
+            for row in rows:
+                for code in row[5]:
+                    vocabulary.setdefault(code, len(vocabulary))
+            bits = np.zeros((len(rows), (len(vocabulary) + 63) // 64 or 1), dtype=np.uint64)
+            pairs = np.array([(i, vocabulary[code]) for i, row in enumerate(rows) for code in row[5]], dtype=np.int64).reshape(-1, 2)
+            np.bitwise_or.at(bits, (pairs[:, 0], pairs[:, 1] // 64), np.left_shift(np.uint64(1), (pairs[:, 1] % 64).astype(np.uint64)))
+            column = lambda i: np.array([np.nan if row[i] is None else row[i] for row in rows], dtype=np.float64)
+            entry['columns'] = {'price': column(1), 'stars': column(2), 'distance': column(3), 'score': column(4),
+                                'amenities': bits, 'vocabulary': vocabulary}
+        return entry['columns']
+
+    def _amenity_mask(self, columns: dict, codes):
+        np = self.np
+        bits, vocabulary = columns['amenities'], columns['vocabulary']
+        if any(code not in vocabulary for code in codes):
+            return np.zeros(len(bits), dtype=bool)
+        need = np.zeros(bits.shape[1], dtype=np.uint64)
+        for code in codes:
+            need[vocabulary[code] // 64] |= np.uint64(1) << np.uint64(vocabulary[code] % 64)
+        return ((bits & need) == need).all(axis=1)
+
+    def serve(self, path: str, payload: dict):
+        '''A response for this search computed from a stored set, or None when it has to go upstream'''
+        entries = self.bases.get(self._base(path, payload)) if path in result_views else None
+        if not entries:
+            return None
+        stats, key, now = self.stats[path], _cache_key(path, payload), time.monotonic()
+        try:
+            stars, amenities = self._filters(path, payload)
+        except ValueError:
+            return None
+        for (kept_stars, kept_amenities), entry in entries.items():
+            if entry['expires'] <= now or key in entry['keys']:
+                continue
+            if kept_stars is not None and not (stars and stars <= kept_stars):
+                continue
+            if kept_amenities is not None and not (amenities and kept_amenities <= amenities):
+                continue
+            break
+        else:
+            stats['not_stored'] += 1
+            return None
+        sort = payload.get('sort_order' if path == '/v1/hotels/search' else 'sort_by')
+        if not self._complete(path, entry):
+            if path == '/v2/hotels/expressResults' and sort == entry['sort'] and \
+                    int(payload.get('limit') or express_default_limit) <= len(entry['hotels']):
+                stats['served'] += 1
+                return self._response(path, entry, entry['hotels'][:int(payload.get('limit') or express_default_limit)])
+            stats['incomplete'] += 1
+            return None
+        if sort not in result_sorts[path]:
+            stats['unsorted'] += 1
+            return None
+        np = self.np
+        columns = self._columns(entry)
+        keep = np.ones(len(entry['hotels']), dtype=bool)
+        if stars:
+            keep &= np.isin(columns['stars'], list(stars))
+        if amenities:
+            keep &= self._amenity_mask(columns, amenities)
+        idx = np.flatnonzero(keep)
+        name, descending = result_sorts[path][sort]
+        values = columns[name][idx]
+        if np.isnan(values).any():
+            stats['unsorted'] += 1
+            return None
+        idx = idx[np.argsort(-values if descending else values, kind='stable')]
+        if path == '/v1/hotels/search':
+            size = entry['page_size'] or len(idx)
+            page = int(payload.get('page_number') or 0)
+            chosen, total = idx[page * size:(page + 1) * size], len(idx)
+        else:
+            chosen, total = idx[:int(payload.get('limit') or express_default_limit)], None
+        stats['served'] += 1
+        return self._response(path, entry, [entry['hotels'][i] for i in chosen], total)
+
+    def _response(self, path: str, entry: dict, hotels: list, total=None) -> dict:
+        '''The stored response with its hotels replaced, copying only the objects on the way to them'''
+        body = dict(entry['body'])
+        node = body
+        for step in entry['trail']:
+            node[step] = dict(node[step])
+            node = node[step]
+        if entry['field'] == 'hotels':
+            node['hotels'] = [hotel for hotel, _ in hotels]
+            if total is not None and 'totalSize' in node:
+                node['totalSize'] = total
+        else:
+            node['hotel_data'] = {f'hotel_{i}': hotel for i, (hotel, _) in enumerate(hotels)}
+        return body
+
+    def snapshot(self) -> dict:
+        return {'base_queries': len(self.bases), 'endpoints': {path: dict(counts) for path, counts in sorted(self.stats.items())}}
+
+result_store = ResultStore(result_store_size) if result_store_size > 0 and importlib.util.find_spec('numpy') else None
+
+class AccessLog:
+    '''Call counts per request key in a count-min sketch, plus the heaviest hitters among them with their queries
+
+    The sketch takes conservative updates, so a key's estimate only ever overshoots by what colliding keys
+    add. Every half-life all counts halve, which lets yesterday's hot queries cool off.
+    '''
+
+    def __init__(self, top: int, width: int = 2048, depth: int = 4):
+        self.size = top
+        self.width = width
+        self.rows = [[0] * width for _ in range(depth)]
+        self.top = {}  # key -> [estimated calls, path, payload]
+        self.decayed_at = time.monotonic()
+
+    def _cells(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * len(self.rows)).digest()
+        return [h % self.width for h in struct.unpack(f'<{len(self.rows)}I', digest)]
+
+    def record(self, key: str, path: str, payload: dict) -> float:
+        '''Count one call and return the key's estimated calls'''
+        cells = self._cells(key)
+        count = min(row[cell] for row, cell in zip(self.rows, cells)) + 1
+        for row, cell in zip(self.rows, cells):
+            row[cell] = max(row[cell], count)
+        if key in self.top:
+            self.top[key][0] = count
+        elif len(self.top) < self.size:
+            self.top[key] = [count, path, payload]
+        else:
+            coldest = min(self.top, key=lambda k: self.top[k][0])
+            if self.top[coldest][0] < count:
+                del self.top[coldest]
+                self.top[key] = [count, path, payload]
+        return count
+
+    def decay(self, now: float):
+        '''Halve every count once per half-life'''
+        while now - self.decayed_at >= warm_half_life:
+            self.decayed_at += warm_half_life
+            self.rows = [[count >> 1 for count in row] for row in self.rows]
+            for entry in self.top.values():
+                entry[0] /= 2
+
+    def hottest(self) -> list:
+        '''(estimated calls, key, path, payload) of the tracked keys, most called first'''
+        return sorted(((count, key, path, payload) for key, (count, path, payload) in self.top.items()),
+                      key=lambda item: -item[0])
+
+class Warmer:
+    '''Keeps the hottest searches of the access log fresh, fetching each again at `warm` priority before it expires
+
+    A hot query is due once its cached response is in the last quarter of its TTL, or gone. Warm calls make up
+    at most PRICELINE_WARM_QUOTA_SHARE of all upstream calls, and so of the quota spent; the scheduler's quota
+    reserve for interactive calls holds them back like any background class. A refresh still queued when an
+    interactive miss joins it is promoted, and is then charged to interactive calls rather than the warm share.
+    '''
+
+    def __init__(self, top: int):
+        self.log = AccessLog(top)
+        self.stats = Counter()  # calls/hot_calls/hot_hits/warm_hits/passes/refreshed/failed/over_budget
+        self.warmed = {}  # key -> expiry of the cached response a refresh stored
+        self.task = None
+        self.baseline = {name: waits['calls'] for name, waits in scheduler.waits.items()}
+
+    def _spent(self) -> tuple:
+        '''(all upstream calls, warm calls) since the warmer started'''
+        total = sum(waits['calls'] - self.baseline.get(name, 0) for name, waits in scheduler.waits.items())
+        return total, scheduler.waits['warm']['calls'] - self.baseline.get('warm', 0)
+
+    def record(self, path: str, payload: dict):
+        '''Log a tool call; a call to a hot query counts as a hit when its response is fresh in memory'''
+        if path not in warm_endpoints:
+            return
+        key = _cache_key(path, payload)
+        tracked = self.log.top.get(key)
+        self.stats['calls'] += 1
+        if tracked is not None and tracked[0] >= warm_min_calls:
+            self.stats['hot_calls'] += 1
+            entry = response_cache.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.stats['hot_hits'] += 1
+                if self.warmed.get(key) == entry[0]:
+                    self.stats['warm_hits'] += 1
+        self.log.record(key, path, payload)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    def budget(self) -> int:
+        '''Warm calls that may still be made within the quota share'''
+        total, warm = self._spent()
+        return max(0, int((warm_quota_share * total - warm) / (1 - warm_quota_share))) if warm_quota_share < 1 else 1 << 30
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(warm_interval)
+            await self.refresh()
+
+    async def refresh(self):
+        '''One pass over the hot queries, hottest first, refreshing those due within the budget'''
+        now = time.monotonic()
+        self.log.decay(now)
+        self.stats['passes'] += 1
+        due = []
+        for count, key, path, payload in self.log.hottest():
+            if count < warm_min_calls:
+                break
+            entry = response_cache.entries.get(key)
+            if entry is None or entry[0] - now < warm_lead * endpoint_ttls[path]:
+                due.append((key, path, payload))
+        allowed = self.budget()
+        self.stats['over_budget'] += max(0, len(due) - allowed)
+        calls = {key: functools.partial(self._refresh, key, path, payload) for key, path, payload in due[:allowed]}
+        batch = await _fan_out(calls)
+        self.stats['refreshed'] += len(batch['results'])
+        self.stats['failed'] += len(batch['errors'])
+        self.warmed = {key: expiry for key, expiry in self.warmed.items() if key in self.log.top}
+
+    async def _refresh(self, key: str, path: str, payload: dict):
+        await _get(f'https://{api_host}{path}', payload, bypass_cache=True, priority='warm')
+        entry = response_cache.entries.get(key)
+        if entry is not None:
+            self.warmed[key] = entry[0]
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        total, warm = self._spent()
+        return {'tracked': len(self.log.top), 'hot': sum(1 for count, *_ in self.log.top.values() if count >= warm_min_calls),
+                # Hot calls answered fresh at all, and those answered by a response only a refresh had stored.
+                'hot_hit_rate': round(stats['hot_hits'] / stats['hot_calls'], 4) if stats['hot_calls'] else None,
+                'warm_hit_rate': round(stats['warm_hits'] / stats['hot_calls'], 4) if stats['hot_calls'] else None,
+                'upstream_calls': warm, 'quota_share_spent': round(warm / total, 4) if total else 0.0,
+                'quota_share_allowed': warm_quota_share, **stats}
+
+warmer = Warmer(warm_top) if warm_top > 0 else None
+
+async def _paginate(fetch, keep, stop_after: int, max_pages: int, window: int, ctx=None) -> dict:
+    '''Walk pages in order with up to `window` pages prefetched, keeping at most `stop_after` matching items
+
+    Each page is dropped once its matches are extracted, so memory stays bounded however many pages are
+    walked. Matches are pushed to the client as they arrive via progress and log notifications.
+    '''
+    tasks, kept, fetched, error = {}, [], 0, None
+    requested = 0
+    try:
+        for page in range(max_pages if stop_after > 0 else 0):
+            while requested < min(max_pages, page + window):
+                tasks[requested] = asyncio.ensure_future(fetch(requested))
+                requested += 1
+            try:
+                items = _record_list(await tasks.pop(page))
+            except (httpx.HTTPError, ValueError) as e:
+                error = repr(e)
+                break
+            fetched += 1
+            if not items:
+                break
+            matched = [item for item in items if keep(item)][:stop_after - len(kept)]
+            kept.extend(matched)
+            if ctx is not None:
+                await ctx.report_progress(page + 1, max_pages, f'{len(kept)} of {stop_after} results after {page + 1} pages')
+                if matched:
+                    await ctx.info(json.dumps({'page': page, 'results': matched}, separators=(',', ':')))
+            if len(kept) >= stop_after:
+                break
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return {'results': kept, 'pages_fetched': fetched, 'error': error}
+
+# flight_price_calendar sends ROUND_TRIP cells to /v2/flight/roundTrip, which names cabin classes in words.
+calendar_sid = 'flight-price-calendar'
+cabin_classes = {'ECO': 'economy', 'PEC': 'premium', 'BUS': 'business', 'FST': 'first'}
+
+def _date_range(start: str, end: str) -> list:
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+# Fields kept by preset='slim', per endpoint. `..name` matches `name` at any depth, as in JSONPath.
+slim_presets = {
+    '/v2/hotels/expressResults': ('..hotel_data.*.id', '..hotel_data.*.name', '..hotel_data.*.star_rating',
+                                  '..hotel_data.*.review_rating', '..hotel_data.*.address', '..hotel_data.*.geo',
+                                  '..rate_data.ppn_bundle', '..price_details.display_price', '..price_details.display_total',
+                                  '..price_details.display_currency', '..resume_key', '..status', '..error'),
+    '/v1/flights/search': ('..pricedItinerary[*].id', '..pricingInfo.totalFare', '..pricingInfo.currencyCode',
+                           '..slice[*].uniqueSliceId', '..segment[*].marketingAirline', '..segment[*].flightNumber',
+                           '..segment[*].departDateTime', '..segment[*].arrivalDateTime', '..segment[*].origAirport',
+                           '..segment[*].destAirport', '..duration', '..stopQuantity', '..error'),
+    '/v2/flight/contract': ('..ppn_bundle', '..ppn_seat_bundle', '..ppn_book_bundle', '..price_details', '..display_total',
+                            '..display_currency', '..status', '..error'),
+    '/v1/hotels/details': ('id', 'name', 'starRating', 'location', 'overallGuestRating', 'totalReviewCount',
+                           'hotelFeatures.hotelAmenityCodes', 'checkInTime', 'checkOutTime', '..error'),
+}
+
+_SKIP = object()
+
+class Projection:
+    '''JSONPath-style include paths (`$.a.b`, `a[*].b`, `..b`) compiled to a lazily built DFA over object keys'''
+    def __init__(self, fields):
+        self.paths = []
+        for raw in fields:
+            raw = raw.strip().replace('[*]', '').replace('[]', '').lstrip('$').replace('..', '.**.')
+            steps = tuple(step for step in raw.split('.') if step)
+            if steps:
+                self.paths.append(steps)
+        self.start = frozenset((p, 0) for p in range(len(self.paths)))
+        self.transitions = {}
+
+    def _step(self, states, key):
+        nxt = set()
+        for p, i in states:
+            steps = self.paths[p]
+            if steps[i] == '**':
+                nxt.add((p, i))
+                if i + 1 < len(steps) and steps[i + 1] in (key, '*'):
+                    nxt.add((p, i + 2))
+            elif steps[i] in (key, '*'):
+                nxt.add((p, i + 1))
+        nxt = frozenset(nxt)
+        complete = any(i >= len(self.paths[p]) or (i == len(self.paths[p]) - 1 and self.paths[p][i] == '**') for p, i in nxt)
+        return nxt or None, complete
+
+    def _node(self, node, states):
+        if isinstance(node, dict):
+            table = self.transitions.setdefault(states, {})
+            out = {}
+            for key, value in node.items():
+                move = table.get(key)
+                if move is None:
+                    move = table[key] = self._step(states, key)
+                nxt, complete = move
+                if complete:
+                    out[key] = value
+                elif nxt is not None and isinstance(value, (dict, list)):
+                    projected = self._node(value, nxt)
+                    if projected is not _SKIP:
+                        out[key] = projected
+            return out or _SKIP
+        if isinstance(node, list):
+            items = [projected for projected in (self._node(item, states) for item in node if isinstance(item, (dict, list)))
+                     if projected is not _SKIP]
+            return items or _SKIP
+        return _SKIP
+
+    def __call__(self, body):
+        '''Copy of `body` holding only the matched values, built in one pass; the source is never mutated'''
+        if not self.paths:
+            return body
+        projected = self._node(body, self.start)
+        return {} if projected is _SKIP else projected
+
+@functools.lru_cache(maxsize=256)
+def _projection(fields: tuple) -> Projection:
+    return Projection(fields)
+
+def _shape(url: str, body, fields, preset):
+    '''Apply a caller field list, or the endpoint's slim preset, to a response'''
+    if fields:
+        return _projection(tuple(fields.split(',')))(body)
+    if preset == 'slim':
+        return _projection(slim_presets[_endpoint(url)])(body)
+    return body
+
+_current_tool = contextvars.ContextVar('current_tool', default=None)
+
+class TelemetryMiddleware(Middleware):
+    '''Times every tool call and tracks how many run at once'''
+
+    async def on_call_tool(self, context, call_next):
+        name = context.message.name
+        if recorder is not None:
+            recorder.call(name, context.message.arguments or {})
+        token = _current_tool.set(name)
+        telemetry.enter('tools')
+        start = time.perf_counter()
+        try:
+            return await call_next(context)
+        except Exception:
+            telemetry.tool_errors[name] += 1
+            raise
+        finally:
+            telemetry.tools[name].observe(time.perf_counter() - start)
+            telemetry.leave('tools')
+            _current_tool.reset(token)
+            telemetry.export_if_due()
+
+def _serialize(data) -> str:
+    '''FastMCP's default tool result serializer, timed and measured per tool'''
+    start = time.perf_counter()
+    raw = pydantic_core.to_json(data, fallback=str)
+    tool = _current_tool.get()
+    telemetry.serialize[tool].observe(time.perf_counter() - start)
+    telemetry.bytes_out[tool] += len(raw)
+    return raw.decode()
+
+def _skip_schema_validation(server: FastMCP) -> bool:
+    '''Register the tool call handler without the MCP server's jsonschema pass; False where this FastMCP has no such hook
+
+    Every tool validates its own arguments (pydantic for functions, _checked for endpoints), so that pass,
+    which recompiles the schema on each call, only adds latency. It goes through private FastMCP attributes,
+    so any other version keeps its default handler, validation included.
+    '''
+    register = getattr(getattr(server, '_mcp_server', None), 'call_tool', None)
+    handler = getattr(server, '_mcp_call_tool', None)
+    try:
+        supported = handler is not None and 'validate_input' in inspect.signature(register).parameters
+    except (TypeError, ValueError):
+        supported = False
+    if supported:
+        register(validate_input=False)(handler)
+    return supported
+
+mcp = FastMCP('priceline-com-provider', tool_serializer=_serialize)
+mcp.add_middleware(TelemetryMiddleware())
+schema_validation_skipped = _skip_schema_validation(mcp)
+
+@mcp.custom_route('/metrics', methods=['GET'])
+async def metrics(request):
+    '''Prometheus scrape endpoint, served alongside the HTTP transports'''
+    from starlette.responses import PlainTextResponse
+    return PlainTextResponse(telemetry.prometheus(), media_type='text/plain; version=0.0.4')
+
+REQUIRED = object()  # default of a param the caller must supply
+
+# Plain upstream endpoints, one tool each: name -> (path, description, params), in the order they are listed.
+# A param is (name, kind, default, description); kind is 'string', 'number', 'boolean' or a tuple of choices.
+endpoint_tools = {
+    'search_car_rentals': ('/v1/cars-rentals/search', 'Search car rentals by filter. Indicate the `location_id` -> use `Search locations` api point', (
+        ('date_time_pickup', 'string', REQUIRED, 'Pickup date and time'),
+        ('location_return', 'string', REQUIRED, 'Location return code or id'),
+        ('location_pickup', 'string', REQUIRED, 'Location pickup code or id. Ex: JFK or 1365100023, use Search locations api point'),
+        ('date_time_return', 'string', REQUIRED, 'Return date and time'),
+    )),
+    'search_hotels': ('/v1/hotels/search', 'Get available hotels by the filter. Indicate the `location_id` -> use `Search locations`, check-in and check-out date', (
+        ('date_checkout', 'string', REQUIRED, 'Checkout date'),
+        ('date_checkin', 'string', REQUIRED, 'Checkin date'),
+        ('sort_order', ('HDR', 'PRICE', 'STAR', 'PROXIMITY', 'DEALS'), REQUIRED, ''),
+        ('location_id', 'string', REQUIRED, 'Location id, use Search locations api point'),
+        ('page_number', 'number', None, 'Number of page Default: 0 Minimum: 0 Maximum: 500'),
+        ('star_rating_ids', 'string', None, 'Hotel star ratings'),
+        ('rooms_number', 'number', None, 'Rooms number Default: 1 Minimum: 1 Maximum: 8'),
+        ('amenities_ids', 'string', None, 'Amenities'),
+    )),
+    'search_cars_locations': ('/v1/cars-rentals/locations', 'Search locations by name', (
+        ('name', 'string', REQUIRED, 'Name'),
+    )),
+    'hotel_details': ('/v1/hotels/details', 'Get all reviews and images of the hotel by hotel_id', (
+        ('hotel_id', 'number', REQUIRED, 'Hotel id Default: 6733503 Minimum: 1'),
+        ('offset_of_reviews', 'number', None, 'Offset of reviews Default: 0 Minimum: 0 Maximum: 1000'),
+    )),
+    'search_hotels_locations': ('/v1/hotels/locations', 'Search locations by name', (
+        ('name', 'string', REQUIRED, 'Name'),
+        ('search_type', ('ALL', 'CITY', 'AIRPORT', 'POI', 'HOTEL'), REQUIRED, ''),
+    )),
+    'search_flights_locations': ('/v1/flights/locations', 'Search airports and locations by name', (
+        ('name', 'string', REQUIRED, 'Name'),
+    )),
+    'search_flights': ('/v1/flights/search', 'Search flights. Type: only `ONE_WAY`. Set location_departure and location_arrival, use `/flights/locations` api point. You can filter out tickets by price, max duration and number of stops', (
+        ('location_departure', 'string', REQUIRED, 'Departure location code. Use Search locations api point'),
+        ('itinerary_type', ('ONE_WAY', 'ROUND_TRIP'), REQUIRED, ''),
+        ('date_departure', 'string', REQUIRED, 'Departure date'),
+        ('class_type', ('ECO', 'BUS', 'PEC', 'FST'), REQUIRED, ''),
+        ('sort_order', ('PRICE', 'ARRIVETIME', 'DEPARTTIME', 'TRAVELTIME'), REQUIRED, ''),
+        ('location_arrival', 'string', REQUIRED, 'Arrival location code'),
+        ('date_departure_return', 'string', None, 'Departure date back'),
+        ('price_max', 'number', None, 'Price max Default: 20000 Minimum: 1 Maximum: 1000000'),
+        ('price_min', 'number', None, 'Price min Default: 100 Minimum: 1 Maximum: 1000000'),
+        ('number_of_passengers', 'number', None, 'Number of passengers Default: 1 Minimum: 1 Maximum: 7'),
+        ('number_of_stops', 'number', None, 'Number of stops. 0 - is direct flight Default: 1 Minimum: 0 Maximum: 3'),
+        ('duration_max', 'number', None, 'Duration max. Minutes Default: 2051 Minimum: 1 Maximum: 10000'),
+    )),
+    'search_hotels_locations_by_geolocation': ('/v1/hotels/locations-by-geo', 'Search locations by coordinates. Set coordinates latitude and longitude', (
+        ('longitude', 'number', REQUIRED, 'Longitude Default: 14.41854 Minimum: -180 Maximum: 180'),
+        ('latitude', 'number', REQUIRED, 'Latitude Default: 50.073658 Minimum: -90 Maximum: 90'),
+    )),
+    'booking_details_of_the_hotel': ('/v1/hotels/booking-details', 'Get hotel descriptions, prices and available booking options. Indicate the hotel_id, check-in and check-out date', (
+        ('date_checkout', 'string', REQUIRED, 'Checkout date'),
+        ('hotel_id', 'number', REQUIRED, 'Hotel id Default: 6733503 Minimum: 1'),
+        ('date_checkin', 'string', REQUIRED, 'Checkin date'),
+        ('rooms_number', 'number', None, 'Rooms number Default: 1 Minimum: 1 Maximum: 8'),
+    )),
+    'seat_map': ('/v2/flight/seatMap', 'Gets the seat map of all flights in a contract bundle through the getFlightSeatMap endpoint', (
+        ('ppn_bundle', 'string', REQUIRED, 'The ppn_bundle for the seat map. Can be retrieved from the ppn_seat_bundle of FlightContract, or FlightLookUp.'),
+        ('sid', 'string', REQUIRED, 'Session ID. Random string ex.: j10k11l12m13n14'),
+    )),
+    'contract': ('/v2/flight/contract', 'Gets the contract for the PPN bundle provided by a flight return, departure, or combined (round trip/multi-city) through the getFlightContract endpoint', (
+        ('sid', 'string', REQUIRED, 'Session ID. Random string ex.: j10k11l12m13n14'),
+        ('ppn_bundle', 'string', None, 'The ppn_bundle for the seat map. Can be retrieved from the ppn_seat_bundle of Flight Contract, or LookUp'),
+        ('convert_currency', 'string', None, 'Requested currency for the results. ISO 4217 format.'),
+    )),
+    'search': ('/v2/flight/roundTrip', 'Returns a contract for a flight round trip search through the getFlightRoundTrip endpoint', (
+        ('sid', 'string', REQUIRED, 'Session ID. Random string'),
+        ('adults', 'number', REQUIRED, 'Number of adults Default: 1 Minimum: 1 Maximum: 8'),
+        ('departure_date', 'string', REQUIRED, 'Departure date'),
+        ('page', 'number', None, 'How many pages the results are spread over. Used in conjunction with results per page.'),
+        ('number_of_itineraries', 'number', None, 'Number of itineraries to retrieve'),
+        ('airline_filter', 'string', None, '2 Letter code used to specify which airline that has been used.'),
+        ('convert_currency', 'string', None, 'Requested currency for the results. ISO 4217 format.'),
+        ('cabin_class', 'string', None, 'economy premium business first'),
+        ('origin_airport_code', 'string', None, 'Airport code'),
+        ('destination_city_id', 'string', None, 'City id'),
+        ('results_per_page', 'number', None, 'Number of results per page. Used in conjunction with page.'),
+        ('currency', 'string', None, 'Requested currency for the results. ISO 4217 format.'),
+        ('children', 'number', None, 'Number of children Minimum: 0 Maximum: 8'),
+        ('destination_airport_code', 'string', None, 'Airport code'),
+        ('origin_city_id', 'string', None, 'City id'),
+    )),
+    'download_airports': ('/v2/flight/downloadAirports', 'Downloads a list of airports with IATA codes for Flight search', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 500'),
+    )),
+    'auto_complete': ('/v2/flight/autoComplete', 'Gets airport and city ids for the air product related to words in passed string through the getAutoComplete endpoint', (
+        ('string', 'string', REQUIRED, 'Airport or City being searched'),
+        ('hotels', 'boolean', None, 'Include hotels in search results'),
+        ('regions', 'boolean', None, 'Include regions in search results'),
+        ('airports', 'boolean', None, 'Include airports in search results'),
+        ('cities', 'boolean', None, 'Include cities in search results'),
+        ('longitude', 'string', None, 'Search for property availability around a specific longitude coordinate.'),
+        ('latitude', 'string', None, 'Search for property availability around a specific latitude coordinate.'),
+        ('pois', 'boolean', None, 'Include pois in search results'),
+        ('spellcheck', 'boolean', None, 'If the spell check is strict.'),
+    )),
+    'download_companies': ('/v2/cars/downloadCompanies', 'Downloads a list of companies', (
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 500'),
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+    )),
+    'download_cities': ('/v2/cars/downloadCities', 'Downloads a list of cities', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 500'),
+    )),
+    'download_locations': ('/v2/cars/downloadLocations', 'Downloads a list of Locations', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 500'),
+    )),
+    'download_property_types': ('/v2/hotels/downloadPropertyTypes', 'Downloads Property Types list', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+    )),
+    'downalods_hotels': ('/v2/hotels/downloadHotels', 'Downalods a list of Hotels', (
+        ('hotel_address', 'string', None, 'Filter by address of hotel.'),
+        ('active_vmer', 'string', None, 'Show hotels with vacation merchant rates.'),
+        ('active_bkg', 'string', None, 'Show hotels with Booking rates.'),
+        ('longitude_range_end', 'string', None, 'Requires longitude to have value.'),
+        ('latitude', 'string', None, 'Filter by latitude of the hotel.'),
+        ('latitude_range_end', 'string', None, 'Requires latitude to have value.'),
+        ('language', 'string', None, 'Language code: en-US, es-ES, fr-FR, pt-BR'),
+        ('state_code', 'string', None, 'Filter by the state code of the hotel.'),
+        ('country_code', 'string', None, 'Filter by the country code of the hotel.'),
+        ('active_agd', 'string', None, 'Show hotels with Agoda rates.'),
+        ('changes_since', 'string', None, 'Date/time to filter the hotels that have been updated on or after this date. This will discover the last_changed_date of hotels in inventory (inclusive of the selected date). Date should be in a valid ISO 8601: https://en.wikipedia.org/wiki/ISO_8601 (YYYY-MM-DDThh:mm:ss{UTC_Offset}) format.'),
+        ('hotelid_ppn', 'string', None, 'Filter by PPN hotel ID.'),
+        ('property_type_ids', 'string', None, 'Filter by property type ids. See the Property Type Filter Guide for more detail.'),
+        ('longitude', 'string', None, 'Requires longitude to have value.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+        ('active_smop', 'string', None, 'Show hotels with semi opaque rates.'),
+        ('active_mer', 'string', None, 'Show hotels with Priceline rates.'),
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('cityid_ppn', 'string', None, 'Filter by PPN city ID.'),
+    )),
+    'download_areas': ('/v2/hotels/downloadAreas', 'Downloads an Area list', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+    )),
+    'download_countries': ('/v2/hotels/downloadCountries', 'Downloads a list of countries', (
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+    )),
+    'download_chains': ('/v2/hotels/downloadChains', 'Downloads a list of Hotel chains', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+    )),
+    'download_amenities': ('/v2/hotels/downloadAmenities', 'Downloads a list of Amenities', (
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+        ('language', 'string', None, 'Language code: en-US, es-ES, fr-FR, pt-BR'),
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+    )),
+    'download_states': ('/v2/hotels/downloadStates', 'Downloads a list of Satets', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+    )),
+    'download_cities_clusters': ('/v2/hotels/downloadCitiesClusters', 'Downloads a list of Hotel cities clusters', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+    )),
+    'hotel_reviews': ('/v2/hotels/reviews', 'This API returns a list of reviews', (
+        ('hotel_id', 'string', REQUIRED, 'The PPN Hotel ID identifying the desired property.'),
+        ('languages', 'string', None, 'Limits the number of results from the response.'),
+        ('offset', 'number', None, 'Used with limit to only retrieve a subset of all results at a time. Determines the nuber of properties to skip (starting at 0) before returning results.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+        ('order_by', 'string', None, 'CSV of sorting order metrics. Valid Options: creation_date, average_rating, or verified_guest followed by .asc or .desc.'),
+        ('only_verified_guests', 'boolean', None, 'Set on to only include only reviews with verified_guests. A verified guest is a guest that has had a review verified by aaa. Valid Options: 0 = Off, 1 = On.'),
+    )),
+    'search_express_results': ('/v2/hotels/expressResults', 'Provides discounted Express (Cached) and Closed User Group (Live) Rates using the getExpress.Results endpoint.', (
+        ('check_in', 'string', REQUIRED, 'Check In Date (YYYY-MM-DD or MM/DD/YYYY)'),
+        ('check_out', 'string', REQUIRED, 'Check In Date (YYYY-MM-DD or MM/DD/YYYY)'),
+        ('rate_limit', 'number', None, 'Number passed to limit the number of rates returned. Defaults to returning all available rates'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+        ('radius', 'number', None, 'Radius in miles the results are from'),
+        ('limit_to_country', 'boolean', None, 'Limits results to country provided. Valid Options: true or false.'),
+        ('rate_identifier', 'boolean', None, 'A toggle to show if rate identifier is being passed. Valid Options: 0 = false, 1 = true. Rate is a string that is set for each hotel and holds all the information regarding the rate that we send to priceline.'),
+        ('multiple_deals', 'boolean', None, 'Multi Rates are provided Valid Options: 0 = false, 1 = true.'),
+        ('sid', 'string', None, 'Session ID. Random string'),
+        ('language', 'string', None, 'Language code: en-US, es-ES, fr-FR, pt-BR'),
+        ('adults', 'number', None, 'The total number of adult occupants for all rooms requested. Used with children parameter to determine occupancy. Example: Two rooms, each with one adult and one child occupants, adults=2 and children=2'),
+        ('hotel_ids', 'string', None, 'Comma separated string of PPN hotel ids (Semi Opaque Only)'),
+        ('rooms', 'number', None, 'Number of rooms required for all occupants'),
+        ('country_code', 'string', None, 'Pass the user s country to see rates with regional pricing. This is a two character ISO Alpha-2 country code.'),
+        ('sort_by', 'string', None, 'Sort results by a given option. Default sort is by guest_score. Valid Options: gs = guest_score, sr = star_rating, lp = lowest_price, hp = highest_price, ds = distance, mp = most_popular.'),
+        ('currency', 'string', None, 'Requested currency for the results. ISO 4217 format.'),
+        ('latitude', 'string', None, 'Search for property availability around a specific latitude coordinate.'),
+        ('output_version', 'number', None, 'Enum: 1 2 3 4 Default: 3'),
+        ('children', 'number', None, 'The total number of child occupants for all rooms requested. Used with adults parameter to determine occupancy. Example: Two rooms, each with one adult and one child occupants, adults=2 and children=2'),
+        ('city_id', 'string', None, 'Accepts a single PPN City ID.)'),
+        ('airport_code', 'string', None, 'Accepts a 3-character IATA airport code.'),
+        ('longitude', 'string', None, 'Search for property availability around a specific longitude coordinate'),
+    )),
+    'auto_suggest': ('/v2/hotels/autoSuggest', 'This API will provide a list of possible cities and hotels for a given search string', (
+        ('string', 'string', REQUIRED, 'Search string that will enable a list of selection to be listed to the traveller.'),
+        ('order', 'string', None, 'Method of ordering the results of the search. Valid options: asc or desc.'),
+        ('get_cities', 'boolean', None, 'Include cities in search results. Valid Options: True or False.'),
+        ('get_airports', 'boolean', None, 'Include airports in search results. Valid Options: True or False.'),
+        ('combine_regions', 'boolean', None, 'Enables the spell check option for the search string using either true or false.'),
+        ('spellcheck', 'boolean', None, 'Enables the spell check option for the search string using either true or false.'),
+        ('sort', 'string', None, 'Enum: rank, name. Method of sorting the results. Valid options: rank, name'),
+        ('show_all_cities', 'boolean', None, 'Will filter out cities with no hotels. Valid Options: False = filter out cities without hotels, True = show cities with and without hotels.'),
+        ('get_hotels', 'boolean', None, 'Include hotels in search results. Valid Options: True or False.'),
+        ('max_results', 'number', None, 'Number passed is the maximum number of results returned.'),
+        ('get_pois', 'boolean', None, 'Include Points of Interest in search results. Valid Options: True or False'),
+        ('get_regions', 'boolean', None, 'Include Regions in search results. Valid Options: True or False.'),
+    )),
+    'hotel_photos': ('/v2/hotels/photos', 'This API returns a list of photos per hotel', (
+        ('hotel_ids', 'string', REQUIRED, 'Comma separated string of PPN hotel ids (Semi Opaque Only)'),
+        ('image_size', 'string', None, 'The size of the image returned. Valid Options: small (60px), medium(300 to 312px) or large(500 to 800px)'),
+    )),
+    'express_contract': ('/v2/hotels/expressContract', 'Provides the hotel inventory and corresponding rates for Express (cache) or Closed User Group (live)', (
+        ('language', 'string', None, 'Language code: en-US, es-ES, fr-FR, pt-BR'),
+        ('country_code', 'string', None, 'Pass the user s country to see rates with regional pricing. This is a two character ISO Alpha-2 country code.'),
+        ('rate_identifier', 'boolean', None, 'A toggle to show if rate identifier is being passed. Valid Options: 0 = false, 1 = true. Rate is a string that is set for each hotel and holds all the information regarding the rate that we send to priceline.'),
+        ('output_version', 'number', None, 'Enum: 1 2 3 4 Default: 3'),
+        ('ppn_bundle', 'string', None, 'ppn_bundle is a unique ID that ppn uses to identify a specific rate'),
+        ('sid', 'string', None, 'Session ID. Random string'),
+    )),
+    'download_filter_amenities': ('/v2/hotels/downloadFilterAmenities', 'Downloads an Amenity list filtered', (
+        ('resume_key', 'string', None, 'Resume results from given ID.'),
+        ('limit', 'number', None, 'Limits the number of results from the response. Default: 100'),
+    )),
+}
+
+# Appended to the params of tools whose endpoint is cached, and of those with a slim preset.
+cache_options = (
+    ('bypass_cache', 'boolean', False, 'Skip the response cache and fetch fresh data'),
+)
+shape_options = (
+    ('fields', 'string', None, 'Comma separated JSONPath-style fields to keep, e.g. `pricedItinerary[*].pricingInfo.totalFare,..name`. Omit for the whole response'),
+    ('preset', ('full', 'slim'), 'full', '`slim` keeps only ids, names, ratings and prices. Ignored when fields is set'),
+)
+
+def _option_schema(name: str, kind, default, description: str) -> dict:
+    '''JSON schema of one param, shaped like the one pydantic generates for the equivalent annotation'''
+    if isinstance(kind, tuple):
+        schema = {'enum': list(kind), 'type': 'string'}
+    elif kind == 'number':
+        schema = {'anyOf': [{'type': 'integer'}, {'type': 'number'}]}
+    else:
+        schema = {'type': kind}
+    if default is None:
+        schema = {'anyOf': schema.get('anyOf', [schema]) + [{'type': 'null'}]}
+    if default is not REQUIRED:
+        schema['default'] = default
+    return {**schema, 'description': description, 'title': name.replace('_', ' ').title()}
+
+def _checked(name: str, kind, value):
+    '''Rejects an argument that does not match its param's schema'''
+    if isinstance(kind, tuple):
+        valid = value in kind
+    elif kind == 'number':
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, {'string': str, 'boolean': bool}[kind])
+    if not valid:
+        expected = f'one of {", ".join(map(repr, kind))}' if isinstance(kind, tuple) else f'a {kind}'
+        raise ToolError(f'Input validation error: {name} must be {expected}, got {value!r}')
+    return value
+
+class EndpointTool(Tool):
+    '''Forwards its arguments as the query of one upstream endpoint, through the shared request path'''
+    path: str
+    options: tuple
+    query: tuple
+
+    @classmethod
+    def from_endpoint(cls, name: str, path: str, description: str, params: tuple) -> 'EndpointTool':
+        options = params + (cache_options if path in endpoint_ttls else ()) + (shape_options if path in slim_presets else ())
+        parameters = {'properties': {option[0]: _option_schema(*option) for option in options}, 'type': 'object'}
+        required = [option[0] for option in options if option[2] is REQUIRED]
+        if required:
+            parameters['required'] = required
+        return cls(
+            name=name,
+            description=description,
+            parameters=parameters,
+            output_schema={'additionalProperties': True, 'type': 'object'},
+            serializer=_serialize,
+            path=path,
+            options=options,
+            query=tuple(param[0] for param in params),
+        )
+
+    async def run(self, arguments: dict) -> ToolResult:
+        unexpected = arguments.keys() - {option[0] for option in self.options}
+        if unexpected:
+            raise ToolError(f'Input validation error: unexpected arguments {", ".join(sorted(unexpected))}')
+        values = {}
+        for name, kind, default, _ in self.options:
+            value = arguments.get(name, default)
+            if value is REQUIRED:
+                raise ToolError(f'Input validation error: {name} is required')
+            values[name] = value if value is None and default is None else _checked(name, kind, value)
+        url = f'https://{api_host}{self.path}'
+        payload = {name: values[name] for name in self.query if values[name] is not None}
+        if prefetcher is not None:
+            prefetcher.claim(self.path, payload)
+        if warmer is not None:
+            warmer.record(self.path, payload)
+        bypass_cache = values.get('bypass_cache', False)
+        body = result_store.serve(self.path, payload) if result_store is not None and not bypass_cache else None
+        if body is None:
+            body = await _get(url, payload, bypass_cache=bypass_cache)
+            if result_store is not None:
+                result_store.keep(self.path, payload, body)
+        if prefetcher is not None:
+            prefetcher.follow(self.path, payload, body)
+        if 'preset' in values:
+            body = _shape(url, body, values['fields'], values['preset'])
+        return ToolResult(content=[TextContent(type='text', text=self.serializer(body))], structured_content=body)
+
+for name, (path, description, params) in endpoint_tools.items():
+    mcp.add_tool(EndpointTool.from_endpoint(name, path, description, params))
 
 @mcp.tool()
-def search_hotels_locations_by_geolocation(longitude: Annotated[Union[int, float], Field(description='Longitude Default: 14.41854 Minimum: -180 Maximum: 180')],
-                                           latitude: Annotated[Union[int, float], Field(description='Latitude Default: 50.073658 Minimum: -90 Maximum: 90')]) -> dict: 
-    '''Search locations by coordinates. Set coordinates latitude and longitude'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v1/hotels/locations-by-geo'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'longitude': longitude,
-        'latitude': latitude,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def hotel_details_batch(hotel_ids: Annotated[List[Union[int, str]], Field(description='Hotel ids')],
+                              offset_of_reviews: Annotated[Union[int, float, None], Field(description='Offset of reviews Default: 0 Minimum: 0 Maximum: 1000')] = None,
+                              bypass_cache: Annotated[bool, Field(description='Skip the response cache and fetch fresh data')] = False) -> dict: 
+    '''Get reviews and images for several hotels at once. Returns `results` keyed by hotel id and `errors` for hotels that failed'''
+    url = 'https://priceline-com-provider.p.rapidapi.com/v1/hotels/details'
+    calls = {}
+    for hotel_id in _unique_ids(hotel_ids):
+        payload = {'hotel_id': hotel_id, 'offset_of_reviews': offset_of_reviews}
+        payload = {k: v for k, v in payload.items() if v is not None}
+        calls[hotel_id] = functools.partial(_get, url, payload, bypass_cache=bypass_cache)
+    return await _fan_out(calls)
 
 @mcp.tool()
-def booking_details_of_the_hotel(date_checkout: Annotated[str, Field(description='Checkout date')],
-                                 hotel_id: Annotated[Union[int, float], Field(description='Hotel id Default: 6733503 Minimum: 1')],
-                                 date_checkin: Annotated[str, Field(description='Checkin date')],
-                                 rooms_number: Annotated[Union[int, float, None], Field(description='Rooms number Default: 1 Minimum: 1 Maximum: 8')] = None) -> dict: 
-    '''Get hotel descriptions, prices and available booking options. Indicate the hotel_id, check-in and check-out date'''
+async def booking_details_batch(date_checkout: Annotated[str, Field(description='Checkout date')],
+                                hotel_ids: Annotated[List[Union[int, str]], Field(description='Hotel ids')],
+                                date_checkin: Annotated[str, Field(description='Checkin date')],
+                                rooms_number: Annotated[Union[int, float, None], Field(description='Rooms number Default: 1 Minimum: 1 Maximum: 8')] = None,
+                                bypass_cache: Annotated[bool, Field(description='Skip the response cache and fetch fresh data')] = False) -> dict: 
+    '''Get descriptions, prices and booking options for several hotels at once. Returns `results` keyed by hotel id and `errors` for hotels that failed'''
     url = 'https://priceline-com-provider.p.rapidapi.com/v1/hotels/booking-details'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'date_checkout': date_checkout,
-        'hotel_id': hotel_id,
-        'date_checkin': date_checkin,
-        'rooms_number': rooms_number,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    calls = {}
+    for hotel_id in _unique_ids(hotel_ids):
+        payload = {'date_checkout': date_checkout, 'hotel_id': hotel_id, 'date_checkin': date_checkin, 'rooms_number': rooms_number}
+        payload = {k: v for k, v in payload.items() if v is not None}
+        calls[hotel_id] = functools.partial(_get, url, payload, bypass_cache=bypass_cache)
+    return await _fan_out(calls)
 
 @mcp.tool()
-def seat_map(ppn_bundle: Annotated[str, Field(description='The ppn_bundle for the seat map. Can be retrieved from the ppn_seat_bundle of FlightContract, or FlightLookUp.')],
-             sid: Annotated[str, Field(description='Session ID. Random string ex.: j10k11l12m13n14')]) -> dict: 
-    '''Gets the seat map of all flights in a contract bundle through the getFlightSeatMap endpoint'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/flight/seatMap'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'ppn_bundle': ppn_bundle,
-        'sid': sid,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def hotel_reviews_batch(hotel_ids: Annotated[List[Union[int, str]], Field(description='PPN Hotel IDs')],
+                              languages: Annotated[Union[str, None], Field(description='Limits the number of results from the response.')] = None,
+                              offset: Annotated[Union[int, float, None], Field(description='Number of reviews to skip per hotel (starting at 0).')] = None,
+                              limit: Annotated[Union[int, float, None], Field(description='Limits the number of reviews per hotel. Default: 100')] = None,
+                              order_by: Annotated[Union[str, None], Field(description='CSV of sorting order metrics. Valid Options: creation_date, average_rating, or verified_guest followed by .asc or .desc.')] = None,
+                              only_verified_guests: Annotated[Union[bool, None], Field(description='Only include reviews with verified guests.')] = None,
+                              bypass_cache: Annotated[bool, Field(description='Skip the response cache and fetch fresh data')] = False) -> dict: 
+    '''Get reviews for several hotels at once. Returns `results` keyed by hotel id and `errors` for hotels that failed'''
+    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/reviews'
+    calls = {}
+    for hotel_id in _unique_ids(hotel_ids):
+        payload = {'hotel_id': hotel_id, 'languages': languages, 'offset': offset, 'limit': limit,
+                   'order_by': order_by, 'only_verified_guests': only_verified_guests}
+        payload = {k: v for k, v in payload.items() if v is not None}
+        calls[hotel_id] = functools.partial(_get, url, payload, bypass_cache=bypass_cache)
+    return await _fan_out(calls)
 
 @mcp.tool()
-def contract(sid: Annotated[str, Field(description='Session ID. Random string ex.: j10k11l12m13n14')],
-             ppn_bundle: Annotated[Union[str, None], Field(description='The ppn_bundle for the seat map. Can be retrieved from the ppn_seat_bundle of Flight Contract, or LookUp')] = None,
-             convert_currency: Annotated[Union[str, None], Field(description='Requested currency for the results. ISO 4217 format.')] = None) -> dict: 
-    '''Gets the contract for the PPN bundle provided by a flight return, departure, or combined (round trip/multi-city) through the getFlightContract endpoint'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/flight/contract'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'sid': sid,
-        'ppn_bundle': ppn_bundle,
-        'convert_currency': convert_currency,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def hotel_photos_batch(hotel_ids: Annotated[List[Union[int, str]], Field(description='PPN hotel ids, any number')],
+                             image_size: Annotated[Union[str, None], Field(description='The size of the image returned. Valid Options: small (60px), medium(300 to 312px) or large(500 to 800px)')] = None,
+                             bypass_cache: Annotated[bool, Field(description='Skip the response cache and fetch fresh data')] = False) -> dict: 
+    '''Get photos for any number of hotels, coalescing the ids into as few upstream requests as possible. Returns `results` keyed by hotel id (or by the comma separated id chunk when the response cannot be split) and `errors` per chunk'''
+    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/photos'
+    ids = _unique_ids(hotel_ids)
+    chunks = {','.join(ids[i:i + photos_chunk_size]): ids[i:i + photos_chunk_size] for i in range(0, len(ids), photos_chunk_size)}
+    calls = {}
+    for chunk in chunks:
+        payload = {'hotel_ids': chunk, 'image_size': image_size}
+        payload = {k: v for k, v in payload.items() if v is not None}
+        calls[chunk] = functools.partial(_get, url, payload, bypass_cache=bypass_cache)
+    batch = await _fan_out(calls)
+    results = {}
+    for chunk, body in batch['results'].items():
+        per_hotel = _split_by_hotel(body, chunks[chunk])
+        if per_hotel:
+            results.update(per_hotel)
+        else:
+            results[chunk] = body
+    return {'results': results, 'errors': batch['errors'], 'requests': len(chunks)}
 
 @mcp.tool()
-def search(sid: Annotated[str, Field(description='Session ID. Random string')],
-           adults: Annotated[Union[int, float], Field(description='Number of adults Default: 1 Minimum: 1 Maximum: 8')],
-           departure_date: Annotated[str, Field(description='Departure date')],
-           page: Annotated[Union[int, float, None], Field(description='How many pages the results are spread over. Used in conjunction with results per page.')] = None,
-           number_of_itineraries: Annotated[Union[int, float, None], Field(description='Number of itineraries to retrieve')] = None,
-           airline_filter: Annotated[Union[str, None], Field(description='2 Letter code used to specify which airline that has been used.')] = None,
-           convert_currency: Annotated[Union[str, None], Field(description='Requested currency for the results. ISO 4217 format.')] = None,
-           cabin_class: Annotated[Union[str, None], Field(description='economy premium business first')] = None,
-           origin_airport_code: Annotated[Union[str, None], Field(description='Airport code')] = None,
-           destination_city_id: Annotated[Union[str, None], Field(description='City id')] = None,
-           results_per_page: Annotated[Union[int, float, None], Field(description='Number of results per page. Used in conjunction with page.')] = None,
-           currency: Annotated[Union[str, None], Field(description='Requested currency for the results. ISO 4217 format.')] = None,
-           children: Annotated[Union[int, float, None], Field(description='Number of children Minimum: 0 Maximum: 8')] = None,
-           destination_airport_code: Annotated[Union[str, None], Field(description='Airport code')] = None,
-           origin_city_id: Annotated[Union[str, None], Field(description='City id')] = None) -> dict: 
-    '''Returns a contract for a flight round trip search through the getFlightRoundTrip endpoint'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/flight/roundTrip'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'sid': sid,
-        'adults': adults,
-        'departure_date': departure_date,
-        'page': page,
-        'number_of_itineraries': number_of_itineraries,
-        'airline_filter': airline_filter,
-        'convert_currency': convert_currency,
-        'cabin_class': cabin_class,
-        'origin_airport_code': origin_airport_code,
-        'destination_city_id': destination_city_id,
-        'results_per_page': results_per_page,
-        'currency': currency,
-        'children': children,
-        'destination_airport_code': destination_airport_code,
-        'origin_city_id': origin_city_id,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def flight_price_calendar(location_departure: Annotated[str, Field(description='Departure location code. Use Search locations api point; an airport code for ROUND_TRIP')],
+                                location_arrival: Annotated[str, Field(description='Arrival location code; an airport code for ROUND_TRIP')],
+                                date_from: Annotated[str, Field(description='First departure date of the window, YYYY-MM-DD')],
+                                date_to: Annotated[str, Field(description='Last departure date of the window, YYYY-MM-DD')],
+                                itinerary_type: Annotated[Literal['ONE_WAY', 'ROUND_TRIP'], Field(description='')] = 'ONE_WAY',
+                                return_date_from: Annotated[Union[str, None], Field(description='First return date for ROUND_TRIP, YYYY-MM-DD. Default: date_from')] = None,
+                                return_date_to: Annotated[Union[str, None], Field(description='Last return date for ROUND_TRIP, YYYY-MM-DD. Default: date_to')] = None,
+                                class_type: Annotated[Literal['ECO', 'BUS', 'PEC', 'FST'], Field(description='')] = 'ECO',
+                                number_of_passengers: Annotated[Union[int, float, None], Field(description='Number of passengers Default: 1 Minimum: 1 Maximum: 7')] = None,
+                                number_of_stops: Annotated[Union[int, float, None], Field(description='Number of stops, ONE_WAY only. 0 - is direct flight Default: 1 Minimum: 0 Maximum: 3')] = None,
+                                max_searches: Annotated[Union[int, float, None], Field(description='Quota budget: most upstream searches to spend. Cached cells are free Default: 30')] = None,
+                                deadline_seconds: Annotated[Union[int, float, None], Field(description='Stop and return what is known after this many seconds Default: 30')] = None) -> dict: 
+    '''Cheapest fare per departure date (ONE_WAY, with `Search flights`) or per departure x return date pair (ROUND_TRIP, with the round trip `search`), searched concurrently within a quota budget and deadline. Returns a min-price matrix (null where unknown) and the best itinerary per cell'''
+    departures = _date_range(date_from, date_to)
+    if itinerary_type == 'ROUND_TRIP':
+        url = 'https://priceline-com-provider.p.rapidapi.com/v2/flight/roundTrip'
+        returns = _date_range(return_date_from or date_from, return_date_to or date_to)
+        cells = [(d, r) for d in departures for r in returns if r >= d]
+    else:
+        url = 'https://priceline-com-provider.p.rapidapi.com/v1/flights/search'
+        returns = None
+        cells = [(d, None) for d in departures]
+    path = _endpoint(url)
+    if len(cells) > 1000:
+        raise ValueError(f'{len(cells)} cells requested; narrow the window to at most 1000')
+    budget = 30 if max_searches is None else int(max_searches)
+    found, errors, status = {}, {}, Counter()
 
-@mcp.tool()
-def download_airports(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                      limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 500')] = None) -> dict: 
-    '''Downloads a list of airports with IATA codes for Flight search'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/flight/downloadAirports'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    async def search_cell(cell, payload):
+        try:
+            found[cell] = _cheapest_itinerary(await _get(url, payload))
+        except (httpx.HTTPError, ValueError) as e:
+            errors[cell] = repr(e)
+        status['searched'] += 1
 
-@mcp.tool()
-def auto_complete(string: Annotated[str, Field(description='Airport or City being searched')],
-                  hotels: Annotated[Union[bool, None], Field(description='Include hotels in search results')] = None,
-                  regions: Annotated[Union[bool, None], Field(description='Include regions in search results')] = None,
-                  airports: Annotated[Union[bool, None], Field(description='Include airports in search results')] = None,
-                  cities: Annotated[Union[bool, None], Field(description='Include cities in search results')] = None,
-                  longitude: Annotated[Union[str, None], Field(description='Search for property availability around a specific longitude coordinate.')] = None,
-                  latitude: Annotated[Union[str, None], Field(description='Search for property availability around a specific latitude coordinate.')] = None,
-                  pois: Annotated[Union[bool, None], Field(description='Include pois in search results')] = None,
-                  spellcheck: Annotated[Union[bool, None], Field(description='If the spell check is strict.')] = None) -> dict: 
-    '''Gets airport and city ids for the air product related to words in passed string through the getAutoComplete endpoint'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/flight/autoComplete'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'string': string,
-        'hotels': hotels,
-        'regions': regions,
-        'airports': airports,
-        'cities': cities,
-        'longitude': longitude,
-        'latitude': latitude,
-        'pois': pois,
-        'spellcheck': spellcheck,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    tasks = []
+    for cell in cells:
+        if returns is None:
+            payload = {'location_departure': location_departure, 'itinerary_type': itinerary_type, 'date_departure': cell[0],
+                       'class_type': class_type, 'sort_order': 'PRICE', 'location_arrival': location_arrival,
+                       'number_of_passengers': number_of_passengers, 'number_of_stops': number_of_stops}
+        else:
+            # Both legs in one getFlightRoundTrip query; a fixed sid keeps the cells cacheable across windows.
+            payload = {'sid': calendar_sid, 'adults': number_of_passengers or 1, 'departure_date': f'{cell[0]},{cell[1]}',
+                       'origin_airport_code': f'{location_departure},{location_arrival}',
+                       'destination_airport_code': f'{location_arrival},{location_departure}',
+                       'cabin_class': cabin_classes[class_type]}
+        payload = {k: v for k, v in payload.items() if v is not None}
+        body = await _lookup(path, _cache_key(path, payload), endpoint_ttls[path], response_cache.stats[path])
+        if body is not None:
+            found[cell] = _cheapest_itinerary(body)
+            status['cached'] += 1
+        elif budget > 0:
+            budget -= 1
+            tasks.append(functools.partial(search_cell, cell, payload))
+        else:
+            status['skipped_budget'] += 1
+    gate = asyncio.Semaphore(batch_concurrency)
 
-@mcp.tool()
-def download_companies(limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 500')] = None,
-                       resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None) -> dict: 
-    '''Downloads a list of companies'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/cars/downloadCompanies'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'limit': limit,
-        'resume_key': resume_key,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    async def bounded(search):
+        async with gate:
+            await search()
 
-@mcp.tool()
-def download_cities(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                    limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 500')] = None) -> dict: 
-    '''Downloads a list of cities'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/cars/downloadCities'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    deadline = 30.0 if deadline_seconds is None else float(deadline_seconds)
+    if tasks and deadline <= 0:
+        status['skipped_deadline'] = len(tasks)
+    elif tasks:
+        pending = [asyncio.ensure_future(bounded(t)) for t in tasks]
+        _, late = await asyncio.wait(pending, timeout=deadline)
+        for task in late:
+            task.cancel()
+        status['skipped_deadline'] = len(late)
 
-@mcp.tool()
-def download_locations(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                       limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 500')] = None) -> dict: 
-    '''Downloads a list of Locations'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/cars/downloadLocations'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    def price(cell):
+        return found.get(cell, (None, None))[0]
 
-@mcp.tool()
-def download_property_types(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                            limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None) -> dict: 
-    '''Downloads Property Types list'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadPropertyTypes'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    best = {'|'.join(filter(None, cell)): {'price': p, 'itinerary': itinerary}
+            for cell, (p, itinerary) in found.items() if p is not None}
+    cheapest = min(best.items(), key=lambda item: item[1]['price'], default=(None, None))
+    if returns is None:
+        matrix = {'dates': departures, 'prices': [price((d, None)) for d in departures]}
+    else:
+        matrix = {'departure_dates': departures, 'return_dates': returns,
+                  'prices': [[price((d, r)) for r in returns] for d in departures]}
+    return {**matrix, 'cheapest': {'cell': cheapest[0], 'price': cheapest[1]['price']} if cheapest[0] else None,
+            'best': best, 'errors': {'|'.join(filter(None, c)): e for c, e in errors.items()}, 'status': dict(status)}
 
 @mcp.tool()
-def downalods_hotels(hotel_address: Annotated[Union[str, None], Field(description='Filter by address of hotel.')] = None,
-                     active_vmer: Annotated[Union[str, None], Field(description='Show hotels with vacation merchant rates.')] = None,
-                     active_bkg: Annotated[Union[str, None], Field(description='Show hotels with Booking rates.')] = None,
-                     longitude_range_end: Annotated[Union[str, None], Field(description='Requires longitude to have value.')] = None,
-                     latitude: Annotated[Union[str, None], Field(description='Filter by latitude of the hotel.')] = None,
-                     latitude_range_end: Annotated[Union[str, None], Field(description='Requires latitude to have value.')] = None,
-                     language: Annotated[Union[str, None], Field(description='Language code: en-US, es-ES, fr-FR, pt-BR')] = None,
-                     state_code: Annotated[Union[str, None], Field(description='Filter by the state code of the hotel.')] = None,
-                     country_code: Annotated[Union[str, None], Field(description='Filter by the country code of the hotel.')] = None,
-                     active_agd: Annotated[Union[str, None], Field(description='Show hotels with Agoda rates.')] = None,
-                     changes_since: Annotated[Union[str, None], Field(description='Date/time to filter the hotels that have been updated on or after this date. This will discover the last_changed_date of hotels in inventory (inclusive of the selected date). Date should be in a valid ISO 8601: https://en.wikipedia.org/wiki/ISO_8601 (YYYY-MM-DDThh:mm:ss{UTC_Offset}) format.')] = None,
-                     hotelid_ppn: Annotated[Union[str, None], Field(description='Filter by PPN hotel ID.')] = None,
-                     property_type_ids: Annotated[Union[str, None], Field(description='Filter by property type ids. See the Property Type Filter Guide for more detail.')] = None,
-                     longitude: Annotated[Union[str, None], Field(description='Requires longitude to have value.')] = None,
-                     limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None,
-                     active_smop: Annotated[Union[str, None], Field(description='Show hotels with semi opaque rates.')] = None,
-                     active_mer: Annotated[Union[str, None], Field(description='Show hotels with Priceline rates.')] = None,
-                     resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                     cityid_ppn: Annotated[Union[str, None], Field(description='Filter by PPN city ID.')] = None) -> dict: 
-    '''Downalods a list of Hotels'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadHotels'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'hotel_address': hotel_address,
-        'active_vmer': active_vmer,
-        'active_bkg': active_bkg,
-        'longitude_range_end': longitude_range_end,
-        'latitude': latitude,
-        'latitude_range_end': latitude_range_end,
-        'language': language,
-        'state_code': state_code,
-        'country_code': country_code,
-        'active_agd': active_agd,
-        'changes_since': changes_since,
-        'hotelid_ppn': hotelid_ppn,
-        'property_type_ids': property_type_ids,
-        'longitude': longitude,
-        'limit': limit,
-        'active_smop': active_smop,
-        'active_mer': active_mer,
-        'resume_key': resume_key,
-        'cityid_ppn': cityid_ppn,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def stream_hotels(date_checkout: Annotated[str, Field(description='Checkout date')],
+                        date_checkin: Annotated[str, Field(description='Checkin date')],
+                        sort_order: Annotated[Literal['HDR', 'PRICE', 'STAR', 'PROXIMITY', 'DEALS'], Field(description='')],
+                        location_id: Annotated[str, Field(description='Location id, use Search locations api point')],
+                        ctx: Context,
+                        star_rating_ids: Annotated[Union[str, None], Field(description='Hotel star ratings')] = None,
+                        rooms_number: Annotated[Union[int, float, None], Field(description='Rooms number Default: 1 Minimum: 1 Maximum: 8')] = None,
+                        amenities_ids: Annotated[Union[str, None], Field(description='Amenities')] = None,
+                        price_max: Annotated[Union[int, float, None], Field(description='Only keep hotels priced at or under this')] = None,
+                        star_min: Annotated[Union[int, float, None], Field(description='Only keep hotels with at least this star rating')] = None,
+                        stop_after: Annotated[Union[int, float, None], Field(description='Stop once this many hotels are kept Default: 50 Maximum: 500')] = None,
+                        max_pages: Annotated[Union[int, float, None], Field(description='Most pages to walk Default: 20 Maximum: 501')] = None,
+                        window: Annotated[Union[int, float, None], Field(description='Pages fetched ahead concurrently Default: 3')] = None) -> dict: 
+    '''Walk `Search hotels` pages automatically, prefetching ahead, and keep hotels matching price_max/star_min until stop_after are found (e.g. first 20 hotels under $150). Matches are streamed as progress/log notifications while pages arrive'''
+    url = 'https://priceline-com-provider.p.rapidapi.com/v1/hotels/search'
 
-@mcp.tool()
-def download_areas(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                   limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None) -> dict: 
-    '''Downloads an Area list'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadAreas'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    def fetch(page):
+        payload = {'date_checkout': date_checkout, 'date_checkin': date_checkin, 'sort_order': sort_order,
+                   'location_id': location_id, 'page_number': page, 'star_rating_ids': star_rating_ids,
+                   'rooms_number': rooms_number, 'amenities_ids': amenities_ids}
+        return _get(url, {k: v for k, v in payload.items() if v is not None})
 
-@mcp.tool()
-def download_countries(limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None,
-                       resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None) -> dict: 
-    '''Downloads a list of countries'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadCountries'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'limit': limit,
-        'resume_key': resume_key,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    def keep(hotel):
+        if price_max is not None:
+            price = _number_of(hotel, price_fields)
+            if price is None or price > price_max:
+                return False
+        if star_min is not None:
+            stars = _number_of(hotel, star_fields)
+            if stars is None or stars < star_min:
+                return False
+        return True
 
-@mcp.tool()
-def download_chains(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                    limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None) -> dict: 
-    '''Downloads a list of Hotel chains'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadChains'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    return await _paginate(fetch, keep, min(50 if stop_after is None else int(stop_after), 500),
+                           min(20 if max_pages is None else int(max_pages), 501), max(1, int(window or 3)), ctx)
 
 @mcp.tool()
-def download_amenities(limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None,
-                       language: Annotated[Union[str, None], Field(description='Language code: en-US, es-ES, fr-FR, pt-BR')] = None,
-                       resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None) -> dict: 
-    '''Downloads a list of Amenities'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadAmenities'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'limit': limit,
-        'language': language,
-        'resume_key': resume_key,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def stream_hotel_reviews(hotel_id: Annotated[str, Field(description='The PPN Hotel ID identifying the desired property.')],
+                               ctx: Context,
+                               languages: Annotated[Union[str, None], Field(description='Limits the number of results from the response.')] = None,
+                               order_by: Annotated[Union[str, None], Field(description='CSV of sorting order metrics. Valid Options: creation_date, average_rating, or verified_guest followed by .asc or .desc.')] = None,
+                               only_verified_guests: Annotated[Union[bool, None], Field(description='Only include reviews with verified guests.')] = None,
+                               rating_min: Annotated[Union[int, float, None], Field(description='Only keep reviews rated at least this')] = None,
+                               page_size: Annotated[Union[int, float, None], Field(description='Reviews per upstream page Default: 100')] = None,
+                               stop_after: Annotated[Union[int, float, None], Field(description='Stop once this many reviews are kept Default: 100 Maximum: 1000')] = None,
+                               max_pages: Annotated[Union[int, float, None], Field(description='Most pages to walk Default: 20 Maximum: 100')] = None,
+                               window: Annotated[Union[int, float, None], Field(description='Pages fetched ahead concurrently Default: 3')] = None) -> dict: 
+    '''Walk `hotel_reviews` pages (offset/limit) automatically, prefetching ahead, and keep reviews rated at least rating_min until stop_after are found. Matches are streamed as progress/log notifications while pages arrive'''
+    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/reviews'
+    size = int(page_size or 100)
 
-@mcp.tool()
-def download_states(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                    limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None) -> dict: 
-    '''Downloads a list of Satets'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadStates'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+    def fetch(page):
+        payload = {'hotel_id': hotel_id, 'languages': languages, 'offset': page * size, 'limit': size,
+                   'order_by': order_by, 'only_verified_guests': only_verified_guests}
+        return _get(url, {k: v for k, v in payload.items() if v is not None})
+
+    def keep(review):
+        if rating_min is None:
+            return True
+        rating = _number_of(review, rating_fields)
+        return rating is not None and rating >= rating_min
+
+    return await _paginate(fetch, keep, min(100 if stop_after is None else int(stop_after), 1000),
+                           min(20 if max_pages is None else int(max_pages), 100), max(1, int(window or 3)), ctx)
 
 @mcp.tool()
-def download_cities_clusters(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                             limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None) -> dict: 
-    '''Downloads a list of Hotel cities clusters'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadCitiesClusters'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def resolve_location(name: Annotated[str, Field(description='Place name or code, or the start of one. Ex: new yo, JFK')],
+                           kinds: Annotated[Union[str, None], Field(description='Comma separated kinds to return: AIRPORT, CITY, LOCATION. Default: all')] = None,
+                           limit: Annotated[Union[int, float, None], Field(description='Maximum number of matches Default: 10 Minimum: 1 Maximum: 100')] = None) -> dict: 
+    '''Resolve a place name to airport, city and car rental location ids offline from the reference-data mirror. Falls back to `Search airports and locations` (or car rental locations for LOCATION only) when nothing matches locally'''
+    wanted = {k.strip().upper() for k in kinds.split(',')} if kinds else None
+    results = location_index().search(name, wanted, int(limit or 10))
+    if results:
+        return {'source': 'mirror', 'results': results}
+    if wanted == {'LOCATION'}:
+        url = 'https://priceline-com-provider.p.rapidapi.com/v1/cars-rentals/locations'
+    else:
+        url = 'https://priceline-com-provider.p.rapidapi.com/v1/flights/locations'
+    return {'source': 'upstream', 'results': await _get(url, {'name': name})}
 
 @mcp.tool()
-def hotel_reviews(hotel_id: Annotated[str, Field(description='The PPN Hotel ID identifying the desired property.')],
-                  languages: Annotated[Union[str, None], Field(description='Limits the number of results from the response.')] = None,
-                  offset: Annotated[Union[int, float, None], Field(description='Used with limit to only retrieve a subset of all results at a time. Determines the nuber of properties to skip (starting at 0) before returning results.')] = None,
-                  limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None,
-                  order_by: Annotated[Union[str, None], Field(description='CSV of sorting order metrics. Valid Options: creation_date, average_rating, or verified_guest followed by .asc or .desc.')] = None,
-                  only_verified_guests: Annotated[Union[bool, None], Field(description='Set on to only include only reviews with verified_guests. A verified guest is a guest that has had a review verified by aaa. Valid Options: 0 = Off, 1 = On.')] = None) -> dict: 
-    '''This API returns a list of reviews'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/reviews'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'hotel_id': hotel_id,
-        'languages': languages,
-        'offset': offset,
-        'limit': limit,
-        'order_by': order_by,
-        'only_verified_guests': only_verified_guests,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def nearby_places(points: Annotated[List[Annotated[List[float], Field(min_length=2, max_length=2)]], Field(description='Coordinates to search around, as [[latitude, longitude], ...]')],
+                        radius_miles: Annotated[Union[int, float, None], Field(description='Return every place within this many miles of each point. Omit to return the k nearest')] = None,
+                        k: Annotated[Union[int, float, None], Field(description='Maximum number of places per point Default: 10 with no radius, unlimited with a radius')] = None,
+                        kinds: Annotated[Union[str, None], Field(description='Comma separated kinds to return: HOTEL, CITY, AIRPORT. Default: all')] = None) -> dict: 
+    '''Find mirrored hotels, cities and airports near many coordinates in one batched in-memory query, instead of one `Search locations by coordinates` call per point. Requires a synced reference-data mirror'''
+    wanted = {kind.strip().upper() for kind in kinds.split(',')} if kinds else None
+    pairs = [(float(p[0]), float(p[1])) for p in points]
+    for i, (lat, lon) in enumerate(pairs):
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ToolError(f'points[{i}] must be [latitude -90..90, longitude -180..180], got [{lat}, {lon}]')
+    index = geo_index()
+    if radius_miles is not None:
+        matches = index.within(pairs, float(radius_miles), wanted, int(k) if k else None)
+    else:
+        matches = index.nearest(pairs, int(k or 10), wanted)
+    return {'results': [{'latitude': lat, 'longitude': lon, 'places': index.describe(idx, dist)}
+                        for (lat, lon), (idx, dist) in zip(pairs, matches)]}
 
 @mcp.tool()
-def search_express_results(check_in: Annotated[str, Field(description='Check In Date (YYYY-MM-DD or MM/DD/YYYY)')],
-                           check_out: Annotated[str, Field(description='Check In Date (YYYY-MM-DD or MM/DD/YYYY)')],
-                           rate_limit: Annotated[Union[int, float, None], Field(description='Number passed to limit the number of rates returned. Defaults to returning all available rates')] = None,
-                           limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None,
-                           radius: Annotated[Union[int, float, None], Field(description='Radius in miles the results are from')] = None,
-                           limit_to_country: Annotated[Union[bool, None], Field(description='Limits results to country provided. Valid Options: true or false.')] = None,
-                           rate_identifier: Annotated[Union[bool, None], Field(description='A toggle to show if rate identifier is being passed. Valid Options: 0 = false, 1 = true. Rate is a string that is set for each hotel and holds all the information regarding the rate that we send to priceline.')] = None,
-                           multiple_deals: Annotated[Union[bool, None], Field(description='Multi Rates are provided Valid Options: 0 = false, 1 = true.')] = None,
-                           sid: Annotated[Union[str, None], Field(description='Session ID. Random string')] = None,
-                           language: Annotated[Union[str, None], Field(description='Language code: en-US, es-ES, fr-FR, pt-BR')] = None,
-                           adults: Annotated[Union[int, float, None], Field(description='The total number of adult occupants for all rooms requested. Used with children parameter to determine occupancy. Example: Two rooms, each with one adult and one child occupants, adults=2 and children=2')] = None,
-                           hotel_ids: Annotated[Union[str, None], Field(description='Comma separated string of PPN hotel ids (Semi Opaque Only)')] = None,
-                           rooms: Annotated[Union[int, float, None], Field(description='Number of rooms required for all occupants')] = None,
-                           country_code: Annotated[Union[str, None], Field(description='Pass the user s country to see rates with regional pricing. This is a two character ISO Alpha-2 country code.')] = None,
-                           sort_by: Annotated[Union[str, None], Field(description='Sort results by a given option. Default sort is by guest_score. Valid Options: gs = guest_score, sr = star_rating, lp = lowest_price, hp = highest_price, ds = distance, mp = most_popular.')] = None,
-                           currency: Annotated[Union[str, None], Field(description='Requested currency for the results. ISO 4217 format.')] = None,
-                           latitude: Annotated[Union[str, None], Field(description='Search for property availability around a specific latitude coordinate.')] = None,
-                           output_version: Annotated[Union[int, float, None], Field(description='Enum: 1 2 3 4 Default: 3')] = None,
-                           children: Annotated[Union[int, float, None], Field(description='The total number of child occupants for all rooms requested. Used with adults parameter to determine occupancy. Example: Two rooms, each with one adult and one child occupants, adults=2 and children=2')] = None,
-                           city_id: Annotated[Union[str, None], Field(description='Accepts a single PPN City ID.)')] = None,
-                           airport_code: Annotated[Union[str, None], Field(description='Accepts a 3-character IATA airport code.')] = None,
-                           longitude: Annotated[Union[str, None], Field(description='Search for property availability around a specific longitude coordinate')] = None) -> dict: 
-    '''Provides discounted Express (Cached) and Closed User Group (Live) Rates using the getExpress.Results endpoint.'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/expressResults'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'check_in': check_in,
-        'check_out': check_out,
-        'rate_limit': rate_limit,
-        'limit': limit,
-        'radius': radius,
-        'limit_to_country': limit_to_country,
-        'rate_identifier': rate_identifier,
-        'multiple_deals': multiple_deals,
-        'sid': sid,
-        'language': language,
-        'adults': adults,
-        'hotel_ids': hotel_ids,
-        'rooms': rooms,
-        'country_code': country_code,
-        'sort_by': sort_by,
-        'currency': currency,
-        'latitude': latitude,
-        'output_version': output_version,
-        'children': children,
-        'city_id': city_id,
-        'airport_code': airport_code,
-        'longitude': longitude,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def search_car_rentals_nearby(date_time_pickup: Annotated[str, Field(description='Pickup date and time')],
+                                    date_time_return: Annotated[str, Field(description='Return date and time')],
+                                    near: Annotated[Union[str, None], Field(description='City, airport or rental location name or code to search around. Ex: Chicago, ORD')] = None,
+                                    latitude: Annotated[Union[int, float, None], Field(description='Latitude to search around, instead of near')] = None,
+                                    longitude: Annotated[Union[int, float, None], Field(description='Longitude to search around, instead of near')] = None,
+                                    radius_miles: Annotated[Union[int, float, None], Field(description='Search rental locations within this many miles Default: 25')] = None,
+                                    max_locations: Annotated[Union[int, float, None], Field(description='Most rental locations to search, nearest first Default: 10 Maximum: 50')] = None,
+                                    location_return: Annotated[Union[str, None], Field(description='Location return code or id. Default: each pickup location')] = None,
+                                    max_results: Annotated[Union[int, float, None], Field(description='Most offers to return Default: 50')] = None) -> dict: 
+    '''Search car rentals at every mirrored rental location near a place or coordinate at once, instead of one `Search car rentals` call per location found with `Search locations`. Returns offers from all of them deduplicated and sorted by price, with company names from the mirrored companies list (null until it has synced in the background). Requires a synced reference-data mirror'''
+    index = rental_location_index()
+    if not index.ids:
+        # Only the small companies list syncs by itself; an empty index is a missing mirror, not a place without cars.
+        raise ToolError('No rental locations are mirrored yet: run `python server.py sync locations` first')
+    if latitude is not None and longitude is not None:
+        center = {'latitude': float(latitude), 'longitude': float(longitude)}
+    elif near:
+        match = next(iter(location_index().search(near, None, 1)), None)
+        lat = _coordinate(match['record'], ('latitude', 'lat')) if match else None
+        lon = _coordinate(match['record'], ('longitude', 'lon', 'lng')) if match else None
+        if lat is None or lon is None:
+            raise ValueError(f'{near!r} matches no mirrored place with coordinates; pass latitude and longitude')
+        center = {'latitude': lat, 'longitude': lon, 'place': {k: match[k] for k in ('kind', 'id', 'name', 'code')}}
+    else:
+        raise ValueError('pass near, or latitude and longitude')
+    idx, dist = index.within([(center['latitude'], center['longitude'])], float(radius_miles or 25), None,
+                             min(int(max_locations or 10), 50))[0]
+    locations, places = {}, set()
+    for place in index.describe(idx, dist):
+        spot = (str(place['name']).lower(), place['latitude'], place['longitude'])
+        if place['id'] not in locations and spot not in places:
+            locations[place['id']] = place
+            places.add(spot)
+    url = 'https://priceline-com-provider.p.rapidapi.com/v1/cars-rentals/search'
+    calls = {}
+    for location_id in locations:
+        payload = {'date_time_pickup': date_time_pickup, 'location_return': location_return or location_id,
+                   'location_pickup': location_id, 'date_time_return': date_time_return}
+        calls[location_id] = functools.partial(_get, url, payload)
+    batch = await _fan_out(calls)
+    companies = company_table()
+    offers, seen, counts = [], set(), Counter()
+    for location_id, body in batch['results'].items():
+        place = locations[location_id]
+        for offer in _offers(body):
+            price, company = _number_of(offer, price_fields), _text_of(offer, company_fields)
+            key = (company, _text_of(offer, vehicle_fields), price, _text_of(offer, pickup_fields) or location_id)
+            if key in seen:
+                continue
+            seen.add(key)
+            counts[location_id] += 1
+            record = companies.get(company) or {}
+            offers.append({'price': price, 'company_code': company,
+                           'company': next((record[f] for f in company_name_fields if record.get(f)), None),
+                           'location_id': location_id, 'location_name': place['name'],
+                           'distance_miles': place['distance_miles'], 'offer': offer})
+    offers.sort(key=lambda o: (o['price'] is None, o['price'] or 0.0, o['distance_miles']))
+    return {'center': center,
+            'locations': [{**place, 'offers': counts[location_id]} for location_id, place in locations.items()],
+            'results': offers[:int(max_results or 50)], 'total': len(offers), 'errors': batch['errors']}
 
 @mcp.tool()
-def auto_suggest(string: Annotated[str, Field(description='Search string that will enable a list of selection to be listed to the traveller.')],
-                 order: Annotated[Union[str, None], Field(description='Method of ordering the results of the search. Valid options: asc or desc.')] = None,
-                 get_cities: Annotated[Union[bool, None], Field(description='Include cities in search results. Valid Options: True or False.')] = None,
-                 get_airports: Annotated[Union[bool, None], Field(description='Include airports in search results. Valid Options: True or False.')] = None,
-                 combine_regions: Annotated[Union[bool, None], Field(description='Enables the spell check option for the search string using either true or false.')] = None,
-                 spellcheck: Annotated[Union[bool, None], Field(description='Enables the spell check option for the search string using either true or false.')] = None,
-                 sort: Annotated[Union[str, None], Field(description='Enum: rank, name. Method of sorting the results. Valid options: rank, name')] = None,
-                 show_all_cities: Annotated[Union[bool, None], Field(description='Will filter out cities with no hotels. Valid Options: False = filter out cities without hotels, True = show cities with and without hotels.')] = None,
-                 get_hotels: Annotated[Union[bool, None], Field(description='Include hotels in search results. Valid Options: True or False.')] = None,
-                 max_results: Annotated[Union[int, float, None], Field(description='Number passed is the maximum number of results returned.')] = None,
-                 get_pois: Annotated[Union[bool, None], Field(description='Include Points of Interest in search results. Valid Options: True or False')] = None,
-                 get_regions: Annotated[Union[bool, None], Field(description='Include Regions in search results. Valid Options: True or False.')] = None) -> dict: 
-    '''This API will provide a list of possible cities and hotels for a given search string'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/autoSuggest'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'string': string,
-        'order': order,
-        'get_cities': get_cities,
-        'get_airports': get_airports,
-        'combine_regions': combine_regions,
-        'spellcheck': spellcheck,
-        'sort': sort,
-        'show_all_cities': show_all_cities,
-        'get_hotels': get_hotels,
-        'max_results': max_results,
-        'get_pois': get_pois,
-        'get_regions': get_regions,
+async def cache_stats() -> dict: 
+    '''Response cache hit/miss counters and collapsed duplicate requests per endpoint, and current memory usage'''
+    return {
+        'entries': len(response_cache.entries),
+        'bytes': response_cache.bytes,
+        'max_entries': response_cache.max_entries,
+        'max_bytes': response_cache.max_bytes,
+        'in_flight': len(_inflight),
+        'tier_write_errors': dict(tier_write_errors),
+        'endpoints': {path: dict(counts) for path, counts in response_cache.stats.items()},
     }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
 
 @mcp.tool()
-def hotel_photos(hotel_ids: Annotated[str, Field(description='Comma separated string of PPN hotel ids (Semi Opaque Only)')],
-                 image_size: Annotated[Union[str, None], Field(description='The size of the image returned. Valid Options: small (60px), medium(300 to 312px) or large(500 to 800px)')] = None) -> dict: 
-    '''This API returns a list of photos per hotel'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/photos'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'hotel_ids': hotel_ids,
-        'image_size': image_size,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def server_stats() -> dict: 
+    '''Latency histograms per tool and per upstream endpoint phase, bytes in/out, status codes, cache hit ratio and concurrency'''
+    stats = telemetry.snapshot()
+    if recorder is not None:
+        stats['recording'] = recorder.report()
+    if replayer is not None:
+        stats['replay'] = replayer.report()
+    if prefetcher is not None:
+        stats['prefetch'] = prefetcher.snapshot()
+    if result_store is not None:
+        stats['result_store'] = result_store.snapshot()
+    if warmer is not None:
+        stats['warming'] = warmer.snapshot()
+    return stats
 
 @mcp.tool()
-def express_contract(language: Annotated[Union[str, None], Field(description='Language code: en-US, es-ES, fr-FR, pt-BR')] = None,
-                     country_code: Annotated[Union[str, None], Field(description='Pass the user s country to see rates with regional pricing. This is a two character ISO Alpha-2 country code.')] = None,
-                     rate_identifier: Annotated[Union[bool, None], Field(description='A toggle to show if rate identifier is being passed. Valid Options: 0 = false, 1 = true. Rate is a string that is set for each hotel and holds all the information regarding the rate that we send to priceline.')] = None,
-                     output_version: Annotated[Union[int, float, None], Field(description='Enum: 1 2 3 4 Default: 3')] = None,
-                     ppn_bundle: Annotated[Union[str, None], Field(description='ppn_bundle is a unique ID that ppn uses to identify a specific rate')] = None,
-                     sid: Annotated[Union[str, None], Field(description='Session ID. Random string')] = None) -> dict: 
-    '''Provides the hotel inventory and corresponding rates for Express (cache) or Closed User Group (live)'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/expressContract'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'language': language,
-        'country_code': country_code,
-        'rate_identifier': rate_identifier,
-        'output_version': output_version,
-        'ppn_bundle': ppn_bundle,
-        'sid': sid,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def upstream_health() -> dict: 
+    '''Circuit breaker state, p95 latency and retry/hedge/deadline counters per upstream endpoint'''
+    paths = set(resilience_stats) | set(latencies) | set(breaker.failures)
+    return {path: {'breaker': breaker.state(path), 'consecutive_failures': breaker.failures[path],
+                   'p95_ms': round(_p95(path) * 1000, 3) if latencies[path] else None,
+                   **resilience_stats[path]}
+            for path in sorted(paths)}
 
 @mcp.tool()
-def download_filter_amenities(resume_key: Annotated[Union[str, None], Field(description='Resume results from given ID.')] = None,
-                              limit: Annotated[Union[int, float, None], Field(description='Limits the number of results from the response. Default: 100')] = None) -> dict: 
-    '''Downloads an Amenity list filtered'''
-    url = 'https://priceline-com-provider.p.rapidapi.com/v2/hotels/downloadFilterAmenities'
-    headers = {'x-rapidapi-host': 'priceline-com-provider.p.rapidapi.com', 'x-rapidapi-key': rapid_api_key}
-    payload = {
-        'resume_key': resume_key,
-        'limit': limit,
-    }
-    payload = {k: v for k, v in payload.items() if v is not None}
-    response = requests.get(url, headers=headers, params=payload)
-    return response.json()
+async def quota_stats() -> dict: 
+    '''Upstream scheduler state: queued calls and wait times per priority class, and rate/quota per API key'''
+    return scheduler.snapshot()
+
+async def replay_traffic() -> dict:
+    '''Re-issue the archived tool calls at their recorded offsets (or back to back at speed 0) against the replayed upstream'''
+    from fastmcp import Client
+    calls = replayer.calls()
+    errors = Counter()
+
+    async def one(client, at, tool, arguments):
+        if replayer.speed:
+            await asyncio.sleep(max(0.0, at / replayer.speed - (time.monotonic() - start)))
+        try:
+            await client.call_tool(tool, arguments)
+        except Exception as e:
+            errors[f'{tool}: {type(e).__name__}'] += 1
+
+    async with Client(mcp) as client:
+        start = time.monotonic()
+        await asyncio.gather(*(one(client, at, tool, arguments) for at, tool, arguments in calls))
+        wall = time.monotonic() - start
+    return {'calls': len(calls), 'wall_seconds': round(wall, 3), 'errors': dict(errors),
+            'replay': replayer.report(), 'tools': telemetry.snapshot()['tools']}
+
 
+def http_app():
+    '''ASGI app of one HTTP worker, also the factory uvicorn calls in each worker process
 
+    Streamable HTTP sessions are held in memory, so with several workers behind one listener every
+    request is served statelessly and may land on any of them.
+    '''
+    if http_transport == 'sse':
+        return mcp.http_app(transport='sse')
+    return mcp.http_app(transport='http', stateless_http=http_workers > 1 or None)
 
 if __name__ == '__main__':
     import sys
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9997
-    mcp.run(transport="stdio")
+    if len(sys.argv) > 1 and sys.argv[1] == 'sync':
+        args = sys.argv[2:]
+        full = '--full' in args
+        datasets = [a for a in args if a != '--full'] or None
+        for name, state in asyncio.run(sync_mirror(datasets, full)).items():
+            print(name, json.dumps(state))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'replay':
+        if replayer is None:
+            sys.exit('usage: PRICELINE_REPLAY=archive.sqlite3 [PRICELINE_REPLAY_SPEED=0] python server.py replay')
+        print(json.dumps(asyncio.run(replay_traffic()), indent=1))
+        sys.exit(0)
+    if len(sys.argv) < 2:
+        mcp.run(transport="stdio")
+        sys.exit(0)
+    port = int(sys.argv[1])
+    if http_transport == 'sse' and http_workers > 1:
+        sys.exit('SSE sessions live in the worker that opened them; use PRICELINE_TRANSPORT=http for several workers')
+    import uvicorn
+    if http_workers > 1:
+        uvicorn.run('server:http_app', factory=True, host=http_host, port=port, workers=http_workers,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(http_app(), host=http_host, port=port)
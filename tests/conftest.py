@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# server.py reads its configuration at import: keep every cache and mirror file out of the home directory.
+os.environ['PRICELINE_CACHE_DIR'] = tempfile.mkdtemp(prefix='priceline-tests-')
+os.environ.setdefault('PRICELINE_RATE_PER_SECOND', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import server
+
+COMPANIES = json.dumps({'getSharedBOF2.Downloads.Car.Companies': {'results': {
+    'status': 'Success', 'companies': {'company_0': {'company_code': 'ZE', 'company_name': 'Hertz'}}}}}).encode()
+
+
+@pytest.fixture(autouse=True)
+def mirror(monkeypatch, tmp_path):
+    mirror = server.Mirror(str(tmp_path / 'mirror.sqlite3'))
+    monkeypatch.setattr(server, 'mirror', mirror)
+    monkeypatch.setattr(server, 'retry_attempts', 0)
+    monkeypatch.setattr(server, '_companies_sync', None)
+    monkeypatch.setattr(server, '_companies_failures', 0)
+    monkeypatch.setattr(server, '_companies_retry_at', 0.0)
+    monkeypatch.setattr(server, '_indexes', {})
+    return mirror
+
+
+def use_transport(monkeypatch, handler):
+    monkeypatch.setattr(server, '_client', httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(server, '_client_loop', asyncio.get_running_loop())
+    monkeypatch.setattr(server, '_semaphore', asyncio.Semaphore(8))
+
+
+def test_table_is_filled_in_the_background(monkeypatch):
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return httpx.Response(200, content=COMPANIES)
+
+    async def run():
+        use_transport(monkeypatch, handler)
+        assert server.company_table() == {}
+        sync = server._companies_sync
+        assert sync is not None and not sync.done()
+        assert server.company_table() == {} and server._companies_sync is sync
+        release.set()
+        await asyncio.wait_for(sync, 1)
+        assert server.company_table()['ZE']['company_name'] == 'Hertz'
+        assert server._companies_sync is None
+
+    asyncio.run(run())
+
+
+def test_failed_sync_backs_off(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        raise httpx.ConnectError('down')
+
+    async def run():
+        use_transport(monkeypatch, handler)
+        assert server.company_table() == {}
+        await asyncio.gather(server._companies_sync, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert server._companies_sync is None and server._companies_failures == 1
+        assert server._companies_retry_at > server.time.monotonic() + server.companies_retry / 2
+        assert server.company_table() == {} and server._companies_sync is None
+        server._companies_retry_at = 0.0
+        server.company_table()
+        await asyncio.gather(server._companies_sync, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert server._companies_failures == 2
+        assert server._companies_retry_at > server.time.monotonic() + server.companies_retry * 1.5
+
+    asyncio.run(run())
+    assert len(requests) == 2
+
+
+def test_car_search_does_not_wait_for_companies(monkeypatch):
+    release = asyncio.Event()
+    index = server.GeoIndex.from_records({'locations': [{'location_id': 'L1', 'name': 'JFK', 'latitude': 40.64,
+                                                         'longitude': -73.78}]})
+    monkeypatch.setattr(server, 'rental_location_index', lambda: index)
+
+    async def handler(request):
+        if request.url.path in server.mirror_paths:
+            await release.wait()
+            return httpx.Response(200, content=COMPANIES)
+        return httpx.Response(200, json={'vehicles': [{'partnerCode': 'ZE', 'totalAllInclusivePrice': 55.0}]})
+
+    async def run():
+        use_transport(monkeypatch, handler)
+        result = await asyncio.wait_for(server.search_car_rentals_nearby.fn(
+            '2026-11-01T10:00:00', '2026-11-03T10:00:00', latitude=40.64, longitude=-73.78), 1)
+        assert [(o['company_code'], o['company']) for o in result['results']] == [('ZE', None)]
+        release.set()
+        await asyncio.wait_for(server._companies_sync, 1)
+        result = await server.search_car_rentals_nearby.fn(
+            '2026-11-01T10:00:00', '2026-11-03T10:00:00', latitude=40.64, longitude=-73.78)
+        assert result['results'][0]['company'] == 'Hertz'
+
+    server.response_cache.clear()
+    asyncio.run(run())
+
+
+def test_car_search_without_mirrored_locations_says_so(monkeypatch):
+    monkeypatch.setattr(server, 'rental_location_index', lambda: server.GeoIndex.from_records({'locations': []}))
+    with pytest.raises(server.ToolError, match='sync locations'):
+        asyncio.run(server.search_car_rentals_nearby.fn('2026-11-01T10:00:00', '2026-11-03T10:00:00',
+                                                        latitude=40.64, longitude=-73.78))
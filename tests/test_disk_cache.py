@@ -0,0 +1,58 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+
+import server
+
+PATH = '/v2/hotels/downloadHotels'
+
+
+def test_unwritable_cache_dir_falls_back_to_memory(monkeypatch, tmp_path):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+    monkeypatch.setattr(server, 'cache_dir', str(blocker / 'cache'))
+    assert server._disk_cache() is None
+    monkeypatch.setattr(server, 'cache_dir', str(tmp_path / 'cache'))
+    assert isinstance(server._disk_cache(), server.DiskCache)
+
+
+class SlowDisk(server.DiskCache):
+    def put(self, *args, **kwargs):
+        time.sleep(0.5)
+        super().put(*args, **kwargs)
+
+
+class BrokenDisk(server.DiskCache):
+    def get(self, key, stale_for=0.0):
+        raise sqlite3.OperationalError('disk I/O error')
+
+
+def fetch(monkeypatch, payload):
+    async def run():
+        monkeypatch.setattr(server, '_client', httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b'{"page": "' + b'x' * (4 << 20) + b'"}'))))
+        monkeypatch.setattr(server, '_client_loop', asyncio.get_running_loop())
+        monkeypatch.setattr(server, '_semaphore', asyncio.Semaphore(8))
+        start = time.perf_counter()
+        body = await server._get(server.api_url + PATH, payload)
+        return body, time.perf_counter() - start
+
+    server.response_cache.clear()
+    return asyncio.run(run())
+
+
+def test_large_page_is_written_to_disk_behind_the_response(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'disk_cache', SlowDisk(str(tmp_path / 'responses.sqlite3'), 1 << 30, 0))
+    body, seconds = fetch(monkeypatch, {'resume_key': 'slow'})
+    assert len(body['page']) == 4 << 20 and seconds < 0.4
+    server._tier_writer.submit(lambda: None).result()
+    assert server.disk_cache.get(server._cache_key(PATH, {'resume_key': 'slow'})) is not None
+
+
+def test_failing_disk_read_is_a_miss(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'disk_cache', BrokenDisk(str(tmp_path / 'responses.sqlite3'), 1 << 30, 0))
+    body, _ = fetch(monkeypatch, {'resume_key': 'broken'})
+    assert len(body['page']) == 4 << 20
+    server._tier_writer.submit(lambda: None).result()
@@ -0,0 +1,97 @@
+import asyncio
+import gc
+import json
+import warnings
+
+from fastmcp import Client
+
+import server
+
+
+def test_cheapest_itinerary_ignores_longer_reference_lists():
+    body = {'airport': [{'code': f'A{i}', 'name': f'Airport {i}'} for i in range(10)],
+            'pricedItinerary': [{'id': '1', 'pricingInfo': {'totalFare': 310.5}},
+                                {'id': '2', 'pricingInfo': {'totalFare': 199.0}}]}
+    price, itinerary = server._cheapest_itinerary(body)
+    assert price == 199.0
+    assert itinerary['id'] == '2'
+
+
+def test_cheapest_itinerary_of_round_trip_response():
+    body = {'getAirFlightRoundTrip': {'results': {'result': {'itinerary_data': {
+        'itinerary_0': {'ppn_bundle': 'a', 'price_details': {'display_total_fare': 420}},
+        'itinerary_1': {'ppn_bundle': 'b', 'price_details': {'display_total_fare': 380}}}}}}}
+    assert server._cheapest_itinerary(body)[0] == 380
+
+
+def call_calendar(monkeypatch, arguments, delays=None):
+    requests = []
+
+    async def fake_get(url, payload, bypass_cache=False, priority='interactive'):
+        requests.append((server._endpoint(url), payload))
+        await asyncio.sleep((delays or {}).get(payload.get('date_departure'), 0))
+        return {'pricedItinerary': [{'pricingInfo': {'totalFare': 100 + len(requests)}}]}
+
+    monkeypatch.setattr(server, '_get', fake_get)
+    server.response_cache.clear()
+
+    async def run():
+        async with Client(server.mcp) as client:
+            return await client.call_tool('flight_price_calendar', arguments)
+
+    result = asyncio.run(run())
+    return json.loads(result.content[0].text), requests
+
+
+def test_round_trip_cells_use_round_trip_search(monkeypatch):
+    result, requests = call_calendar(monkeypatch, {
+        'location_departure': 'JFK', 'location_arrival': 'LAX', 'date_from': '2026-11-01', 'date_to': '2026-11-02',
+        'itinerary_type': 'ROUND_TRIP', 'return_date_from': '2026-11-05', 'return_date_to': '2026-11-06'})
+    assert {path for path, _ in requests} == {'/v2/flight/roundTrip'}
+    assert sorted(payload['departure_date'] for _, payload in requests) == [
+        '2026-11-01,2026-11-05', '2026-11-01,2026-11-06', '2026-11-02,2026-11-05', '2026-11-02,2026-11-06']
+    assert requests[0][1]['origin_airport_code'] == 'JFK,LAX'
+    assert requests[0][1]['destination_airport_code'] == 'LAX,JFK'
+    assert all(price is not None for row in result['prices'] for price in row)
+
+
+def test_one_way_cells_use_flight_search(monkeypatch):
+    result, requests = call_calendar(monkeypatch, {
+        'location_departure': 'JFK', 'location_arrival': 'LAX', 'date_from': '2026-11-01', 'date_to': '2026-11-03'})
+    assert {path for path, _ in requests} == {'/v1/flights/search'}
+    assert all('date_departure_return' not in payload for _, payload in requests)
+    assert len(result['prices']) == 3
+
+
+ONE_WAY = {'location_departure': 'JFK', 'location_arrival': 'LAX', 'date_from': '2026-11-01', 'date_to': '2026-11-04'}
+
+
+def test_zero_search_budget_spends_nothing(monkeypatch):
+    result, requests = call_calendar(monkeypatch, {**ONE_WAY, 'max_searches': 0})
+    assert requests == []
+    assert result['status'] == {'skipped_budget': 4}
+
+
+def test_deadline_mid_run_counts_each_cell_once(monkeypatch):
+    result, requests = call_calendar(monkeypatch, {**ONE_WAY, 'deadline_seconds': 0.3},
+                                     delays={'2026-11-03': 5, '2026-11-04': 5})
+    assert len(requests) == 4
+    assert result['status'] == {'searched': 2, 'skipped_deadline': 2}
+    assert result['prices'][:2] != [None, None] and result['prices'][2:] == [None, None]
+
+
+def test_zero_deadline_searches_nothing(monkeypatch):
+    result, requests = call_calendar(monkeypatch, {**ONE_WAY, 'max_searches': 2, 'deadline_seconds': 0})
+    assert requests == []
+    assert result['status'] == {'skipped_budget': 2, 'skipped_deadline': 2}
+
+
+def test_cells_cancelled_before_starting_leave_no_unawaited_searches(monkeypatch):
+    monkeypatch.setattr(server, 'batch_concurrency', 1)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        result, requests = call_calendar(monkeypatch, {**ONE_WAY, 'deadline_seconds': 0.2}, delays={'2026-11-01': 5})
+        gc.collect()
+    assert len(requests) == 1
+    assert result['status'] == {'skipped_deadline': 4}
+    assert not [w for w in caught if 'never awaited' in str(w.message)]
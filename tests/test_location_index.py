@@ -0,0 +1,36 @@
+import server
+
+
+def index(branches=250):
+    return server.LocationIndex.from_records({
+        'locations': [{'location_id': str(i), 'location_name': f'San Antonio Rental Branch {i:03d}'} for i in range(branches)],
+        'cities': [{'cityid_ppn': '1', 'city': 'San Jose'}],
+    })
+
+
+def test_prefix_scores_whole_range():
+    results = index().search('san')
+    assert results[0]['name'] == 'San Jose'
+    assert len(results) == 10
+
+
+def test_shortlist_serves_larger_limit():
+    locations = index()
+    assert len(locations.search('san', limit=5)) == 5
+    assert len(locations.search('san', limit=80)) == 80
+    assert len(locations.search('san', limit=10)) == 10
+
+
+def test_kinds_filter_before_ranking():
+    results = index().search('san', kinds={'CITY'})
+    assert [r['name'] for r in results] == ['San Jose']
+    assert index().search('san', kinds={'LOCATION'})[0]['kind'] == 'LOCATION'
+
+
+def test_code_and_word_prefixes():
+    locations = server.LocationIndex.from_records({
+        'airports': [{'iata': 'JFK', 'airport': 'John F Kennedy International'}],
+        'cities': [{'cityid_ppn': '2', 'city': 'New York'}],
+    })
+    assert locations.search('jfk')[0]['code'] == 'JFK'
+    assert locations.search('york')[0]['name'] == 'New York'
@@ -0,0 +1,84 @@
+import json
+import random
+
+import pytest
+
+import server
+
+WORDS = ['plain', 'quote " inside', 'back\\slash', 'tab\there', 'line\nbreak', 'café', 'Zürich', '東京', 'emoji 🛫',
+         ' sep', 'slash/ok', '']
+
+
+def scalar(rng):
+    kind = rng.randrange(7)
+    if kind == 0:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.choice([0.0, 0.12, -3.5, 1e-7, 2.5e10, 123456.789, -0.001])
+    if kind == 2:
+        return rng.choice(WORDS)
+    if kind == 3:
+        return rng.choice([True, False, None])
+    if kind == 4:
+        return [scalar(rng) for _ in range(rng.randrange(3))]
+    if kind == 5:
+        return {rng.choice(WORDS): scalar(rng) for _ in range(rng.randrange(3))}
+    return rng.uniform(-1000, 1000)
+
+
+def page(rng, records, as_dict):
+    items = [{'id': str(i), 'name': rng.choice(WORDS), 'lat': rng.uniform(-90, 90), 'stars': rng.choice([3, 3.5, None]),
+              'tags': [rng.choice(WORDS) for _ in range(rng.randrange(3))], 'extra': scalar(rng)} for i in range(records)]
+    collection = {f'hotel_{i}': item for i, item in enumerate(items)} if as_dict else items
+    results = {'status': 'Success', 'time': rng.choice([0.12, 0.5, 1e-3, 7]), 'hotels': collection,
+               'resume_key': rng.choice([None, str(rng.randrange(10 ** 6))]), 'total': records}
+    return {'getSharedBOF2.Downloads.Hotel.Hotels': {'results': results}, 'version': 2.5}, items
+
+
+def decode(data: bytes, cuts) -> tuple:
+    decoder, records, last = server.PageDecoder(), [], 0
+    for cut in sorted(cuts):
+        records += decoder.feed(data[last:cut])
+        last = cut
+    records += decoder.feed(data[last:])
+    records += decoder.close()
+    return records, decoder.meta
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_random_splits_match_json_loads(seed):
+    rng = random.Random(seed)
+    document, items = page(rng, rng.randrange(0, 30), as_dict=seed % 2 == 0)
+    data = json.dumps(document, ensure_ascii=seed % 3 == 0, indent=rng.choice([None, 1])).encode()
+    expected = json.loads(data)['getSharedBOF2.Downloads.Hotel.Hotels']['results']
+    for _ in range(20):
+        cuts = {rng.randrange(len(data) + 1) for _ in range(rng.randrange(1, 40))}
+        records, meta = decode(data, cuts)
+        assert records == items
+        assert meta == {k: v for k, v in expected.items() if k != 'hotels'}
+
+
+def test_every_single_cut():
+    document, items = page(random.Random(1), 3, as_dict=True)
+    data = json.dumps(document, ensure_ascii=False).encode()
+    for cut in range(len(data) + 1):
+        assert decode(data, [cut])[0] == items
+
+
+def test_byte_at_a_time():
+    document, items = page(random.Random(2), 5, as_dict=False)
+    data = json.dumps(document, ensure_ascii=False).encode()
+    assert decode(data, range(len(data)))[0] == items
+
+
+def test_number_cut_after_point():
+    data = b'{"results": {"status": "Success", "time": 0.12, "hotels": {"hotel_0": {"id": 1}}}}'
+    cut = data.index(b'0.') + 2
+    records, meta = decode(data, [cut])
+    assert records == [{'id': 1}] and meta['time'] == 0.12
+
+
+@pytest.mark.parametrize('body', [b'{"results": {"hotels": [{"id": 1}]}', b'{"results": {"time": 0.}}', b'[1, 2]'])
+def test_malformed_pages_raise(body):
+    with pytest.raises(ValueError):
+        decode(body, [])
@@ -0,0 +1,31 @@
+import asyncio
+
+import server
+
+
+def walk(monkeypatch, tool, **arguments):
+    requests = []
+
+    async def fake_get(url, payload, bypass_cache=False, priority='interactive'):
+        requests.append(payload)
+        return {'reviews': [{'id': i, 'average_rating': 2} for i in range(10)]}
+
+    monkeypatch.setattr(server, '_get', fake_get)
+    result = asyncio.run(tool.fn(ctx=None, **arguments))
+    return result, requests
+
+
+def test_review_walk_is_capped(monkeypatch):
+    result, requests = walk(monkeypatch, server.stream_hotel_reviews, hotel_id='700', rating_min=9, max_pages=10 ** 6)
+    assert result['pages_fetched'] == 100 and len(requests) == 100
+
+
+def test_review_walk_stops_at_zero(monkeypatch):
+    result, requests = walk(monkeypatch, server.stream_hotel_reviews, hotel_id='700', stop_after=0)
+    assert requests == [] and result['results'] == []
+
+
+def test_hotel_walk_stops_at_zero(monkeypatch):
+    result, requests = walk(monkeypatch, server.stream_hotels, date_checkout='2026-11-03', date_checkin='2026-11-01',
+                            sort_order='PRICE', location_id='3000', stop_after=0)
+    assert requests == [] and result['results'] == []
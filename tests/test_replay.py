@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+import httpx
+
+import server
+
+PATH, PAYLOAD = '/v1/hotels/details', {'hotel_id': '700'}
+RECORDED = {'hotel': {'id': '700', 'name': 'Recorded'}}
+
+RUN = '''
+import asyncio, json, server
+body = asyncio.run(server._get(server.api_url + %r, %r))
+print(json.dumps({'body': body, 'replay': server.replayer.report(), 'stats': server.response_cache.stats[%r]}))
+'''
+
+
+def test_replay_ignores_a_warm_cache_directory(tmp_path):
+    archive = str(tmp_path / 'traffic.sqlite3')
+    server.Recorder(archive).exchange(PATH, PAYLOAD, httpx.Response(200, json=RECORDED, request=httpx.Request('GET', server.api_url)), 0.0)
+    warm = tmp_path / 'warm'
+    key = server._cache_key(PATH, PAYLOAD)
+    cached = json.dumps({'hotel': {'id': '700', 'name': 'Cached here'}}).encode()
+    for fresh in (True, False):  # a fresh entry would be served; an expired one would be revalidated with its ETag
+        server.DiskCache(str(warm / 'responses.sqlite3'), 1 << 20, 0).put(key, PATH, cached, 60 if fresh else -60,
+                                                                          {'if-none-match': '"local"'})
+        env = {**os.environ, 'PRICELINE_CACHE_DIR': str(warm), 'PRICELINE_REPLAY': archive, 'PRICELINE_REPLAY_SPEED': '0'}
+        out = subprocess.run([sys.executable, '-c', RUN % (PATH, PAYLOAD, PATH)], env=env, capture_output=True, text=True,
+                             cwd=os.path.dirname(server.__file__), check=True).stdout
+        result = json.loads(out)
+        assert result['body'] == RECORDED
+        assert result['replay']['served'] == 1 and result['replay']['mismatches'] == []
+        assert 'disk_hits' not in result['stats'] and 'revalidated' not in result['stats']
@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+import server
+
+PATH = '/v1/hotels/search'
+
+
+def test_import_leaves_numpy_unloaded():
+    code = 'import sys, server; print("numpy" in sys.modules, server.result_store is not None)'
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=server.os.path.dirname(server.__file__)).stdout.split()
+    assert out == ['False', 'True']
+
+
+def test_numpy_imported_when_a_set_is_served():
+    store = server.ResultStore(4)
+    hotels = [{'hotelId': i, 'ratesSummary': {'minPrice': price}, 'starRating': 3} for i, price in enumerate([120, 80, 95])]
+    payload = {'location': 'Boston', 'sort_order': 'STAR'}
+    store.keep(PATH, payload, {'hotels': hotels, 'totalSize': 3})
+    assert 'np' not in vars(store)
+    body = store.serve(PATH, dict(payload, sort_order='PRICE'))
+    assert [hotel['hotelId'] for hotel in body['hotels']] == [1, 2, 0]
+    assert 'np' in vars(store)
@@ -0,0 +1,133 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+
+import server
+
+PATH, PAYLOAD = '/v1/hotels/details', {'hotel_id': '700'}
+URL = server.api_url + PATH
+BODY = json.dumps({'hotel': {'id': '700', 'name': 'Harbor View', 'description': 'quiet rooms ' * 200}}).encode()
+ETAG = '"v1"'
+
+
+@pytest.fixture(autouse=True)
+def tiers(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'telemetry', server.Telemetry())
+    monkeypatch.setattr(server, 'disk_cache', server.DiskCache(str(tmp_path / 'responses.sqlite3'), 1 << 20, 0))
+    server.response_cache.clear()
+    server.response_cache.stats.clear()
+
+
+def origin(requests):
+    '''Serves BODY gzipped with an ETag, and 304 to a request carrying it'''
+    def handler(request):
+        requests.append(request)
+        if request.headers.get('if-none-match') == ETAG:
+            return httpx.Response(304, headers={'etag': ETAG})
+        return httpx.Response(200, headers={'etag': ETAG, 'content-encoding': 'gzip', 'content-type': 'application/json'},
+                              content=chunks(gzip.compress(BODY)))
+    return handler
+
+
+async def chunks(data):
+    yield data
+
+
+def get(monkeypatch, handler, times=1):
+    async def run():
+        monkeypatch.setattr(server, '_client', httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(server, '_client_loop', asyncio.get_running_loop())
+        monkeypatch.setattr(server, '_semaphore', asyncio.Semaphore(8))
+        return [await server._get(URL, PAYLOAD) for _ in range(times)]
+
+    bodies = asyncio.run(run())
+    server._tier_writer.submit(lambda: None).result()  # disk writes queued behind the responses
+    return bodies
+
+
+def expire(key):
+    expires, size, body, validators = server.response_cache.entries[key]
+    server.response_cache.put(key, body, size, -1, validators)
+    server.disk_cache.renew(key, -1, validators)
+
+
+def test_compressed_response_is_counted_and_kept_with_validators(monkeypatch):
+    requests = []
+    assert get(monkeypatch, origin(requests)) == [json.loads(BODY)]
+    key = server._cache_key(PATH, PAYLOAD)
+    wire = len(gzip.compress(BODY))
+    assert server.telemetry.wire_bytes[PATH] == wire
+    assert server.telemetry.bytes_saved[PATH]['compression'] == len(BODY) - wire
+    assert server.response_cache.entries[key][3] == {'if-none-match': ETAG}
+    assert server.disk_cache.held(key) == (BODY, {'if-none-match': ETAG})
+
+
+def test_not_modified_renews_held_body(monkeypatch):
+    requests = []
+    get(monkeypatch, origin(requests))
+    key = server._cache_key(PATH, PAYLOAD)
+    expire(key)
+    wire = server.telemetry.wire_bytes[PATH]
+    assert get(monkeypatch, origin(requests)) == [json.loads(BODY)]
+    assert requests[-1].headers['if-none-match'] == ETAG
+    stats = server.response_cache.stats[PATH]
+    assert stats['revalidated'] == 1 and stats['modified'] == 0
+    assert server.telemetry.bytes_saved[PATH]['not_modified'] == len(BODY)
+    assert server.telemetry.wire_bytes[PATH] == wire
+    assert server.response_cache.entries[key][0] > server.time.monotonic() + server.endpoint_ttls[PATH] - 60
+    assert server.disk_cache.get(key)[1] > server.endpoint_ttls[PATH] - 60
+    get(monkeypatch, origin(requests))
+    assert len(requests) == 2
+
+
+def test_not_modified_without_memory_entry_uses_disk(monkeypatch):
+    requests = []
+    get(monkeypatch, origin(requests))
+    key = server._cache_key(PATH, PAYLOAD)
+    expire(key)
+    server.response_cache.clear()
+    assert get(monkeypatch, origin(requests)) == [json.loads(BODY)]
+    assert server.response_cache.stats[PATH]['revalidated'] == 1
+
+
+def test_unsolicited_not_modified_is_fetched_again(monkeypatch):
+    requests = []
+
+    def shared_cache(request):
+        requests.append(request)
+        if request.headers.get('cache-control') != 'no-cache':
+            return httpx.Response(304, headers={'etag': ETAG})
+        return httpx.Response(200, headers={'etag': ETAG}, content=BODY)
+
+    assert get(monkeypatch, shared_cache) == [json.loads(BODY)]
+    assert len(requests) == 2 and 'if-none-match' not in requests[0].headers
+    stats = server.response_cache.stats[PATH]
+    assert stats['unsolicited_304'] == 1 and stats['revalidated'] == 0
+
+
+def test_repeated_unsolicited_not_modified_raises(monkeypatch):
+    with pytest.raises(httpx.HTTPStatusError):
+        get(monkeypatch, lambda request: httpx.Response(304))
+
+
+def test_replay_matches_conditional_requests_separately(tmp_path):
+    path = str(tmp_path / 'traffic.sqlite3')
+    recorder = server.Recorder(path)
+    request = httpx.Request('GET', URL)
+    recorder.exchange(PATH, PAYLOAD, httpx.Response(200, content=BODY, request=request), 0.01)
+    recorder.exchange(PATH, PAYLOAD, httpx.Response(304, request=request), 0.01, {'if-none-match': ETAG})
+    replayer = server.Replayer(path, 0)
+
+    async def run():
+        plain = await replayer.respond(PATH, PAYLOAD)
+        conditional = await replayer.respond(PATH, PAYLOAD, {'if-none-match': ETAG})
+        return plain, conditional
+
+    plain, conditional = asyncio.run(run())
+    assert (plain.status_code, plain.content) == (200, BODY)
+    assert conditional.status_code == 304
+    with pytest.raises(server.ReplayMismatch):
+        asyncio.run(replayer.respond(PATH, PAYLOAD, {'if-none-match': '"other"'}))
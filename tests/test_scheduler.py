@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import server
+
+
+@pytest.fixture
+def reserved(monkeypatch):
+    '''A scheduler whose only key is down to its quota reserve: interactive calls only'''
+    scheduler = server.Scheduler(['key'])
+    bucket = scheduler.buckets[0]
+    bucket.limit, bucket.remaining, bucket.reset_at = 100, 5, time.monotonic() + 3600
+    monkeypatch.setattr(server, 'scheduler', scheduler)
+    return scheduler
+
+
+def use_transport(monkeypatch, handler):
+    monkeypatch.setattr(server, '_client', httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(server, '_client_loop', asyncio.get_running_loop())
+    monkeypatch.setattr(server, '_semaphore', asyncio.Semaphore(8))
+
+
+def test_promote_moves_queued_waiter(reserved):
+    async def run():
+        ticket = server.Ticket('prefetch')
+        waiter = asyncio.ensure_future(reserved.acquire(ticket))
+        await asyncio.sleep(0.05)
+        assert not waiter.done() and reserved.depth['prefetch'] == 1
+        assert reserved.promote(ticket, 'interactive')
+        assert not reserved.promote(ticket, 'warm')
+        bucket = await asyncio.wait_for(waiter, 1)
+        assert bucket is reserved.buckets[0]
+        assert reserved.depth['prefetch'] == 0 and reserved.depth['interactive'] == 0
+        assert reserved.waits['interactive']['calls'] == 1
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('background', ['prefetch', 'warm'])
+def test_interactive_call_joining_background_flight_is_not_held_back(reserved, monkeypatch, background):
+    path, payload = '/v2/flight/contract', {'sid': 's', 'ppn_bundle': background}
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={'ok': True})
+
+    async def run():
+        use_transport(monkeypatch, handler)
+        url = f'https://{server.api_host}{path}'
+        queued = asyncio.ensure_future(server._get(url, payload, bypass_cache=True, priority=background))
+        await asyncio.sleep(0.05)
+        assert not queued.done()
+        body = await asyncio.wait_for(server._get(url, payload), 1)
+        assert body == {'ok': True} and await queued == body
+
+    server.response_cache.clear()
+    asyncio.run(run())
+    assert len(requests) == 1
+    assert server.response_cache.stats[path]['promoted'] >= 1
@@ -0,0 +1,70 @@
+import asyncio
+import socket
+import time
+
+import httpx
+import pytest
+
+import server
+
+
+@pytest.fixture
+def unresponsive_redis(monkeypatch):
+    '''A RedisState whose server accepts connections and never answers: every call waits out redis_timeout'''
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    state = server.RedisState(f'redis://127.0.0.1:{listener.getsockname()[1]}/0')
+    monkeypatch.setattr(server, 'shared_state', state)
+    yield state
+    listener.close()
+
+
+async def longest_stall(work) -> tuple:
+    '''(result of `work`, longest time the event loop went without running a 5 ms ticker meanwhile)'''
+    gaps, done = [], asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.02)
+    try:
+        return await work, max(gaps)
+    finally:
+        done.set()
+        await tick
+
+
+def test_scheduler_admits_without_blocking_the_loop(unresponsive_redis, monkeypatch):
+    scheduler = server.Scheduler(['key'])
+    monkeypatch.setattr(server, 'scheduler', scheduler)
+    start = time.perf_counter()
+    bucket, stall = asyncio.run(longest_stall(scheduler.acquire('interactive')))
+    assert bucket is scheduler.buckets[0]
+    assert time.perf_counter() - start >= server.redis_timeout * 0.8  # it did wait on Redis, just not on the loop
+    assert stall < 0.1
+    assert unresponsive_redis.stats['errors'] == 1
+
+
+def test_second_tier_calls_leave_the_loop_free(unresponsive_redis, monkeypatch):
+    monkeypatch.setattr(server, 'disk_cache', unresponsive_redis)
+    monkeypatch.setattr(server, 'scheduler', server.Scheduler(['key']))
+    server.response_cache.clear()
+
+    async def run():
+        monkeypatch.setattr(server, '_client', httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, json={'ok': True}))))
+        monkeypatch.setattr(server, '_client_loop', asyncio.get_running_loop())
+        monkeypatch.setattr(server, '_semaphore', asyncio.Semaphore(8))
+        return await longest_stall(server._get(server.api_url + '/v1/hotels/details', {'hotel_id': 'slow'}))
+
+    body, stall = asyncio.run(run())
+    assert body == {'ok': True}
+    assert stall < 0.1
+    server._tier_writer.submit(lambda: None).result()
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import random
+
+import httpx
+import pytest
+
+import server
+
+PATH = '/v2/hotels/downloadHotels'
+TTL = server.endpoint_ttls[PATH]
+
+
+def body(records, seed=0):
+    rng = random.Random(seed)
+    hotels = {f'hotel_{i}': {'hotelid_ppn': str(i), 'hotel_name': ''.join(rng.choice('abcdefghij') for _ in range(40)),
+                             'latitude': rng.uniform(-90, 90)} for i in range(records)}
+    return json.dumps({'getSharedBOF2.Downloads.Hotel.Hotels': {'results': {
+        'status': 'Success', 'hotels': hotels, 'resume_key': 'next'}}}).encode()
+
+
+@pytest.fixture
+def mirror(monkeypatch, tmp_path):
+    mirror = server.Mirror(str(tmp_path / 'mirror.sqlite3'))
+    mirror.start('hotels', None, server._utcnow())
+    monkeypatch.setattr(server, 'mirror', mirror)
+    monkeypatch.setattr(server, 'sync_part_bytes', 4096)
+    return mirror
+
+
+def sync(monkeypatch, data, fail_after=None):
+    async def chunks():
+        for n, start in enumerate(range(0, len(data), 1000)):
+            if fail_after is not None and n == fail_after:
+                raise httpx.ReadError('connection reset')
+            yield data[start:start + 1000]
+
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+        monkeypatch.setattr(server, '_client', httpx.AsyncClient(transport=transport))
+        monkeypatch.setattr(server, '_client_loop', asyncio.get_running_loop())
+        monkeypatch.setattr(server, '_semaphore', asyncio.Semaphore(8))
+        return await server._sync_page('hotels', PATH, {'limit': 500})
+
+    return asyncio.run(run())
+
+
+def parts(mirror):
+    return mirror._conn().execute('SELECT part FROM page_parts ORDER BY part').fetchall()
+
+
+def test_page_is_written_in_parts(monkeypatch, mirror):
+    data = body(5000)
+    assert sync(monkeypatch, data) == (5000, 'next')
+    key = server._cache_key(PATH, {'limit': 500})
+    assert mirror.page(key, TTL) == data
+    assert len(parts(mirror)) > 3 and all(part >= 0 for part, in parts(mirror))
+    assert mirror.state('hotels')['records'] == 5000
+
+
+def test_cut_page_keeps_last_copy(monkeypatch, mirror):
+    first, second = body(5000, seed=1), body(5000, seed=2)
+    sync(monkeypatch, first)
+    key = server._cache_key(PATH, {'limit': 500})
+    with pytest.raises(httpx.ReadError):
+        sync(monkeypatch, second, fail_after=300)
+    assert mirror.page(key, TTL) == first
+    assert any(part < 0 for part, in parts(mirror))
+    sync(monkeypatch, second)
+    assert mirror.page(key, TTL) == second
+    assert all(part >= 0 for part, in parts(mirror))
+
+
+def test_pages_without_sync_time_are_not_served(mirror):
+    key = server._cache_key(PATH, {'limit': 1})
+    mirror._conn().execute('INSERT INTO pages VALUES (?, ?, ?)',
+                           (server.DiskCache.digest(key), 'hotels', server.zlib.compress(b'{"legacy": true}')))
+    assert mirror.page(key, TTL) is None
+
+
+def age(mirror, seconds):
+    mirror._conn().execute('UPDATE page_parts SET synced_at = synced_at - ?', (seconds,))
+
+
+def test_page_of_last_completed_sync_outlives_ttl(monkeypatch, mirror):
+    data = body(50)
+    sync(monkeypatch, data)
+    key = server._cache_key(PATH, {'limit': 500})
+    age(mirror, 2 * TTL)
+    assert mirror.page(key, TTL) is None
+    mirror._conn().execute('UPDATE sync_state SET started_at = ?, completed_at = ?',
+                           (server.datetime.fromtimestamp(server.time.time() - 3 * TTL, server.timezone.utc).isoformat(),
+                            server._utcnow()))
+    assert mirror.page(key, TTL) == data
+
+
+def test_page_older_than_last_completed_sync_ages_out(monkeypatch, mirror):
+    sync(monkeypatch, body(50))
+    key = server._cache_key(PATH, {'limit': 500})
+    age(mirror, TTL - 60)
+    mirror.start('hotels', server._utcnow(), server._utcnow())
+    mirror.complete('hotels')
+    assert mirror.page(key, TTL) is not None
+    age(mirror, 120)
+    assert mirror.page(key, TTL) is None
+
+
+def test_error_answer_fails_the_sync(monkeypatch, mirror):
+    error = json.dumps({'getSharedBOF2.Downloads.Hotel.Hotels': {'error': {'status': 'Invalid API key'}}}).encode()
+    with pytest.raises(ValueError, match='no collection'):
+        sync(monkeypatch, error)
+    key = server._cache_key(PATH, {'limit': 500})
+    assert mirror.page(key, TTL) is None
+    assert mirror.state('hotels')['pages'] == 0
+
+
+def test_error_answer_leaves_dataset_incomplete(monkeypatch, mirror):
+    error = json.dumps({'getSharedBOF2.Downloads.Hotel.Hotels': {'results': {'status': 'Failure'}}}).encode()
+
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=error))
+        monkeypatch.setattr(server, '_client', httpx.AsyncClient(transport=transport))
+        monkeypatch.setattr(server, '_client_loop', asyncio.get_running_loop())
+        monkeypatch.setattr(server, '_semaphore', asyncio.Semaphore(8))
+        return await server.sync_dataset('hotels')
+
+    with pytest.raises(ValueError, match="'status': 'Failure'"):
+        asyncio.run(run())
+    assert mirror.state('hotels')['completed_at'] is None
@@ -0,0 +1,42 @@
+import asyncio
+import types
+
+import pytest
+from fastmcp import Client
+from fastmcp.exceptions import ToolError
+
+import server
+
+
+def test_schema_validation_hook_found():
+    assert server.schema_validation_skipped
+
+
+def test_schema_validation_kept_without_hook():
+    calls = []
+    assert not server._skip_schema_validation(types.SimpleNamespace())
+    old_style = types.SimpleNamespace(call_tool=lambda: calls.append('registered'))
+    assert not server._skip_schema_validation(types.SimpleNamespace(_mcp_server=old_style, _mcp_call_tool=object()))
+    assert calls == []
+
+
+def test_tools_still_reject_bad_arguments():
+    async def run():
+        async with Client(server.mcp) as client:
+            await client.call_tool('flight_price_calendar', {'location_departure': 'JFK', 'location_arrival': 'LAX',
+                                                             'date_from': '2026-11-01', 'date_to': '2026-11-02',
+                                                             'itinerary_type': 'MULTI_CITY'})
+
+    with pytest.raises(ToolError):
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize('points, message', [([[40.6, -73.8], [1.0]], 'at least 2'), ([[1, 2, 3]], 'at most 2'),
+                                             ([[40.6, -73.8], [95, 0]], r'points\[1\]'), ([[0, 200]], r'points\[0\]')])
+def test_nearby_places_rejects_bad_points(points, message):
+    async def run():
+        async with Client(server.mcp) as client:
+            await client.call_tool('nearby_places', {'points': points})
+
+    with pytest.raises(ToolError, match=message):
+        asyncio.run(run())
@@ -0,0 +1,23 @@
+import types
+
+import server
+
+PATH, PAYLOAD = '/v1/hotels/search', {'location_id': '3000', 'sort_order': 'PRICE'}
+
+
+def test_warm_hit_rate_counts_only_refreshed_entries(monkeypatch):
+    monkeypatch.setattr(server, 'warm_min_calls', 1)
+    warmer = server.Warmer(16)
+    warmer.task = types.SimpleNamespace(done=lambda: False)  # no refresh loop in this test
+    key = server._cache_key(PATH, PAYLOAD)
+    server.response_cache.clear()
+    warmer.record(PATH, PAYLOAD)  # not hot yet
+    warmer.record(PATH, PAYLOAD)  # hot, nothing cached
+    server.response_cache.put(key, {'hotels': []}, 16, 60)
+    warmer.record(PATH, PAYLOAD)  # fresh, stored by an interactive miss
+    warmer.warmed[key] = server.response_cache.entries[key][0]
+    warmer.record(PATH, PAYLOAD)  # fresh, stored by a refresh
+    snapshot = warmer.snapshot()
+    assert (snapshot['hot_calls'], snapshot['hot_hits'], snapshot['warm_hits']) == (3, 2, 1)
+    assert snapshot['hot_hit_rate'] == round(2 / 3, 4)
+    assert snapshot['warm_hit_rate'] == round(1 / 3, 4)